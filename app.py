@@ -1,27 +1,30 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import joblib
 import os
+from simulation import (
+    PIT_LANE_TIMES, GLOBAL_YELLOW_PIT_COST, get_prediction, simulate_caution_scenarios,
+    simulate_battle_scenarios, optimize_pit_window, solve_pit_strategy, prediction_band
+)
+from degradation_surface import MAX_SURFACE_ERROR, load_or_build_surface
+from model_registry import load_or_register, load_metadata
+from monte_carlo import monte_carlo_caution, monte_carlo_battle
+from field_simulation import build_field_snapshot, simulate_field
+from historical_analysis import SECTORS, degradation_overview_figure, sector_figure, season_figure, season_degradation_rates
+from degradation_rates import load_or_build_rates
+from live_ingest import HOST as LIVE_HOST, PORT as LIVE_PORT, fetch_snapshot
+
+# Seconds to wait for the live ingest server before reporting it unavailable
+LIVE_TIMEOUT = 1.0
 
 # --- Page Configuration ---
 st.set_page_config(layout="wide", page_title="Toyota GR Digital Pit Wall", page_icon="🏁")
 
-# --- Calibration Constants ---
-# Time lost in pit lane (excluding tire change time)
-PIT_LANE_TIMES = {
-    'Barber': 34.0, 'COTA': 36.0, 'Indianapolis': 63.0, 'RoadAmerica': 52.0,
-    'Sebring': 39.0, 'Sonoma': 45.0, 'VIR': 25.0
-}
-# Estimated time lost under Full Course Yellow (FCY)
-GLOBAL_YELLOW_PIT_COST = 20.0 
-
 # --- Loading Functions (Cached) ---
 @st.cache_resource
 def load_model(track_name):
-    model_path = f'processed_data/{track_name}/FINAL_model.pkl'
-    if not os.path.exists(model_path): return None
-    try: return joblib.load(model_path)
+    """The track's registered flat forest, memory-mapped (registered from FINAL_model.pkl on first use)."""
+    try: return load_or_register(track_name)
     except Exception: return None
 
 @st.cache_data
@@ -33,63 +36,41 @@ def load_data(track_name):
         return pd.concat([df_r1[common_cols], df_r2[common_cols]])
     except FileNotFoundError: return None
 
-# --- Simulation Logic Functions ---
-
-def get_prediction_dataframe(model, laps, temp, aggressiveness):
-    """Creates the input DataFrame for the model with correct feature names."""
-    features = model.feature_names_in_
-    data = {}
-    if 'Laps_on_this_Tireset' in features: data['Laps_on_this_Tireset'] = [laps]
-    if 'TRACK_TEMP' in features: data['TRACK_TEMP'] = [temp]
-    if 'avg_aggressiveness' in features: data['avg_aggressiveness'] = [aggressiveness]
-    return pd.DataFrame(data, columns=features)
-
-def get_prediction(model, laps, temp, aggressiveness):
-    """Returns the predicted LAP_DELTA for a specific lap."""
-    pred_df = get_prediction_dataframe(model, laps, temp, aggressiveness)
-    return model.predict(pred_df)[0]
-
-def simulate_race_remaining(model, current_tire_laps, laps_remaining, track_temp, driver_aggression, pit_now, green_pit_lap, green_pit_cost, yellow_pit_cost):
-    """
-    Simulates the total time lost (delta) for the remainder of the race.
-    """
-    total_delta = 0.0
-    current_laps = current_tire_laps
-    
-    # Logic: If we pit now, we pit on relative lap 1. 
-    # If we stay out, we pit on the target green flag lap.
-    target_pit_lap = 1 if pit_now else green_pit_lap
-    actual_pit_cost = yellow_pit_cost if pit_now else green_pit_cost
-
-    for i in range(1, laps_remaining + 1):
-        if i == target_pit_lap:
-            total_delta += actual_pit_cost
-            current_laps = 1 # Reset tires
-        else:
-            current_laps += 1 # Tires get older
-        
-        # Add the degradation penalty for this lap
-        total_delta += get_prediction(model, current_laps, track_temp, driver_aggression)
-        
-    return total_delta
-
-def simulate_pit_battle(model, initial_tire_laps, track_temp, driver_aggression, pit_lap, green_pit_cost, cycle_laps=3):
-    """
-    Simulates a 3-lap battle (Undercut/Overcut) to calculate total time.
-    """
-    total_time = 0.0
-    current_laps = initial_tire_laps
-    
-    for i in range(1, cycle_laps + 1):
-        if i == pit_lap:
-            total_time += green_pit_cost
-            current_laps = 1 # Tires reset
-        else:
-            current_laps += 1
-            
-        total_time += get_prediction(model, current_laps, track_temp, driver_aggression)
-        
-    return total_time
+@st.cache_data
+def load_race_data(track_name, race):
+    try: return pd.read_parquet(f'processed_data/{track_name}/{race}_processed.parquet')
+    except FileNotFoundError: return None
+
+# Historical Analysis figures: built once per (track, driver), not on every rerun
+@st.cache_resource
+def load_rates(track_name):
+    """Per driver x stint x sector degradation rates (built from the processed races on first use)."""
+    try: return load_or_build_rates(track_name)
+    except Exception: return None
+
+@st.cache_data
+def overview_figure(track_name, color_var):
+    return degradation_overview_figure(load_data(track_name), track_name, color_var)
+
+@st.cache_data
+def driver_sector_figures(track_name, driver):
+    df = load_data(track_name)
+    df_driver = df[df['NUMBER'] == driver]
+    trendlines = load_rates(track_name).trendlines()
+    return [sector_figure(df_driver, sector, trendlines, driver) for sector in SECTORS]
+
+@st.cache_data
+def load_season(tracks):
+    data = {track: load_data(track) for track in tracks}
+    return season_figure(data), season_degradation_rates(data)
+
+@st.cache_resource
+def load_surface(track_name):
+    """Precomputed degradation surface (built on first use from FINAL_model.pkl, a chunk of cells at a time)."""
+    model, df = load_model(track_name), load_data(track_name)
+    if model is None or df is None: return None
+    try: return load_or_build_surface(track_name, model, df)
+    except Exception: return None
 
 # ==============================================================================
 # USER INTERFACE (FRONTEND)
@@ -120,6 +101,10 @@ with st.sidebar:
         st.metric("Pit Lane Loss (Green)", f"{pit_loss} sec")
         st.caption(f"Based on official track maps for {selected_track}.")
 
+        st.markdown("---")
+        st.markdown("### 🧠 Prediction Engine")
+        engine = st.radio("Degradation model:", ["Lookup Surface (fast)", "Random Forest (live)"], key="engine")
+
 # --- MAIN BODY ---
 st.title("🏁 Toyota GR Digital Pit Wall")
 st.markdown(f"**Active Circuit:** {selected_track}")
@@ -132,6 +117,38 @@ if selected_track:
         st.error("Error loading model or data. Please verify processing.")
     else:
         MODEL_FEATURES = model.feature_names_in_
+
+        model_info = load_metadata(selected_track) or {}
+        with st.sidebar:
+            metrics = model_info.get('metrics') or {}
+            if 'holdout_mae' in metrics or 'selection_mae' in metrics:
+                scores = []
+                if 'holdout_mae' in metrics:
+                    scores.append(f"held-out MAE {metrics['holdout_mae']:.3f}s (other race, default parameters), R2 {metrics['holdout_r2']:.3f}")
+                if 'selection_mae' in metrics:
+                    scores.append(f"selection score {metrics['selection_mae']:.3f}s (best held-out MAE of the tuning candidates)")
+                st.caption(f"Model: {model_info.get('n_trees')} trees on {model_info.get('training_rows')} laps, "
+                           f"{'; '.join(scores)} (trained {model_info.get('created_utc', '?')[:10]})")
+            elif 'r2' in metrics:
+                st.caption(f"Model: {model_info.get('n_trees')} trees on {model_info.get('training_rows')} laps, "
+                           f"R2 {metrics['r2']:.3f}, MAE {metrics['mae']:.3f}s (trained {model_info.get('created_utc', '?')[:10]})")
+
+        # The lookup surface is a piecewise-constant table of the forest: exact unless it had to be
+        # thinned, so it only replaces the forest when its measured max error is within tolerance
+        predictor = model
+        if engine.startswith("Lookup"):
+            with st.spinner("Preparing degradation lookup surface..."):
+                surface = load_surface(selected_track)
+            if surface is not None:
+                surface_error = (f"max {surface.error_stats.get('max_abs_error', float('nan')):.3f}s, "
+                                 f"mean {surface.error_stats.get('mean_abs_error', float('nan')):.3f}s")
+                with st.sidebar:
+                    if surface.within_tolerance():
+                        predictor = surface
+                        st.caption(f"Surface error vs forest: {surface_error}")
+                    else:
+                        st.warning(f"Lookup surface too coarse for {selected_track} ({surface_error} vs forest, "
+                                   f"tolerance {MAX_SURFACE_ERROR}s): using the Random Forest.")
         
         # --- MAIN TABS ---
         tab_sim, tab_analisis, tab_info = st.tabs(["🏁 Strategy Simulator", "📉 Historical Analysis", "ℹ️ Methodology"])
@@ -169,7 +186,7 @@ if selected_track:
                     sim_agg = 0
 
             # Immediate Prediction
-            delta = get_prediction(model, sim_laps + 1, sim_temp, sim_agg)
+            delta = get_prediction(predictor, sim_laps + 1, sim_temp, sim_agg)
             st.markdown("---")
             col_metric1, col_metric2 = st.columns([1, 3])
             with col_metric1:
@@ -199,9 +216,9 @@ if selected_track:
                     if st.button("Simulate Caution Strategy", use_container_width=True):
                         track_pit_loss = PIT_LANE_TIMES.get(selected_track, 36.0)
                         
-                        # Calculate both scenarios
-                        t_now = simulate_race_remaining(model, sim_laps, caution_laps, sim_temp, sim_agg, True, pit_target, track_pit_loss, GLOBAL_YELLOW_PIT_COST)
-                        t_later = simulate_race_remaining(model, sim_laps, caution_laps, sim_temp, sim_agg, False, pit_target, track_pit_loss, GLOBAL_YELLOW_PIT_COST)
+                        # Calculate both scenarios (one batched prediction)
+                        result = simulate_caution_scenarios(predictor, sim_laps, caution_laps, sim_temp, sim_agg, pit_target, track_pit_loss, GLOBAL_YELLOW_PIT_COST)
+                        t_now, t_later = result.totals
                         
                         diff = t_later - t_now
                         if diff > 0:
@@ -209,6 +226,27 @@ if selected_track:
                         else:
                             st.error(f"**VERDICT: STAY OUT.** Pitting costs **{abs(diff):.2f}s**")
 
+                        # Spread of the same difference across the forest's individual trees
+                        trees = simulate_caution_scenarios(model, sim_laps, caution_laps, sim_temp, sim_agg, pit_target, track_pit_loss, GLOBAL_YELLOW_PIT_COST, per_tree=True).tree_totals
+                        low, high = prediction_band(trees[:, 1] - trees[:, 0])
+                        st.caption(f"90% confidence band on the saving: {low:.2f}s to {high:.2f}s")
+
+                    window_tol = st.number_input("Window tolerance (s from optimal)", 0.1, 10.0, 1.0, step=0.1)
+                    if st.button("Optimize Pit Window", use_container_width=True):
+                        track_pit_loss = PIT_LANE_TIMES.get(selected_track, 36.0)
+                        window = optimize_pit_window(predictor, sim_laps, caution_laps, sim_temp, sim_agg, track_pit_loss, GLOBAL_YELLOW_PIT_COST, window_tol)
+
+                        st.success(f"**OPTIMAL STOP: lap {window.optimal_lap}** (total loss {window.optimal_loss:.2f}s). "
+                                   f"Window laps {window.window_start}-{window.window_end} ({window.window_width} laps within {window_tol:.1f}s).")
+                        if window.no_stop_loss < window.optimal_loss:
+                            st.warning(f"Staying out to the flag is cheaper: {window.no_stop_loss:.2f}s total loss.")
+                        fig_window = px.line(
+                            x=window.pit_laps, y=window.time_loss, markers=True,
+                            labels={'x': 'Pit on lap #', 'y': 'Total Time Loss (s)'}
+                        )
+                        fig_window.add_vrect(x0=window.window_start - 0.5, x1=window.window_end + 0.5, fillcolor="green", opacity=0.15, line_width=0)
+                        st.plotly_chart(fig_window, use_container_width=True)
+
             # --- Tool B: Undercut ---
             with col_tool2:
                 with st.container(border=True):
@@ -222,26 +260,165 @@ if selected_track:
                     track_pit_loss = PIT_LANE_TIMES.get(selected_track, 36.0)
 
                     if col_btn_u.button("Simulate Undercut", use_container_width=True):
-                        my_time = simulate_pit_battle(model, sim_laps, sim_temp, sim_agg, 1, track_pit_loss)
-                        rival_time = simulate_pit_battle(model, rival_laps, sim_temp, sim_agg, 2, track_pit_loss)
+                        my_time, rival_time = simulate_battle_scenarios(predictor, sim_laps, rival_laps, sim_temp, sim_agg, 1, 2, track_pit_loss).totals
                         net_gain = rival_time - my_time
                         
                         if net_gain > gap:
                             st.success(f"**SUCCESS!** You gain position by **{net_gain - gap:.2f}s**")
                         else:
                             st.error(f"**FAIL.** You miss by **{gap - net_gain:.2f}s**")
+                        trees = simulate_battle_scenarios(model, sim_laps, rival_laps, sim_temp, sim_agg, 1, 2, track_pit_loss, per_tree=True).tree_totals
+                        low, high = prediction_band(trees[:, 1] - trees[:, 0])
+                        st.caption(f"90% confidence band on the net gain: {low:.2f}s to {high:.2f}s (gap {gap:.1f}s)")
                             
                     if col_btn_o.button("Simulate Overcut", use_container_width=True):
-                        my_time = simulate_pit_battle(model, sim_laps, sim_temp, sim_agg, 2, track_pit_loss)
-                        rival_time = simulate_pit_battle(model, rival_laps, sim_temp, sim_agg, 1, track_pit_loss)
+                        my_time, rival_time = simulate_battle_scenarios(predictor, sim_laps, rival_laps, sim_temp, sim_agg, 2, 1, track_pit_loss).totals
                         net_gain = rival_time - my_time
                         
                         st.metric("Net Gain", f"{net_gain:.2f}s")
+                        trees = simulate_battle_scenarios(model, sim_laps, rival_laps, sim_temp, sim_agg, 2, 1, track_pit_loss, per_tree=True).tree_totals
+                        low, high = prediction_band(trees[:, 1] - trees[:, 0])
+                        st.caption(f"90% confidence band on the net gain: {low:.2f}s to {high:.2f}s")
                         if net_gain > gap:
                             st.success(f"**SUCCESS!** You gain position.")
                         else:
                             st.error(f"**FAIL.** Not enough pace.")
 
+            # --- Tool C: Multi-Stop Strategy ---
+            with st.container(border=True):
+                st.markdown("### Multi-Stop Strategy Solver")
+                st.caption("Exact best stop plan for the remaining distance, including expected cautions.")
+
+                col_ms1, col_ms2, col_ms3 = st.columns(3)
+                ms_laps = col_ms1.number_input("Laps Remaining ", 1, 80, 30, key="ms_laps")
+                ms_stops = col_ms2.number_input("Max Stops", 0, 4, 2, key="ms_stops")
+                ms_plans = col_ms3.number_input("Plans to Show", 1, 10, 5, key="ms_plans")
+                ms_cautions = st.multiselect("Caution laps (relative)", list(range(1, ms_laps + 1)), key="ms_cautions")
+
+                if st.button("Solve Strategy", use_container_width=True):
+                    track_pit_loss = PIT_LANE_TIMES.get(selected_track, 36.0)
+                    plans = solve_pit_strategy(
+                        predictor, sim_laps, ms_laps, sim_temp, sim_agg, track_pit_loss,
+                        GLOBAL_YELLOW_PIT_COST, ms_cautions, ms_stops, ms_plans
+                    )
+                    best = plans[0]
+                    stops_txt = ", ".join(str(p) for p in best.pit_laps) if best.pit_laps else "no stop"
+                    st.success(f"**BEST PLAN:** pit on lap(s) {stops_txt} — total loss **{best.total_loss:.2f}s**")
+                    st.dataframe(pd.DataFrame({
+                        'Rank': range(1, len(plans) + 1),
+                        'Pit Laps': [", ".join(str(p) for p in plan.pit_laps) or "-" for plan in plans],
+                        'Stops': [len(plan.pit_laps) for plan in plans],
+                        'Total Loss (s)': [round(plan.total_loss, 2) for plan in plans],
+                        'Gap to Best (s)': [round(plan.total_loss - best.total_loss, 2) for plan in plans],
+                    }), hide_index=True, use_container_width=True)
+
+            # --- Tool D: Monte Carlo Risk ---
+            with st.expander("🎲 Monte Carlo Risk Analysis"):
+                st.caption("Samples thousands of race futures (caution timing, track temp drift, rival tire age, gap changes) "
+                           "for the Caution and Battle scenarios above.")
+                col_mc1, col_mc2, col_mc3 = st.columns(3)
+                mc_samples = col_mc1.number_input("Samples", 1000, 50000, 10000, step=1000)
+                mc_seed = col_mc1.number_input("Seed", 0, 10**6, 42)
+                mc_caution_rate = col_mc2.slider("Caution chance per lap", 0.0, 0.2, 0.04, 0.01)
+                mc_temp_sd = col_mc2.slider("Temp drift per lap (°C)", 0.0, 1.0, 0.15, 0.05)
+                mc_rival_sd = col_mc3.slider("Rival tire age uncertainty (laps)", 0.0, 5.0, 2.0, 0.5)
+                mc_gap_sd = col_mc3.slider("Gap noise per lap (s)", 0.0, 1.0, 0.3, 0.05)
+
+                col_mcb1, col_mcb2 = st.columns(2)
+                mc_result, mc_label = None, None
+                if col_mcb1.button("Run Caution Monte Carlo", use_container_width=True):
+                    track_pit_loss = PIT_LANE_TIMES.get(selected_track, 36.0)
+                    mc_result = monte_carlo_caution(
+                        predictor, sim_laps, caution_laps, sim_temp, sim_agg, pit_target, track_pit_loss, GLOBAL_YELLOW_PIT_COST,
+                        n_samples=mc_samples, seed=mc_seed, caution_rate=mc_caution_rate, temp_drift_sd=mc_temp_sd
+                    )
+                    mc_label = "P(Pit Now is better)"
+                if col_mcb2.button("Run Undercut Monte Carlo", use_container_width=True):
+                    track_pit_loss = PIT_LANE_TIMES.get(selected_track, 36.0)
+                    mc_result = monte_carlo_battle(
+                        predictor, sim_laps, rival_laps, gap, sim_temp, sim_agg, 1, 2, track_pit_loss,
+                        n_samples=mc_samples, seed=mc_seed, rival_age_sd=mc_rival_sd, gap_sd_per_lap=mc_gap_sd, temp_drift_sd=mc_temp_sd
+                    )
+                    mc_label = "P(Undercut succeeds)"
+
+                if mc_result is not None:
+                    col_mcr1, col_mcr2 = st.columns([1, 3])
+                    col_mcr1.metric(mc_label, f"{mc_result.success_probability:.1%}")
+                    col_mcr1.caption(f"Median margin {mc_result.percentiles[50]:.2f}s (90% range {mc_result.percentiles[5]:.2f}s to {mc_result.percentiles[95]:.2f}s)")
+                    col_mcr2.plotly_chart(px.histogram(
+                        x=mc_result.time_diffs, nbins=60, labels={'x': 'Margin (s, > 0 = call works)'}
+                    ), use_container_width=True)
+
+            # --- Tool E: Whole Field ---
+            with st.expander("🏎️ Field Simulator (Running Order)"):
+                st.caption("Projects every car's position over the next laps from a real race snapshot, for a given pit call.")
+                col_fs1, col_fs2, col_fs3 = st.columns(3)
+                fs_race = col_fs1.selectbox("Race", ["R1", "R2"], key="fs_race")
+                df_race = load_race_data(selected_track, fs_race)
+                if df_race is None or df_race.empty:
+                    st.warning("Race data not available.")
+                else:
+                    max_lap = int(df_race['LAP_NUMBER'].max())
+                    fs_lap = col_fs1.slider("Snapshot at lap", 1, max(max_lap, 2), max(1, max_lap // 2), key="fs_lap")
+                    snapshot = build_field_snapshot(df_race, fs_lap)
+                    if snapshot.empty:
+                        st.warning("No cars running at that lap.")
+                    else:
+                        fs_car = col_fs2.selectbox("Our Car", snapshot['NUMBER'].tolist(), key="fs_car")
+                        fs_pit = col_fs2.number_input("Our pit lap (0 = stay out)", 0, 40, 1, key="fs_pit")
+                        fs_horizon = col_fs3.number_input("Laps to project", 1, 40, 10, key="fs_horizon")
+                        fs_rivals_pit = col_fs3.checkbox("Rivals pit on the same lap", key="fs_rivals")
+
+                        pit_calls = {car: fs_pit for car in snapshot['NUMBER']} if fs_rivals_pit else {fs_car: fs_pit}
+                        projection = simulate_field(predictor, snapshot, fs_horizon, sim_temp, pit_calls, PIT_LANE_TIMES.get(selected_track, 36.0))
+                        ours = projection.summary[projection.summary['NUMBER'] == fs_car].iloc[0]
+                        st.metric(f"Car #{fs_car} after {fs_horizon} laps", f"P{ours['FINAL_POS']}", int(ours['POS_CHANGE']))
+
+                        positions = pd.DataFrame(projection.positions, index=projection.cars, columns=range(1, fs_horizon + 1))
+                        positions = positions.reset_index().melt(id_vars='index', var_name='Lap', value_name='Position').rename(columns={'index': 'Car'})
+                        fig_field = px.line(positions, x='Lap', y='Position', color='Car')
+                        fig_field.update_yaxes(autorange='reversed')
+                        st.plotly_chart(fig_field, use_container_width=True)
+                        summary = projection.summary
+                        rates = load_rates(selected_track)
+                        if rates is not None:
+                            # Each car's historical LAP_DELTA slope over this race, straight from the rate table
+                            summary = summary.assign(DEG_RATE=[rates.rate(car, 'LAP', fs_race) for car in summary['NUMBER']])
+                        st.dataframe(summary.round(2), hide_index=True, use_container_width=True)
+
+            # --- Tool F: Live Feed ---
+            with st.expander("📡 Live Feed (Ingest Server)"):
+                st.caption("Latest lap of every car from a running `live_ingest.py serve`, with the predicted loss on its next lap.")
+                col_lv1, col_lv2 = st.columns([3, 1])
+                live_address = col_lv1.text_input("Server (host:port)", f"{LIVE_HOST}:{LIVE_PORT}", key="live_address")
+                live_on = col_lv2.checkbox("Connect", key="live_on")
+                if live_on:
+                    live_host, _, live_port = live_address.rpartition(':')
+                    try:
+                        live = fetch_snapshot(None, 0, live_host or LIVE_HOST, int(live_port), timeout=LIVE_TIMEOUT)
+                    except (OSError, ValueError):
+                        live = None
+                    if live is None or 'error' in live:
+                        st.info(f"No live ingest server answering at {live_address}. Start one with `python live_ingest.py serve`.")
+                    elif not live['cars']:
+                        st.info("Connected - no laps received yet.")
+                    else:
+                        rows = []
+                        for car, buffers in live['cars'].items():
+                            laps = buffers['laps']
+                            if not laps['LAP_NUMBER']: continue
+                            last = {name: values[-1] for name, values in laps.items()}
+                            pred = get_prediction(predictor, last['Laps_on_this_Tireset'] + 1, last['TRACK_TEMP'], sim_agg)
+                            rows.append({'NUMBER': car, **last, 'PRED_NEXT_DELTA': pred})
+                        counts = live['counts']
+                        st.caption(f"{counts['laps']} laps, {counts['weather']} weather readings, {counts['samples']:,} samples, "
+                                   f"{counts['bad']} bad messages received")
+                        if rows:
+                            live_df = pd.DataFrame(rows).sort_values('LAP_NUMBER', ascending=False)
+                            st.dataframe(live_df[['NUMBER', 'LAP_NUMBER', 'LAP_TIME_SEC', 'LAP_DELTA', 'STINT_ID',
+                                                  'Laps_on_this_Tireset', 'TRACK_TEMP', 'PRED_NEXT_DELTA']].round(3),
+                                         hide_index=True, use_container_width=True)
+
         # ----------------------------------------------------------------------
         # TAB 2: HISTORICAL ANALYSIS
         # ----------------------------------------------------------------------
@@ -252,17 +429,7 @@ if selected_track:
             if 'avg_aggressiveness' in MODEL_FEATURES: color_var = 'avg_aggressiveness'
             elif 'TRACK_TEMP' in MODEL_FEATURES: color_var = 'TRACK_TEMP'
             
-            fig_main = px.scatter(
-                df, x='Laps_on_this_Tireset', y='LAP_DELTA', color=color_var,
-                title=f'Tire Degradation Overview ({selected_track})',
-                labels={
-                    'Laps_on_this_Tireset': 'Tire Age (Laps)', 
-                    'LAP_DELTA': 'Time Loss (s)', 
-                    'avg_aggressiveness': 'Driver Aggression (Lat-G)', 
-                    'TRACK_TEMP': 'Track Temp (°C)'
-                }
-            )
-            st.plotly_chart(fig_main, use_container_width=True)
+            st.plotly_chart(overview_figure(selected_track, color_var), use_container_width=True)
             
             # Sector Analysis
             if 'S1_DELTA' in df.columns:
@@ -273,27 +440,31 @@ if selected_track:
                 drivers = sorted(df['NUMBER'].unique())
                 sel_driver = st.selectbox("Filter by Driver:", drivers, index=0)
                 
-                df_driver = df[df['NUMBER'] == sel_driver]
-                
-                sc1, sc2, sc3 = st.columns(3)
-                with sc1:
-                    st.markdown("**Sector 1**")
-                    st.plotly_chart(px.scatter(
-                        df_driver, x='Laps_on_this_Tireset', y='S1_DELTA', trendline='ols',
-                        labels={'Laps_on_this_Tireset': 'Laps', 'S1_DELTA': 'Delta S1 (s)'}
-                    ), use_container_width=True)
-                with sc2:
-                    st.markdown("**Sector 2**")
-                    st.plotly_chart(px.scatter(
-                        df_driver, x='Laps_on_this_Tireset', y='S2_DELTA', trendline='ols',
-                        labels={'Laps_on_this_Tireset': 'Laps', 'S2_DELTA': 'Delta S2 (s)'}
-                    ), use_container_width=True)
-                with sc3:
-                    st.markdown("**Sector 3**")
-                    st.plotly_chart(px.scatter(
-                        df_driver, x='Laps_on_this_Tireset', y='S3_DELTA', trendline='ols',
-                        labels={'Laps_on_this_Tireset': 'Laps', 'S3_DELTA': 'Delta S3 (s)'}
-                    ), use_container_width=True)
+                rates = load_rates(selected_track)
+                if rates is None:
+                    st.warning("Degradation rates not available.")
+                else:
+                    sector_figs = driver_sector_figures(selected_track, sel_driver)
+                    for col, sector, fig in zip(st.columns(3), SECTORS, sector_figs):
+                        with col:
+                            st.markdown(f"**Sector {sector[1:]}**")
+                            st.plotly_chart(fig, use_container_width=True)
+                            fit = rates.fit(sel_driver, sector)
+                            if fit is not None and pd.notna(fit['slope']):
+                                st.caption(f"Trend: {fit['slope']:+.3f} s/lap (R2 {fit['r2']:.2f}, {int(fit['n'])} laps)")
+                    st.markdown("**Degradation rate by stint (s per lap of tire age)**")
+                    st.dataframe(rates.driver_stints(sel_driver).round(4), use_container_width=True)
+
+            # Season View (all tracks, aggregated per tire age)
+            st.markdown("---")
+            st.subheader("🗓️ Season View")
+            if st.checkbox("Compare all tracks", key="season_view"):
+                fig_season, season_rates = load_season(tuple(processed_tracks))
+                st.plotly_chart(fig_season, use_container_width=True)
+                st.dataframe(
+                    season_rates.rename(columns={'slope': 'Degradation (s/lap)', 'intercept': 'Fresh-tire delta (s)', 'r2': 'R2', 'n': 'Laps'}),
+                    use_container_width=True
+                )
 
         # ----------------------------------------------------------------------
         # TAB 3: METHODOLOGY
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forest_engine import FlatForest
+from simulation import get_prediction
+
+# ===================================================================
+# --- FLAT FOREST ENGINE BENCHMARK ---
+# Trains a forest like train_final_model.py on synthetic laps (tire age,
+# TRACK_TEMP, avg_aggressiveness), checks that FlatForest reproduces
+# sklearn's predict bit for bit (training rows, random rows and rows
+# sitting exactly on split thresholds), then compares single-row latency
+# and batch throughput.
+# Usage: python benchmarks/bench_forest_engine.py [--rows 800] [--trees 100] [--batches 30 300 3000]
+# ===================================================================
+
+FEATURES = ['Laps_on_this_Tireset', 'TRACK_TEMP', 'avg_aggressiveness']
+
+
+def make_training_data(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        'Laps_on_this_Tireset': rng.integers(1, 30, n_rows).astype(float),
+        'TRACK_TEMP': rng.choice(np.round(rng.uniform(25, 45, 40), 1), n_rows),
+        'avg_aggressiveness': rng.gamma(4.0, 0.3, n_rows),
+    })
+    y = 0.05 * X['Laps_on_this_Tireset'] * (1 + 0.02 * (X['TRACK_TEMP'] - 35)) + 0.3 * X['avg_aggressiveness'] + rng.normal(0, 0.4, n_rows)
+    return X, y
+
+def check_rows(X, forest, n_random, seed=0):
+    """Training rows, random in-range rows, and rows on (and just above) every split threshold."""
+    rng = np.random.default_rng(seed)
+    lows, highs = X.min(axis=0), X.max(axis=0)
+    random_rows = lows + rng.random((n_random, X.shape[1])) * (highs - lows)
+    internal = np.arange(forest.n_internal)
+    on_split = np.tile(np.median(X, axis=0), (len(internal), 1))
+    on_split[internal, forest.feature[internal]] = forest.threshold[internal]
+    above_split = on_split.copy()
+    above_split[internal, forest.feature[internal]] = np.nextafter(forest.threshold[internal].astype(np.float32), np.float32(np.inf))
+    return np.vstack([X, random_rows, on_split, above_split])
+
+def median_seconds(fn, min_seconds=0.5):
+    fn()
+    times, start = [], time.perf_counter()
+    while time.perf_counter() - start < min_seconds or len(times) < 5:
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the flat forest engine against sklearn.")
+    parser.add_argument('--rows', type=int, default=800, help="Training laps (a track's two races: 600-1100 on the real data)")
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--batches', type=int, nargs='+', default=[30, 300, 3000])
+    parser.add_argument('--check-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    X, y = make_training_data(args.rows)
+    print(f"Training {args.trees} trees on {args.rows} rows...")
+    model = RandomForestRegressor(n_estimators=args.trees, random_state=42, n_jobs=1).fit(X, y)
+    start = time.perf_counter()
+    forest = FlatForest.from_model(model)
+    print(f"Flattened {len(forest.value):,} nodes (max depth {forest.max_depth}) in {time.perf_counter() - start:.3f}s")
+
+    check = check_rows(X.to_numpy(), forest, args.check_rows)
+    sklearn_preds = model.predict(pd.DataFrame(check, columns=FEATURES))
+    mismatches = np.count_nonzero(forest.predict(check) != sklearn_preds)
+    print(f"Exact match on {len(check):,} rows: {'yes' if mismatches == 0 else f'NO ({mismatches} differ)'}")
+
+    row = X.iloc[[0]]
+    one = row.to_numpy()
+    print("---")
+    print(f"{'single row':<28}{'median us':>12}")
+    for label, fn in [
+        ('sklearn predict', lambda: model.predict(row)),
+        ('FlatForest.predict', lambda: forest.predict(one)),
+        ('simulation.get_prediction', lambda: get_prediction(model, 10, 35.0, 1.2)),
+    ]:
+        print(f"{label:<28}{median_seconds(fn) * 1e6:>12.1f}")
+
+    print("---")
+    print(f"{'batch rows':<12}{'sklearn rows/s':>16}{'flat rows/s':>14}{'speedup':>9}")
+    rng = np.random.default_rng(1)
+    for n in args.batches:
+        batch = check[rng.integers(0, len(check), n)]
+        batch_df = pd.DataFrame(batch, columns=FEATURES)
+        sk = median_seconds(lambda: model.predict(batch_df))
+        flat = median_seconds(lambda: forest.predict(batch))
+        print(f"{n:<12}{n / sk:>16,.0f}{n / flat:>14,.0f}{sk / flat:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
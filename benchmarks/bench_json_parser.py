@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import process_telemetry as pt
+
+# ===================================================================
+# --- JSON TELEMETRY PARSER BENCHMARK ---
+# Synthetic Sebring-style JSON telemetry (one list of channels per row)
+# vs. the row-by-row json.loads parser and the LONG-format path, extracting
+# every channel configured in process_telemetry.TELEMETRY_CHANNELS.
+# Usage: python benchmarks/bench_json_parser.py [--rows 200000] [--repeat 3]
+# ===================================================================
+
+CHANNELS = ['speed', 'accx_can', 'accy_can', 'aps', 'pbrake_f', 'gear', 'nmot', 'Steering_Angle']
+CARS = [2, 7, 13, 21, 55, 88]
+
+
+def make_json_csv(path, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    car = rng.choice(CARS, n_rows)
+    values = rng.normal(0.0, 1.0, (n_rows, len(CHANNELS))).round(5)
+    present = rng.random((n_rows, len(CHANNELS))) > 0.2
+    rows = [
+        json.dumps([{'name': name, 'value': float(v)} for name, v, keep in zip(CHANNELS, vals, mask) if keep])
+        for vals, mask in zip(values, present)
+    ]
+    pd.DataFrame({
+        'vehicle_id': [f'GR86-0{c:02d}-{c:03d}' for c in car],
+        'lap': np.sort(rng.integers(1, 30, n_rows)),
+        'timestamp': '2025-03-15T15:00:00Z',
+        'value': rows,
+        'vehicle_number': car,
+    }).to_csv(path, index=False)
+    return int(present.sum())
+
+def make_long_csv(path, n_rows, seed=0):
+    """Same readings as the JSON file, one channel per row."""
+    rng = np.random.default_rng(seed)
+    car = rng.choice(CARS, n_rows)
+    pd.DataFrame({
+        'lap': np.sort(rng.integers(1, 30, n_rows)),
+        'telemetry_name': rng.choice(CHANNELS, n_rows),
+        'telemetry_value': rng.normal(0.0, 1.0, n_rows).round(5),
+        'timestamp': '2025-03-15T15:00:00Z',
+        'vehicle_id': [f'GR86-0{c:02d}-{c}' for c in car],
+        'vehicle_number': car,
+    }).to_csv(path, index=False)
+    return n_rows
+
+
+def parse_json_row(json_str, channels):
+    """One json.loads per row; first value of each wanted channel."""
+    found = {}
+    try:
+        for item in json.loads(json_str):
+            name = item.get('name', '').strip().replace('"', '')
+            if name in channels and name not in found:
+                found[name] = item.get('value')
+    except: pass
+    return [found.get(channel) for channel in channels]
+
+def rowwise_json_chunk(chunk_df, channels=pt.TELEMETRY_CHANNELS):
+    """The previous JSON path (json.loads and car-number parsing on every row via .apply), extended to all channels."""
+    channels = list(channels)
+    chunk_df = pt.clean_col_names(chunk_df)
+    parsed = pd.DataFrame(chunk_df['value'].apply(parse_json_row, channels=channels).tolist(), index=chunk_df.index, columns=channels)
+    chunk_df['vehicle_id'] = pt.clean_col_data(chunk_df['vehicle_id'])
+    chunk_df['lap'] = pd.to_numeric(pt.clean_col_data(chunk_df['lap']), errors='coerce')
+    numbers = chunk_df['vehicle_id'].apply(pt.extract_number_from_id)
+    missing = numbers.isna() | (numbers == '0')
+    numbers[missing] = chunk_df.loc[missing, 'vehicle_number'].apply(pt.number_from_vehicle_number)
+    chunk_df['NUMBER'] = numbers
+
+    long_chunks = []
+    for channel in channels:
+        present = parsed[channel].notna()
+        if not present.any(): continue
+        part = chunk_df.loc[present, ['NUMBER', 'lap']].copy()
+        part['telemetry_name'] = channel
+        part['telemetry_value'] = pd.to_numeric(parsed.loc[present, channel], errors='coerce')
+        long_chunks.append(part)
+    return pd.concat(long_chunks)
+
+def time_parser(path, parser, repeat):
+    """Best-of-n seconds to read the file and to parse it with `parser`."""
+    best_read, best_parse, result = np.inf, np.inf, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = pd.read_csv(path, sep=',', on_bad_lines='skip')
+        mid = time.perf_counter()
+        result = parser(df)
+        best_read = min(best_read, mid - start)
+        best_parse = min(best_parse, time.perf_counter() - mid)
+    return best_read, best_parse, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON telemetry parser.")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, long_path = os.path.join(tmp, 'json.csv'), os.path.join(tmp, 'long.csv')
+        print(f"Generating {args.rows:,} synthetic rows per format...")
+        json_readings = make_json_csv(json_path, args.rows)
+        # One JSON row carries several channel readings; give LONG as many readings
+        long_readings = make_long_csv(long_path, json_readings)
+
+        runs = [
+            ('JSON row-by-row', json_path, json_readings, rowwise_json_chunk),
+            ('JSON vectorized', json_path, json_readings, pt.process_json_chunk),
+            ('LONG', long_path, long_readings, pt.process_long_chunk),
+        ]
+        results = {}
+        print(f"{'path':<18}{'read s':>9}{'parse s':>9}{'MB/s':>9}{'readings/s':>14}")
+        for label, path, readings, fn in runs:
+            read_s, parse_s, out = time_parser(path, fn, args.repeat)
+            mb = os.path.getsize(path) / 1e6
+            results[label] = (parse_s, out)
+            # Throughput of the whole ingest (read + parse) per byte and per channel reading
+            print(f"{label:<18}{read_s:>9.3f}{parse_s:>9.3f}{mb / (read_s + parse_s):>9.1f}{readings / (read_s + parse_s):>14,.0f}")
+
+    old, new = results['JSON row-by-row'][1], results['JSON vectorized'][1]
+    same = old.astype({'NUMBER': object}).equals(new.astype({'NUMBER': object}))
+    print("---")
+    print(f"Vectorized output identical to row-by-row: {same}")
+    print(f"Parse speedup over row-by-row: {results['JSON row-by-row'][0] / results['JSON vectorized'][0]:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import live_ingest as li
+
+# ===================================================================
+# --- LIVE INGEST THROUGHPUT BENCHMARK ---
+# Synthetic ECU samples for a full field, pushed through the ingest
+# server three ways: fed in-process (parsing + ring buffers only), over
+# TCP from a replay client, and over UDP (a burst and a paced run).
+# Reports samples/s against the full-field rate (--cars x --channels x
+# --hz) and snapshot latency.
+# Everything (server and client) shares the machine's cores.
+# Usage: python benchmarks/bench_live_ingest.py [--samples 2000000] [--cars 30] [--channels 12] [--hz 50] [--udp-pace 10]
+# ===================================================================
+
+BENCH_PORT = 9760
+CHANNELS = ['speed', 'accx_can', 'accy_can', 'aps', 'pbrake_f', 'pbrake_r', 'gear', 'nmot',
+            'Steering_Angle', 'ath', 'Laptrigger_lapdist_dls', 'VBOX_Lat_Min', 'VBOX_Long_Minutes']
+
+
+def make_sample_blocks(n_samples, n_cars, n_channels, block_bytes=li.UDP_DATAGRAM_BYTES, seed=0):
+    """S lines in time order (every car sends every channel each tick), split into datagram-sized blocks."""
+    rng = np.random.default_rng(seed)
+    cars = np.arange(n_cars) + 2
+    tick = np.arange(n_samples) // (n_cars * n_channels)
+    df = pd.DataFrame({
+        'kind': 'S',
+        'NUMBER': cars[np.arange(n_samples) // n_channels % n_cars],
+        'lap': 1 + tick // 5000,
+        'timestamp': 1_750_000_000_000 + tick * 20,
+        'telemetry_name': np.array(CHANNELS)[np.arange(n_samples) % n_channels],
+        'telemetry_value': rng.normal(0.0, 1.0, n_samples).round(4),
+    })
+    data = df.to_csv(header=False, index=False, lineterminator='\n').encode()
+    return list(li.split_lines(data, block_bytes))
+
+def run_in_process(blocks, n_samples):
+    server = li.IngestServer()
+    start = time.perf_counter()
+    for block in blocks:
+        server.feed(block)
+    server.flush()
+    seconds = time.perf_counter() - start
+    assert server.counts['samples'] == n_samples, server.counts
+    return seconds, server
+
+def start_server(port):
+    process = subprocess.Popen(
+        [sys.executable, li.__file__, 'serve', '--port', str(port)],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection((li.HOST, port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Ingest server did not start.")
+
+def read_line(sock):
+    reply = b''
+    while not reply.endswith(b'\n'):
+        block = sock.recv(1 << 20)
+        if not block: break
+        reply += block
+    return reply
+
+def run_tcp(blocks, port):
+    """Seconds from the first byte sent until the server has parsed everything (its snapshot reply)."""
+    with socket.create_connection((li.HOST, port)) as sock:
+        start = time.perf_counter()
+        for block in blocks:
+            sock.sendall(block)
+        # Same connection: the server answers only after handling every line before it
+        sock.sendall(b'SNAPSHOT * 0\n')
+        counts = json.loads(read_line(sock))['counts']
+        return time.perf_counter() - start, counts
+
+def run_udp(blocks, port, before, rate=None):
+    """Sends every block as one datagram, paced to rate samples/s (None: as fast as possible)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    seconds_per_block = len(blocks) and (sum(b.count(b'\n') for b in blocks) / len(blocks) / rate if rate else 0.0)
+    start = time.perf_counter()
+    for i, block in enumerate(blocks):
+        sock.sendto(block, (li.HOST, port))
+        ahead = start + (i + 1) * seconds_per_block - time.perf_counter()
+        if ahead > 0: time.sleep(ahead)
+    sent_seconds = time.perf_counter() - start
+    sock.close()
+    # Wait for the server to drain its receive buffer
+    counts, previous = before, -1
+    while counts['samples'] != previous:
+        previous = counts['samples']
+        time.sleep(0.2)
+        counts = li.fetch_snapshot(n_samples=0, port=port)['counts']
+    return sent_seconds, counts['samples'] - before['samples']
+
+def snapshot_latency(port, number, n_samples, repeat=20):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        li.fetch_snapshot(number, n_samples, port=port)
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the live ingest server.")
+    parser.add_argument('--samples', type=int, default=2_000_000)
+    parser.add_argument('--cars', type=int, default=30)
+    parser.add_argument('--channels', type=int, default=12)
+    parser.add_argument('--hz', type=float, default=50, help="Samples per second per channel at full telemetry rate")
+    parser.add_argument('--udp-pace', type=float, default=10, help="Paced UDP run at this multiple of the full-field rate")
+    parser.add_argument('--port', type=int, default=BENCH_PORT)
+    args = parser.parse_args()
+
+    field_rate = args.cars * args.channels * args.hz
+    print(f"Generating {args.samples:,} samples ({args.cars} cars x {args.channels} channels)...")
+    blocks = make_sample_blocks(args.samples, args.cars, args.channels)
+    mb = sum(len(b) for b in blocks) / 1e6
+
+    print(f"{'path':<14}{'seconds':>9}{'MB/s':>9}{'samples/s':>14}{'x field rate':>14}")
+    def report(label, seconds, n):
+        print(f"{label:<14}{seconds:>9.3f}{mb * n / args.samples / seconds:>9.1f}{n / seconds:>14,.0f}{n / seconds / field_rate:>14.1f}")
+
+    seconds, _ = run_in_process(blocks, args.samples)
+    report('in-process', seconds, args.samples)
+
+    server = start_server(args.port)
+    try:
+        seconds, counts = run_tcp(blocks, args.port)
+        report('TCP', seconds, counts['samples'])
+        udp_seconds, received = run_udp(blocks, args.port, counts)
+        report('UDP (burst)', udp_seconds, received)
+        counts = li.fetch_snapshot(n_samples=0, port=args.port)['counts']
+        paced_seconds, paced = run_udp(blocks, args.port, counts, args.udp_pace * field_rate)
+        report(f'UDP ({args.udp_pace:g}x)', paced_seconds, paced)
+        latency = snapshot_latency(args.port, '2', li.SNAPSHOT_SAMPLES)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print("---")
+    print(f"Full-field rate: {field_rate:,.0f} samples/s ({args.cars} cars x {args.channels} channels x {args.hz:g} Hz)")
+    print(f"UDP burst delivered {received:,} of {args.samples:,} samples ({100 * received / args.samples:.1f}%)")
+    print(f"UDP at {args.udp_pace:g}x field rate delivered {paced:,} of {args.samples:,} samples ({100 * paced / args.samples:.1f}%)")
+    print(f"Snapshot of one car ({li.SNAPSHOT_SAMPLES} samples + laps): {latency * 1e3:.1f} ms median")
+
+if __name__ == '__main__':
+    main()
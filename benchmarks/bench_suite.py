@@ -0,0 +1,253 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import synthetic_data
+
+try:
+    import resource
+except ImportError: # Windows: no peak RSS
+    resource = None
+
+# ===================================================================
+# --- BENCHMARK SUITE ---
+# Builds a seeded synthetic track (R1 with LONG telemetry, R2 with JSON)
+# in a scratch directory and runs the real pipeline on it, each stage in
+# a fresh process: process_telemetry.py and process_data.py (rows/s and
+# peak memory), train_final_model.py (training time), then the app.py
+# strategy functions on the trained model (per-call latency).
+# Results go to a JSON file; --compare prints the change against the
+# results of another commit and exits with 1 on a regression.
+# Usage:
+#   python benchmarks/bench_suite.py [--cars 20] [--laps 30] [--samples-per-lap 50] [--seed 0]
+#   python benchmarks/bench_suite.py --compare benchmarks/results/<old>.json
+# ===================================================================
+
+TRACK = 'Synthetic'
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+# Minimum time spent calling each app function (median of the calls is reported)
+LATENCY_SECONDS = 1.0
+LATENCY_MAX_CALLS = 1000
+# --compare flags a benchmark whose time grew by more than this share
+REGRESSION_THRESHOLD = 0.10
+
+
+# --- Measurement (runs in a fresh process) ---
+
+def rss_mb():
+    """Current resident set size (Linux), None elsewhere."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KB on Linux
+
+def measure(work_dir, task, *args):
+    """Runs task(*args) in work_dir with its output captured. Returns seconds, memory and the task's own metrics."""
+    os.chdir(work_dir)
+    baseline = rss_mb()
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            metrics = task(*args) or {}
+    except (Exception, SystemExit) as e: # Stages call sys.exit() on errors
+        return {'error': f"{type(e).__name__}: {e}", 'log': log.getvalue()[-2000:]}
+    return {
+        'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb(), 'baseline_rss_mb': baseline, **metrics,
+    }
+
+def run_isolated(work_dir, task, *args):
+    """measure() in a new interpreter, so peak memory is the stage's own."""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(measure, (work_dir, task) + args)
+
+
+# --- Tasks ---
+
+def task_process_telemetry(race, race_num, n_workers):
+    import process_telemetry as pt
+    pt.process_race_telemetry(TRACK, race_num, race['telemetry'], race['format'], n_workers=n_workers)
+
+def task_process_data(race, race_num):
+    import process_data as pdp
+    pdp.process_race(TRACK, race_num, race['laps'], race['weather'], race['date'], race['timezone'])
+
+def task_train(n_jobs):
+    import train_final_model
+    train_final_model.train_track(TRACK, n_jobs=n_jobs)
+
+def time_calls(fn, min_seconds=LATENCY_SECONDS, max_calls=LATENCY_MAX_CALLS):
+    """Per-call milliseconds of fn() over at least min_seconds (after one warm-up call)."""
+    fn()
+    times, start = [], time.perf_counter()
+    while len(times) < max_calls and (time.perf_counter() - start < min_seconds or len(times) < 3):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    times = np.array(times) * 1000
+    return {'calls': len(times), 'median_ms': float(np.median(times)), 'p95_ms': float(np.percentile(times, 95)),
+            'min_ms': float(times.min())}
+
+def task_app_latency(min_seconds):
+    """Model loading and the strategy functions app.py calls, with the app's default inputs, on the registered model and its surface."""
+    import joblib
+    import simulation as sim
+    from model_registry import load_or_register, load_forest
+    from degradation_surface import load_or_build_surface
+    from monte_carlo import monte_carlo_caution, monte_carlo_battle
+    from field_simulation import build_field_snapshot, simulate_field
+
+    model = load_or_register(TRACK)
+    df_race = pd.read_parquet(f'processed_data/{TRACK}/R1_processed.parquet')
+    data = pd.concat([df_race, pd.read_parquet(f'processed_data/{TRACK}/R2_processed.parquet')])
+    surface = load_or_build_surface(TRACK, model, data)
+    tire_laps, laps_left, pit_cost, yellow_cost = 10, 20, 36.0, sim.GLOBAL_YELLOW_PIT_COST
+    temp, aggression = float(data['TRACK_TEMP'].median()), float(data['avg_aggressiveness'].median())
+    snapshot_lap = int(df_race['LAP_NUMBER'].max()) // 2
+    snapshot = build_field_snapshot(df_race, snapshot_lap)
+    pit_calls = {snapshot['NUMBER'].iloc[0]: 1}
+
+    calls = {
+        'load_model[pickle]': lambda: joblib.load(f'processed_data/{TRACK}/FINAL_model.pkl'),
+        'load_model[registry]': lambda: load_forest(TRACK),
+        'get_prediction': lambda: sim.get_prediction(model, tire_laps + 1, temp, aggression),
+        'get_prediction[surface]': lambda: sim.get_prediction(surface, tire_laps + 1, temp, aggression),
+        'simulate_caution_scenarios': lambda: sim.simulate_caution_scenarios(model, tire_laps, laps_left, temp, aggression, 1, pit_cost, yellow_cost),
+        'simulate_caution_scenarios[per_tree]': lambda: sim.simulate_caution_scenarios(model, tire_laps, laps_left, temp, aggression, 1, pit_cost, yellow_cost, per_tree=True),
+        'simulate_battle_scenarios': lambda: sim.simulate_battle_scenarios(model, tire_laps, tire_laps + 2, temp, aggression, 1, 2, pit_cost),
+        'optimize_pit_window': lambda: sim.optimize_pit_window(model, tire_laps, laps_left, temp, aggression, pit_cost, yellow_cost, 1.0),
+        'solve_pit_strategy': lambda: sim.solve_pit_strategy(model, tire_laps, 30, temp, aggression, pit_cost, yellow_cost, [], 2, 5),
+        'monte_carlo_caution': lambda: monte_carlo_caution(model, tire_laps, laps_left, temp, aggression, 1, pit_cost, yellow_cost),
+        'monte_carlo_battle': lambda: monte_carlo_battle(model, tire_laps, tire_laps + 2, 2.0, temp, aggression, 1, 2, pit_cost),
+        'build_field_snapshot': lambda: build_field_snapshot(df_race, snapshot_lap),
+        'simulate_field': lambda: simulate_field(model, snapshot, 10, temp, pit_calls, pit_cost),
+    }
+    return {'latency': {name: time_calls(fn, min_seconds) for name, fn in calls.items()}}
+
+
+# --- Results ---
+
+def git_commit():
+    def git(*args):
+        result = subprocess.run(['git', *args], cwd=REPO_DIR, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return git('rev-parse', '--short', 'HEAD'), bool(git('status', '--porcelain', '--untracked-files=no'))
+
+def environment():
+    import sklearn
+    import pyarrow
+    commit, dirty = git_commit()
+    return {
+        'commit': commit, 'dirty': dirty, 'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'packages': {'numpy': np.__version__, 'pandas': pd.__version__, 'pyarrow': pyarrow.__version__, 'sklearn': sklearn.__version__},
+    }
+
+def headline(result):
+    """(value, unit) compared between runs: stage seconds, or median call latency."""
+    if 'median_ms' in result: return result['median_ms'], 'ms'
+    return result.get('seconds'), 's'
+
+def compare(results, old_results, threshold=REGRESSION_THRESHOLD):
+    """Prints new vs old per benchmark. Returns the names that got slower by more than threshold."""
+    regressions = []
+    print(f"{'benchmark':<42}{'old':>12}{'new':>12}{'change':>9}")
+    for name, result in results.items():
+        if name not in old_results: continue
+        (new, unit), (old, _) = headline(result), headline(old_results[name])
+        if not new or not old: continue
+        change = new / old - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name); flag = '  REGRESSION'
+        print(f"{name:<42}{old:>10.3f}{unit:<2}{new:>10.3f}{unit:<2}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and app functions on synthetic data.")
+    parser.add_argument('--cars', type=int, default=20)
+    parser.add_argument('--laps', type=int, default=30)
+    parser.add_argument('--samples-per-lap', type=int, default=50, help="Telemetry readings per channel per lap")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1, help="process_telemetry.py reader processes")
+    parser.add_argument('--jobs', type=int, default=1, help="Training n_jobs")
+    parser.add_argument('--latency-seconds', type=float, default=LATENCY_SECONDS)
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    env = environment()
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"Generating synthetic track: {args.cars} cars x {args.laps} laps, {args.samples_per_lap} readings/channel/lap...")
+        races = {
+            'R1': synthetic_data.make_race(os.path.join(work_dir, 'raw', 'R1'), args.cars, args.laps, args.samples_per_lap, 'LONG', args.seed),
+            'R2': synthetic_data.make_race(os.path.join(work_dir, 'raw', 'R2'), args.cars, args.laps, args.samples_per_lap, 'JSON', args.seed + 1),
+        }
+
+        def record(name, result, rows=None):
+            if 'error' in result:
+                print(f"Error in {name}: {result['error']}\n{result['log']}"); sys.exit(1)
+            if rows is not None:
+                result.update(rows=rows, rows_per_s=rows / result['seconds'])
+            results[name] = result
+            rate = f"{result['rows_per_s']:>14,.0f} rows/s" if rows is not None else ' ' * 21
+            print(f"{name:<42}{result['seconds']:>9.3f} s{rate}   peak {result['peak_rss_mb'] or float('nan'):>7.1f} MB")
+
+        for race_num, race in races.items():
+            record(f"process_telemetry[{race['format']}]",
+                   run_isolated(work_dir, task_process_telemetry, race, race_num, args.workers), race['telemetry_rows'])
+        for race_num, race in races.items():
+            record(f"process_data[{race_num}]", run_isolated(work_dir, task_process_data, race, race_num), race['lap_rows'])
+        record("train_final_model", run_isolated(work_dir, task_train, args.jobs))
+
+        latency = run_isolated(work_dir, task_app_latency, args.latency_seconds)
+        if 'error' in latency:
+            print(f"Error in app latency: {latency['error']}\n{latency['log']}"); sys.exit(1)
+        for name, calls in latency['latency'].items():
+            results[f"app.{name}"] = calls
+            print(f"{'app.' + name:<42}{calls['median_ms']:>9.3f} ms/call (p95 {calls['p95_ms']:.3f} ms, {calls['calls']} calls)")
+
+    params = {key: getattr(args, key) for key in ('cars', 'laps', 'samples_per_lap', 'seed', 'workers', 'jobs')}
+    params.update({f'{race_num}_{key}': race[key] for race_num, race in races.items() for key in ('format', 'lap_rows', 'telemetry_rows', 'telemetry_bytes')})
+    output = args.output or os.path.join(RESULTS_DIR, f"{env['commit'] or 'unknown'}{'-dirty' if env['dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({**env, 'params': params, 'results': results}, f, indent=2)
+    print("---")
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get('params') != params:
+            print("Warning: the runs used different parameters; times are not directly comparable.")
+        print(f"--- vs {args.compare} (commit {old.get('commit')}) ---")
+        regressions = compare(results, old['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
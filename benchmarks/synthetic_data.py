@@ -0,0 +1,213 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+# ===================================================================
+# --- SYNTHETIC RACE DATA ---
+# Seeded stand-ins for the raw_data files of one race: the timing laps
+# file (23_AnalysisEnduranceWithSections), the weather file (26_Weather)
+# and the telemetry CSV in LONG (one channel reading per row) or JSON
+# (one list of channels per row) format. Laps, weather and telemetry are
+# consistent with each other (same cars, laps and clock), so the whole
+# pipeline runs on them. Lap times follow tire age, track temperature and
+# each car's lateral-G aggression, so the trained model has a signal.
+# Usage: python benchmarks/synthetic_data.py OUT_DIR [--cars 20] [--laps 30] [--samples-per-lap 50] [--format LONG] [--seed 0]
+# ===================================================================
+
+RACE_DATE = '2025-08-16'
+RACE_START = '14:00:00'
+TRACK_TIMEZONE = 'America/New_York'
+PIT_LOSS = 30.0
+FCY_SHARE = 0.05
+
+# Channel -> (mean, sd, min, max) of the synthetic readings; accy_can is set per car
+CHANNELS = {
+    'speed': (150.0, 35.0, 0.0, 260.0),
+    'accx_can': (0.0, 0.6, -2.5, 2.5),
+    'accy_can': (0.0, 1.0, -3.0, 3.0),
+    'aps': (65.0, 35.0, 0.0, 100.0),
+    'ath': (60.0, 35.0, 0.0, 100.0),
+    'pbrake_f': (15.0, 30.0, 0.0, 180.0),
+    'pbrake_r': (12.0, 25.0, 0.0, 160.0),
+    'gear': (4.0, 1.2, 1.0, 6.0),
+    'nmot': (5500.0, 1200.0, 1500.0, 7500.0),
+    'Steering_Angle': (0.0, 40.0, -180.0, 180.0),
+    'Laptrigger_lapdist_dls': (2500.0, 1400.0, 0.0, 5000.0),
+    'VBOX_Long_Minutes': (-78.5, 0.01, -79.0, -78.0),
+    'VBOX_Lat_Min': (36.5, 0.01, 36.0, 37.0),
+}
+
+
+def car_numbers(n_cars):
+    return [2 + 3 * i for i in range(n_cars)]
+
+def format_lap_time(seconds):
+    """'m:ss.fff' from one minute up, 'ss.fff' below (as in the timing files)."""
+    seconds = np.round(np.asarray(seconds, dtype=float), 3)
+    minutes = (seconds // 60).astype(int)
+    rest = seconds - 60 * minutes
+    return np.where(minutes > 0, [f"{m}:{s:06.3f}" for m, s in zip(minutes, rest)], [f"{s:.3f}" for s in seconds])
+
+
+# --- Timing and Weather ---
+
+def make_laps(laps_path, weather_path, n_cars=20, n_laps=30, seed=0, race_date=RACE_DATE, timezone=TRACK_TIMEZONE):
+    """
+    Writes the laps and weather files. Returns the laps as a DataFrame (NUMBER,
+    LAP_NUMBER, START in UTC, LAP_SECONDS, AGGRESSION) for the telemetry generator.
+    """
+    rng = np.random.default_rng(seed)
+    numbers = np.array(car_numbers(n_cars))
+    base_pace = 150.0 + rng.normal(0.0, 1.0, n_cars)
+    aggression = rng.uniform(0.6, 1.2, n_cars)
+    pit_lap = rng.integers(max(2, n_laps // 3), max(3, 2 * n_laps // 3 + 1), n_cars)
+
+    lap = np.arange(1, n_laps + 1)[None, :]
+    tire_age = np.where(lap <= pit_lap[:, None], lap, lap - pit_lap[:, None])
+    race_progress = np.broadcast_to(lap / n_laps, (n_cars, n_laps))
+    track_temp = 30.0 + 8.0 * race_progress # Track warms up over the race
+    fcy = rng.random((n_cars, n_laps)) < FCY_SHARE
+    in_pit = lap == pit_lap[:, None]
+
+    lap_seconds = (base_pace[:, None] + 0.08 * tire_age + 0.004 * tire_age ** 2 + 0.05 * (track_temp - 30.0)
+                   + 0.6 * aggression[:, None] + rng.normal(0.0, 0.25, (n_cars, n_laps)))
+    lap_seconds = lap_seconds + np.where(in_pit, PIT_LOSS, 0.0) + np.where(fcy, 20.0, 0.0)
+    lap_seconds = np.round(lap_seconds, 3)
+    share = np.array([0.27, 0.43, 0.30]) + rng.normal(0.0, 0.003, (n_cars, n_laps, 3))
+    s1 = np.round(lap_seconds * share[..., 0], 3)
+    s2 = np.round(lap_seconds * share[..., 1], 3)
+    s3 = np.round(lap_seconds - s1 - s2, 3)
+
+    start = pd.Timestamp(f'{race_date} {RACE_START}')
+    finish = np.cumsum(lap_seconds, axis=1) + rng.uniform(0.0, 3.0, (n_cars, 1)) # Staggered grid
+    hour = start + pd.to_timedelta(finish.ravel(), unit='s')
+    top_speed = np.round(200.0 + rng.normal(0.0, 1.5, (n_cars, n_laps)), 1)
+
+    flat = lambda a: np.asarray(a).ravel()
+    laps = pd.DataFrame({
+        'NUMBER': np.repeat(numbers, n_laps), 'DRIVER_NUMBER': 1, 'LAP_NUMBER': np.tile(lap[0], n_cars),
+        'LAP_TIME': format_lap_time(flat(lap_seconds)), 'LAP_IMPROVEMENT': 0,
+        'CROSSING_FINISH_LINE_IN_PIT': np.where(flat(in_pit), '1', ''),
+        'S1': format_lap_time(flat(s1)), 'S1_IMPROVEMENT': 0, 'S2': format_lap_time(flat(s2)), 'S2_IMPROVEMENT': 0,
+        'S3': format_lap_time(flat(s3)), 'S3_IMPROVEMENT': 0, 'KPH': np.round(5000.0 * 3.6 / flat(lap_seconds), 1),
+        'ELAPSED': format_lap_time(flat(finish)), 'HOUR': hour.strftime('%H:%M:%S.%f').str[:-3],
+        'S1_LARGE': format_lap_time(flat(s1)), 'S2_LARGE': format_lap_time(flat(s2)), 'S3_LARGE': format_lap_time(flat(s3)),
+        'TOP_SPEED': flat(top_speed), 'PIT_TIME': np.where(flat(in_pit), format_lap_time(np.full(n_cars * n_laps, PIT_LOSS)), ''),
+        'CLASS': 'Am', 'GROUP': '', 'MANUFACTURER': 'Toyota', 'FLAG_AT_FL': np.where(flat(fcy), 'FCY', 'GF'),
+        'S1_SECONDS': flat(s1), 'S2_SECONDS': flat(s2), 'S3_SECONDS': flat(s3),
+    })
+    order = np.argsort(finish.ravel(), kind='stable') # The timing file lists laps as cars cross the line
+    out = laps.iloc[order]
+    out.columns = [(' ' if i else '') + col for i, col in enumerate(out.columns)] # Padded headers, like the real files
+    out.to_csv(laps_path, sep=';', index=False)
+
+    # Weather: one reading a minute (UTC) from before the start to after the finish
+    local = pd.date_range(start - pd.Timedelta(minutes=30), start + pd.Timedelta(seconds=float(finish.max()) + 1800), freq='1min')
+    utc = local.tz_localize(timezone).tz_convert('UTC')
+    progress = np.clip((local - start).total_seconds() / max(float(finish.max()), 1.0), 0.0, 1.0)
+    pd.DataFrame({
+        'TIME_UTC_SECONDS': (utc.asi8 // 10**9), 'TIME_UTC_STR': utc.strftime('%Y-%m-%d %H:%M:%S'),
+        'AIR_TEMP': np.round(24.0 + 3.0 * progress + rng.normal(0.0, 0.1, len(local)), 2),
+        'TRACK_TEMP': np.round(30.0 + 8.0 * progress, 1), 'HUMIDITY': 55.0, 'PRESSURE': 1012.0,
+        'WIND_SPEED': np.round(rng.uniform(0.0, 4.0, len(local)), 1), 'WIND_DIRECTION': 180, 'RAIN': 0,
+    }).to_csv(weather_path, sep=';', index=False)
+
+    return pd.DataFrame({
+        'NUMBER': np.repeat(numbers, n_laps), 'LAP_NUMBER': np.tile(lap[0], n_cars),
+        'START': (start + pd.to_timedelta((finish - lap_seconds).ravel(), unit='s')).tz_localize(timezone).tz_convert('UTC').tz_localize(None),
+        'LAP_SECONDS': lap_seconds.ravel(), 'AGGRESSION': np.repeat(aggression, n_laps),
+    })
+
+
+# --- Telemetry ---
+
+def channel_readings(rng, channel, n, aggression=1.0):
+    mean, sd, low, high = CHANNELS[channel]
+    if channel == 'accy_can':
+        sd = aggression # Lateral G spread is the car's aggression
+    values = np.clip(rng.normal(mean, sd, n), low, high)
+    return np.round(values) if channel == 'gear' else np.round(values, 4)
+
+def car_samples(laps, samples_per_lap):
+    """Sample clock of one car: its lap number and UTC timestamp, samples_per_lap per lap."""
+    fraction = np.tile(np.arange(samples_per_lap) / samples_per_lap, len(laps))
+    lap_number = np.repeat(laps['LAP_NUMBER'].to_numpy(), samples_per_lap)
+    start = np.repeat(laps['START'].to_numpy().astype('datetime64[ms]'), samples_per_lap)
+    duration = np.repeat(laps['LAP_SECONDS'].to_numpy(), samples_per_lap)
+    timestamp = start + (fraction * duration * 1000).astype('timedelta64[ms]')
+    return lap_number, np.char.add(np.datetime_as_string(timestamp, unit='ms'), 'Z')
+
+def vehicle_id(number):
+    return f'GR86-{100 + number:03d}-{number}'
+
+def make_telemetry(path, laps, samples_per_lap=50, telemetry_format='LONG', seed=0, channels=tuple(CHANNELS)):
+    """
+    Writes the telemetry CSV (one car at a time, so memory stays bounded).
+    Returns the number of CSV rows written.
+    """
+    rng = np.random.default_rng(seed + 1)
+    n_rows = 0
+    for i, (number, car_laps) in enumerate(laps.groupby('NUMBER', sort=False)):
+        lap_number, timestamp = car_samples(car_laps, samples_per_lap)
+        n, aggression = len(lap_number), float(car_laps['AGGRESSION'].iloc[0])
+        if telemetry_format == 'LONG':
+            k = len(channels)
+            df = pd.DataFrame({
+                'expire_at': '', 'lap': np.repeat(lap_number, k), 'meta_event': 'I_R06_2025-08-17',
+                'meta_session': 'R1', 'meta_source': 'kafka:gr-raw', 'meta_time': np.repeat(timestamp, k),
+                'original_vehicle_id': vehicle_id(number), 'outing': 0,
+                'telemetry_name': np.tile(np.array(channels), n),
+                'telemetry_value': np.stack([channel_readings(rng, c, n, aggression) for c in channels], axis=1).ravel(),
+                'timestamp': np.repeat(timestamp, k), 'vehicle_id': vehicle_id(number), 'vehicle_number': number,
+            })
+        elif telemetry_format == 'JSON':
+            items = []
+            for channel in channels:
+                item = f'{{"name": "{channel}", "value": ' + pd.Series(channel_readings(rng, channel, n, aggression)).astype(str) + '}'
+                items.append(item.where(rng.random(n) > 0.1, '')) # Some channels missing from some rows
+            joined = items[0].str.cat(items[1:], sep=', ').str.replace(r'(, )+', ', ', regex=True).str.strip(', ')
+            df = pd.DataFrame({
+                'vehicle_id': vehicle_id(number), 'lap': lap_number, 'timestamp': timestamp,
+                'value': '[' + joined + ']', 'vehicle_number': number,
+            })
+        else:
+            raise ValueError(f"Unknown format '{telemetry_format}'.")
+        df.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(df)
+    return n_rows
+
+
+def make_race(folder, n_cars=20, n_laps=30, samples_per_lap=50, telemetry_format='LONG', seed=0):
+    """All raw files of one synthetic race in folder. Returns their paths and sizes."""
+    os.makedirs(folder, exist_ok=True)
+    paths = {
+        'laps': os.path.join(folder, '23_AnalysisEnduranceWithSections_Synthetic.CSV'),
+        'weather': os.path.join(folder, '26_Weather_Synthetic.CSV'),
+        'telemetry': os.path.join(folder, f'synthetic_telemetry_{telemetry_format.lower()}.csv'),
+    }
+    laps = make_laps(paths['laps'], paths['weather'], n_cars, n_laps, seed)
+    telemetry_rows = make_telemetry(paths['telemetry'], laps, samples_per_lap, telemetry_format, seed)
+    return {
+        **paths, 'format': telemetry_format, 'date': RACE_DATE, 'timezone': TRACK_TIMEZONE,
+        'lap_rows': len(laps), 'telemetry_rows': telemetry_rows,
+        'telemetry_bytes': os.path.getsize(paths['telemetry']),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic race (laps, weather, telemetry).")
+    parser.add_argument('out_dir')
+    parser.add_argument('--cars', type=int, default=20)
+    parser.add_argument('--laps', type=int, default=30)
+    parser.add_argument('--samples-per-lap', type=int, default=50, help="Readings per channel per lap")
+    parser.add_argument('--format', default='LONG', choices=['LONG', 'JSON'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    race = make_race(args.out_dir, args.cars, args.laps, args.samples_per_lap, args.format, args.seed)
+    print(json.dumps(race, indent=2))
+
+if __name__ == '__main__':
+    main()
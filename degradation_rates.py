@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+import os
+import re
+import sys
+import time
+import argparse
+
+# ===================================================================
+# --- DEGRADATION RATE TABLE ---
+# Slope, intercept and fit quality of LAP_DELTA and S1/S2/S3_DELTA
+# against tire age for every driver x stint x sector of a track, plus
+# each driver's fit over a whole race (STINT_ID = ALL_STINTS) and over
+# the season (RACE = ALL_RACES). All groups are fitted together in one
+# grouped pass of closed-form least squares, and the table is stored in
+# processed_data/{track}/degradation_rates.parquet. DegradationRates
+# answers any (driver, sector, race, stint) lookup from a dict.
+# Usage: python degradation_rates.py [--tracks VIR COTA] [--driver 13]
+# ===================================================================
+
+RATES_FILENAME = 'degradation_rates.parquet'
+X_COLUMN = 'Laps_on_this_Tireset'
+SECTORS = ['LAP', 'S1', 'S2', 'S3'] # Regressed column: {sector}_DELTA
+ALL_RACES = 'ALL'
+ALL_STINTS = -1
+KEYS = ['RACE', 'NUMBER', 'STINT_ID', 'SECTOR']
+FIT_COLUMNS = ['slope', 'intercept', 'r2', 'resid_std', 'n']
+
+
+def rates_path(track_name):
+    return f'processed_data/{track_name}/{RATES_FILENAME}'
+
+def race_files(track_name):
+    """{race: path} of every processed race of the track (R1, R2, ...)."""
+    track_dir = f'processed_data/{track_name}'
+    if not os.path.isdir(track_dir):
+        return {}
+    matches = [re.match(r'^(R\d+)_processed\.parquet$', f) for f in os.listdir(track_dir)]
+    races = sorted((m.group(1) for m in matches if m), key=lambda race: int(race[1:]))
+    return {race: os.path.join(track_dir, f'{race}_processed.parquet') for race in races}
+
+
+# --- Closed-Form Regression ---
+
+def ols_coefficients(df, x, y, by):
+    """
+    Least-squares line y = intercept + slope * x for every group of `by`, from grouped sums
+    (the same fit as plotly's trendline='ols'). Returns slope, intercept, r2, the residual
+    standard deviation and n per group; slope is NaN when x does not vary in the group.
+    """
+    data = df[by + [x, y]].dropna()
+    data = data.assign(_xx=data[x] * data[x], _xy=data[x] * data[y], _yy=data[y] * data[y])
+    grouped = data.groupby(by, sort=True)
+    sums = grouped[[x, y, '_xx', '_xy', '_yy']].sum()
+    n = grouped.size()
+    sxx = n * sums['_xx'] - sums[x] ** 2
+    sxy = n * sums['_xy'] - sums[x] * sums[y]
+    syy = n * sums['_yy'] - sums[y] ** 2
+    slope = sxy / sxx.where(sxx > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = sxy ** 2 / (sxx * syy)
+        sse = ((syy - sxy * slope) / n).clip(lower=0)
+        resid_std = np.sqrt(sse / (n - 2).where(n > 2))
+    return pd.DataFrame({
+        'slope': slope, 'intercept': (sums[y] - slope * sums[x]) / n,
+        'r2': r2.where((sxx > 0) & (syy > 0)), 'resid_std': resid_std, 'n': n,
+    })
+
+def compute_rates(races):
+    """
+    Rate table from {race: processed laps}: one row per (RACE, NUMBER, STINT_ID, SECTOR),
+    including the per-race (STINT_ID = ALL_STINTS) and season (RACE = ALL_RACES) fits.
+    """
+    laps = pd.concat([df.assign(RACE=race) for race, df in races.items()], ignore_index=True)
+    laps['NUMBER'] = laps['NUMBER'].astype(str)
+    sectors = [s for s in SECTORS if f'{s}_DELTA' in laps.columns]
+    long = laps.melt(
+        id_vars=['RACE', 'NUMBER', 'STINT_ID', X_COLUMN], value_vars=[f'{s}_DELTA' for s in sectors],
+        var_name='SECTOR', value_name='DELTA'
+    )
+    long['SECTOR'] = long['SECTOR'].str.removesuffix('_DELTA')
+    # Every level of the table as extra copies of the same rows, so one groupby fits them all
+    levels = pd.concat([
+        long, long.assign(STINT_ID=ALL_STINTS), long.assign(RACE=ALL_RACES, STINT_ID=ALL_STINTS)
+    ], ignore_index=True)
+    table = ols_coefficients(levels, X_COLUMN, 'DELTA', KEYS).reset_index()
+    table['STINT_ID'] = table['STINT_ID'].astype(np.int64)
+    table['n'] = table['n'].astype(np.int64)
+    return table[KEYS + FIT_COLUMNS]
+
+
+class DegradationRates:
+    """Lookup of the rate table by (driver, sector, race, stint) in O(1)."""
+
+    def __init__(self, table):
+        self.table = table.reset_index(drop=True)
+        keys = zip(self.table['RACE'], self.table['NUMBER'], self.table['STINT_ID'].tolist(), self.table['SECTOR'])
+        self._row = {key: i for i, key in enumerate(keys)}
+        self._fits = self.table[FIT_COLUMNS].to_numpy(dtype=float)
+
+    def fit(self, driver, sector='LAP', race=ALL_RACES, stint=ALL_STINTS):
+        """{slope, intercept, r2, resid_std, n} of one group, or None if the driver has no laps there."""
+        row = self._row.get((race, str(driver), int(stint), sector))
+        return None if row is None else dict(zip(FIT_COLUMNS, self._fits[row].tolist()))
+
+    def rate(self, driver, sector='LAP', race=ALL_RACES, stint=ALL_STINTS):
+        """Seconds lost per lap of tire age (NaN if unknown)."""
+        row = self._row.get((race, str(driver), int(stint), sector))
+        return float('nan') if row is None else float(self._fits[row, 0])
+
+    def trendlines(self, race=ALL_RACES):
+        """Every driver's all-stint fits of one race (or the season), indexed by (NUMBER, SECTOR)."""
+        rows = self.table[(self.table['RACE'] == race) & (self.table['STINT_ID'] == ALL_STINTS)]
+        return rows.set_index(['NUMBER', 'SECTOR'])[FIT_COLUMNS]
+
+    def driver_stints(self, driver):
+        """One driver's slope per sector for every stint: rows (RACE, STINT_ID), columns SECTOR."""
+        rows = self.table[(self.table['NUMBER'] == str(driver)) & (self.table['STINT_ID'] != ALL_STINTS)]
+        return rows.pivot_table(index=['RACE', 'STINT_ID'], columns='SECTOR', values='slope', aggfunc='first', dropna=False)
+
+    def save(self, path):
+        self.table.to_parquet(path, index=False)
+
+    @classmethod
+    def load(cls, path):
+        return cls(pd.read_parquet(path))
+
+
+def build_and_save_rates(track_name):
+    """Fits and saves the track's rate table. Raises FileNotFoundError when it has no processed races."""
+    files = race_files(track_name)
+    if not files:
+        raise FileNotFoundError(f"no processed races for {track_name}")
+    start = time.perf_counter()
+    rates = DegradationRates(compute_rates({race: pd.read_parquet(path) for race, path in files.items()}))
+    rates.save(rates_path(track_name))
+    print(f"Degradation rates saved to {rates_path(track_name)} ({len(rates.table):,} fits "
+          f"from {', '.join(files)} in {time.perf_counter() - start:.2f}s)")
+    return rates
+
+def load_or_build_rates(track_name):
+    """Loads the stored table, rebuilding it when missing or older than any processed race."""
+    path = rates_path(track_name)
+    files = race_files(track_name)
+    if os.path.exists(path) and all(os.path.getmtime(path) >= os.path.getmtime(f) for f in files.values()):
+        try:
+            return DegradationRates.load(path)
+        except Exception:
+            pass
+    return build_and_save_rates(track_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the per-track degradation rate tables.")
+    parser.add_argument('--tracks', nargs='*', help="Only these tracks (default: all in processed_data)")
+    parser.add_argument('--driver', help="Print this driver's rates after building")
+    args = parser.parse_args()
+
+    if not os.path.isdir('processed_data'):
+        print("Error: processed_data/ not found. Run from the project root.")
+        sys.exit(1)
+    tracks = args.tracks or sorted(d for d in os.listdir('processed_data') if race_files(d))
+    for track in tracks:
+        try:
+            rates = build_and_save_rates(track)
+        except FileNotFoundError as e:
+            print(f"Error: {e}. SKIPPING.")
+            continue
+        if args.driver is not None:
+            stints = rates.driver_stints(args.driver)
+            if stints.empty:
+                print(f"  #{args.driver}: no laps at {track}")
+            else:
+                season = rates.fit(args.driver)
+                print(f"  #{args.driver} season LAP_DELTA rate: {season['slope']:+.3f} s/lap (R2 {season['r2']:.2f}, {int(season['n'])} laps)")
+                print(stints.round(3).to_string())
+
+if __name__ == '__main__':
+    main()
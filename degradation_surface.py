@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+import os
+
+# ===================================================================
+# --- DEGRADATION LOOKUP SURFACE ---
+# The per-track forest only has 1-3 inputs and is piecewise constant:
+# its output only changes where some tree splits. Tabulating it once per
+# cell between consecutive split thresholds (tire age x TRACK_TEMP x
+# avg_aggressiveness) gives a piecewise-constant lookup table that
+# answers a query with a few binary searches instead of walking 100
+# trees. It is exact unless the table had to be thinned; the measured
+# error against the forest is stored in the file, and surfaces above
+# MAX_SURFACE_ERROR should not stand in for the forest.
+# ===================================================================
+
+SURFACE_FILENAME = 'FINAL_surface.npz'
+# Upper bound on table cells (~32MB); above it the densest axes are thinned to
+# quantiles of their thresholds and the surface only approximates the forest
+MAX_SURFACE_CELLS = 4_000_000
+# Grid cells tabulated per predict call, so building a surface never hands the
+# model the whole grid (millions of rows) at once
+GRID_CHUNK_CELLS = 65536
+# Random points (next to the training rows) used to measure the error bound
+ERROR_CHECK_POINTS = 5000
+# Largest error vs the forest (seconds) at which the surface may replace it
+MAX_SURFACE_ERROR = 0.05
+
+
+def surface_path(track_name):
+    return f'processed_data/{track_name}/{SURFACE_FILENAME}'
+
+
+class DegradationSurface:
+    """
+    Lookup-table stand-in for a track's RandomForestRegressor.
+    Exposes feature_names_in_ and predict() like the model, so every simulator
+    accepts it in place of the live forest. edges[j] are the split thresholds of
+    feature j; values has one entry per cell (len(edges[j]) + 1 along axis j).
+    """
+
+    def __init__(self, feature_names, edges, values, error_stats=None):
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.edges = [np.asarray(e, dtype=float) for e in edges]
+        self.values = np.ascontiguousarray(values, dtype=float)
+        self.error_stats = dict(error_stats or {})
+        self._flat_values = self.values.reshape(-1)
+        self._strides = [s // self.values.itemsize for s in self.values.strides]
+
+    def cell_index(self, X):
+        """Flat table index of each row. Inputs are rounded to float32 first, as sklearn does."""
+        X = np.asarray(X, dtype=np.float32).astype(float)
+        flat_index = np.zeros(X.shape[0], dtype=np.intp)
+        for j, edges in enumerate(self.edges):
+            # A tree sends x left when x <= threshold, so the cell is the count of thresholds below x
+            flat_index += np.searchsorted(edges, X[:, j], side='left') * self._strides[j]
+        return flat_index
+
+    def predict_matrix(self, X):
+        """Looked-up LAP_DELTA for an (n_rows, n_features) array."""
+        return self._flat_values[self.cell_index(np.atleast_2d(X))]
+
+    def predict(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = X[list(self.feature_names_in_)].to_numpy(dtype=float)
+        return self.predict_matrix(X)
+
+    def within_tolerance(self, tolerance=MAX_SURFACE_ERROR):
+        """True when the measured max error against the forest is at most `tolerance` seconds."""
+        return self.error_stats.get('max_abs_error', np.inf) <= tolerance
+
+    def save(self, path):
+        edges = {f'edges_{j}': e for j, e in enumerate(self.edges)}
+        np.savez(
+            path, feature_names=np.asarray(self.feature_names_in_, dtype=str), values=self.values,
+            error_keys=np.asarray(list(self.error_stats.keys()), dtype=str),
+            error_values=np.asarray(list(self.error_stats.values()), dtype=float), **edges
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            feature_names = list(data['feature_names'])
+            edges = [data[f'edges_{j}'] for j in range(len(feature_names))]
+            error_stats = dict(zip(data['error_keys'].tolist(), data['error_values'].tolist()))
+            return cls(feature_names, edges, data['values'], error_stats)
+
+
+def forest_thresholds(model):
+    """Sorted distinct split thresholds of every feature across all trees."""
+    if hasattr(model, 'split_thresholds'):
+        return model.split_thresholds()
+    n_features = len(model.feature_names_in_)
+    found = [[] for _ in range(n_features)]
+    for tree in model.estimators_:
+        internal = tree.tree_.feature >= 0
+        for j in range(n_features):
+            found[j].append(tree.tree_.threshold[internal & (tree.tree_.feature == j)])
+    return [np.unique(np.concatenate(f)) for f in found]
+
+
+def _thin_edges(edges, max_cells):
+    """Drops thresholds (keeping quantiles) from the densest axes until the table fits."""
+    edges = list(edges)
+    while np.prod([len(e) + 1 for e in edges]) > max_cells:
+        j = int(np.argmax([len(e) for e in edges]))
+        keep = max(1, len(edges[j]) // 2)
+        edges[j] = np.unique(np.quantile(edges[j], np.linspace(0, 1, keep)))
+    return edges
+
+
+def _cell_representatives(edges):
+    """A float32-exact input value inside every cell (x <= edge[k] and above edge[k-1])."""
+    if len(edges) == 0:
+        return np.zeros(1)
+    f32 = edges.astype(np.float32)
+    inner = np.where(f32.astype(float) > edges, np.nextafter(f32, np.float32(-np.inf)), f32)
+    last = np.nextafter(np.float32(edges[-1]), np.float32(np.inf))
+    return np.append(inner, last).astype(float)
+
+
+def measure_error(surface, model, X, n_random=ERROR_CHECK_POINTS, seed=0):
+    """Error of the surface against the forest on the training rows and on random in-range points."""
+    rng = np.random.default_rng(seed)
+    lows, highs = X.min(axis=0), X.max(axis=0)
+    random_rows = lows + rng.random((n_random, X.shape[1])) * (highs - lows)
+    check = np.vstack([X, random_rows])
+    forest = model.predict(pd.DataFrame(check, columns=model.feature_names_in_))
+    err = np.abs(surface.predict_matrix(check) - forest)
+    return {
+        'max_abs_error': float(err.max()), 'p99_abs_error': float(np.percentile(err, 99)),
+        'mean_abs_error': float(err.mean()), 'n_checked': float(len(err)),
+    }
+
+
+def build_surface(model, data, max_cells=MAX_SURFACE_CELLS):
+    """
+    Tabulates the model on every cell between its split thresholds, GRID_CHUNK_CELLS
+    cells per predict, then measures the error against the forest on `data`.
+    """
+    features = list(model.feature_names_in_)
+    edges = _thin_edges(forest_thresholds(model), max_cells)
+    axes = [_cell_representatives(e) for e in edges]
+
+    shape = [len(a) for a in axes]
+    values = np.empty(int(np.prod(shape)))
+    for start in range(0, values.size, GRID_CHUNK_CELLS):
+        # Cells in C order, the layout of the values table
+        index = np.unravel_index(np.arange(start, min(start + GRID_CHUNK_CELLS, values.size)), shape)
+        chunk = np.column_stack([a[i] for a, i in zip(axes, index)])
+        values[start:start + len(chunk)] = model.predict(pd.DataFrame(chunk, columns=features))
+    values = values.reshape(shape)
+
+    surface = DegradationSurface(features, edges, values)
+    X = data[features].dropna().to_numpy(dtype=float)
+    surface.error_stats = measure_error(surface, model, X)
+    return surface
+
+
+def build_and_save_surface(model, data, track_name):
+    surface = build_surface(model, data)
+    surface.save(surface_path(track_name))
+    stats = surface.error_stats
+    print(f"Degradation surface saved to {surface_path(track_name)} "
+          f"({surface.values.size} cells) - error vs forest: "
+          f"max {stats['max_abs_error']:.4f}s, p99 {stats['p99_abs_error']:.4f}s, mean {stats['mean_abs_error']:.4f}s")
+    if not surface.within_tolerance():
+        print(f"Warning: the table was thinned and exceeds the {MAX_SURFACE_ERROR}s tolerance; "
+              f"use the forest for {track_name}.")
+    return surface
+
+
+def load_or_build_surface(track_name, model, data, model_path=None):
+    """
+    Loads the stored surface, rebuilding it when missing, stale or built for other features.
+    A flat forest is swapped for the sklearn model in model_path for the rebuild (its
+    multi-core predict tabulates the grid faster).
+    """
+    path = surface_path(track_name)
+    model_path = model_path or f'processed_data/{track_name}/FINAL_model.pkl'
+    if os.path.exists(path):
+        stale = os.path.exists(model_path) and os.path.getmtime(path) < os.path.getmtime(model_path)
+        try:
+            surface = DegradationSurface.load(path)
+            if not stale and list(surface.feature_names_in_) == list(model.feature_names_in_):
+                return surface
+        except Exception:
+            pass
+    if not hasattr(model, 'estimators_') and os.path.exists(model_path):
+        import joblib
+        model = joblib.load(model_path)
+    return build_and_save_surface(model, data, track_name)
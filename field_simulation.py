@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from simulation import build_tire_trajectories, predict_batch
+
+# ===================================================================
+# --- WHOLE-FIELD RACE SIMULATOR ---
+# Projects the running order of every car over the next N laps for a
+# set of pit calls. The whole field x horizon is one tire-age matrix,
+# predicted with a single batched model call.
+# ===================================================================
+
+# positions/elapsed/lap_times are (n_cars, n_laps) arrays in snapshot row order;
+# summary is one row per car with start/final position and gap to the leader.
+FieldProjection = namedtuple('FieldProjection', ['cars', 'lap_times', 'elapsed', 'positions', 'summary'])
+
+
+def build_field_snapshot(df_race, lap_number):
+    """
+    State of every car still running at `lap_number` of one race (an R*_processed frame):
+    elapsed race time, position, gap to the leader, tire age, historical aggression
+    and base pace (BEST_LAP_TIME). The processed data only keeps clean green-flag laps,
+    so missing laps are filled with the car's median lap time.
+    """
+    df = df_race.dropna(subset=['LAP_TIME_SEC']).copy()
+    df['NUMBER'] = df['NUMBER'].astype(str)
+    running = df.groupby('NUMBER')['LAP_NUMBER'].max()
+    running = running[running >= lap_number].index
+    df = df[df['NUMBER'].isin(running)]
+    done = df[df['LAP_NUMBER'] <= lap_number]
+
+    per_car = done.groupby('NUMBER').agg(
+        LAPS_SEEN=('LAP_TIME_SEC', 'size'), TIME_SEEN=('LAP_TIME_SEC', 'sum'),
+        LAST_LAP=('LAP_NUMBER', 'max'), BASE_LAP=('BEST_LAP_TIME', 'first')
+    )
+    median_lap = df.groupby('NUMBER')['LAP_TIME_SEC'].median()
+    last_rows = done.sort_values('LAP_NUMBER').groupby('NUMBER').tail(1).set_index('NUMBER')
+    aggression = df.groupby('NUMBER')['avg_aggressiveness'].mean() if 'avg_aggressiveness' in df.columns else pd.Series(dtype=float)
+
+    snapshot = per_car.join(median_lap.rename('MEDIAN_LAP'))
+    snapshot['ELAPSED'] = snapshot['TIME_SEEN'] + (lap_number - snapshot['LAPS_SEEN']).clip(lower=0) * snapshot['MEDIAN_LAP']
+    snapshot['TIRE_AGE'] = last_rows['Laps_on_this_Tireset'] + (lap_number - snapshot['LAST_LAP'])
+    snapshot['AGGRESSION'] = aggression.reindex(snapshot.index)
+    snapshot['AGGRESSION'] = snapshot['AGGRESSION'].fillna(aggression.mean() if aggression.notna().any() else 0.0)
+    snapshot = snapshot.sort_values('ELAPSED')
+    snapshot['POSITION'] = np.arange(1, len(snapshot) + 1)
+    snapshot['GAP_TO_LEADER'] = snapshot['ELAPSED'] - snapshot['ELAPSED'].iloc[0]
+    return snapshot.reset_index()[['NUMBER', 'POSITION', 'GAP_TO_LEADER', 'ELAPSED', 'TIRE_AGE', 'AGGRESSION', 'BASE_LAP']]
+
+
+def simulate_field(model, snapshot, n_laps, track_temp, pit_calls=None, pit_cost=36.0):
+    """
+    Projects the field over the next n_laps. pit_calls maps car NUMBER -> relative
+    pit lap (1-based); cars not listed stay out.
+    """
+    pit_calls = pit_calls or {}
+    cars = snapshot['NUMBER'].astype(str).to_numpy()
+    pit_laps = np.array([int(pit_calls.get(car, 0)) for car in cars])
+
+    tire_ages = build_tire_trajectories(snapshot['TIRE_AGE'].to_numpy(dtype=int), n_laps, pit_laps)
+    deltas = predict_batch(model, tire_ages, track_temp, snapshot['AGGRESSION'].to_numpy(dtype=float)[:, None])
+    lap = np.arange(1, n_laps + 1)
+    lap_times = snapshot['BASE_LAP'].to_numpy(dtype=float)[:, None] + deltas + np.where(lap == pit_laps[:, None], pit_cost, 0.0)
+
+    elapsed = snapshot['ELAPSED'].to_numpy(dtype=float)[:, None] + np.cumsum(lap_times, axis=1)
+    # Rank of every car on every lap (1 = leader)
+    positions = np.empty_like(elapsed, dtype=int)
+    order = np.argsort(elapsed, axis=0, kind='stable')
+    positions[order, np.arange(n_laps)] = np.arange(1, len(cars) + 1)[:, None]
+
+    summary = pd.DataFrame({
+        'NUMBER': cars,
+        'START_POS': snapshot['POSITION'].to_numpy(),
+        'FINAL_POS': positions[:, -1],
+        'PIT_LAP': np.where(pit_laps > 0, pit_laps, 0),
+        'GAP_TO_LEADER': elapsed[:, -1] - elapsed[:, -1].min(),
+    })
+    summary['POS_CHANGE'] = summary['START_POS'] - summary['FINAL_POS']
+    summary = summary.sort_values('FINAL_POS').reset_index(drop=True)
+    return FieldProjection(cars, lap_times, elapsed, positions, summary)
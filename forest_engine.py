@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+import os
+import json
+import threading
+from bisect import bisect_left
+
+# ===================================================================
+# --- FLAT FOREST ENGINE ---
+# All trees of a fitted RandomForestRegressor in contiguous node arrays
+# (feature, threshold, next state, leaf value), with the internal nodes of
+# every tree sorted by (feature, threshold). For one row, the nodes that
+# send it right are then one block per feature - a few binary searches
+# find them, and a per-thread successor array is patched only where the
+# row differs from the previous one, so each tree level costs one array
+# lookup for all trees together. Batches walk every (tree, cell) pair at once, where a
+# cell is a box between consecutive split thresholds (rows in the same
+# cell reach the same leaves, so each distinct cell is walked once).
+# Predictions match sklearn's predict exactly. The arrays are saved as
+# .npy files that load memory-mapped and are used as they are.
+# ===================================================================
+
+ARRAY_NAMES = ('feature', 'threshold', 'next_state', 'value', 'roots')
+STRUCTURE_FILE = 'forest.json'
+# Tree levels walked between checks for (tree, row) pairs that already reached a leaf
+LEAF_CHECK_LEVELS = 3
+# Cells walked together in a batch (keeps the per-pair arrays cache-sized)
+BATCH_CELLS = 256
+# Cells predicted per block: the (n_trees, cells) leaf and value arrays never exceed this width
+PREDICT_BLOCK_CELLS = 65536
+
+
+class FlatForest:
+    """
+    Flat-array copy of a RandomForestRegressor.
+    Nodes [0, n_internal) are the internal nodes of all trees sorted by
+    (feature, threshold); the leaves follow. A walk is at state 2k on node k
+    and steps to next_state[2k] (left child) or next_state[2k + 1] (right
+    child). A leaf is its own child on both sides, so a walk can keep
+    stepping until every tree has reached a leaf.
+    Nothing is derived from the arrays up front, so a memory-mapped forest
+    is ready as soon as it is opened.
+    """
+
+    def __init__(self, feature_names, feature, threshold, next_state, value, roots, n_internal, max_depth):
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=float)
+        self.next_state = np.asarray(next_state, dtype=np.intp)
+        self.value = np.asarray(value, dtype=float)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.n_internal = int(n_internal)
+        self.max_depth = int(max_depth)
+
+        self._root_states = 2 * self.roots
+        n_features = len(self.feature_names_in_)
+        self._block_start = np.searchsorted(self.feature[:self.n_internal], np.arange(n_features + 1))
+        self._blocks = [self.threshold[a:b] for a, b in zip(self._block_start[:-1], self._block_start[1:])]
+        self._block_lists = None # Python copies of the blocks for bisect, made on the first single-row call
+        self._row_walkers = threading.local()
+
+    @classmethod
+    def from_model(cls, model):
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left < 0
+            feature.append(np.where(is_leaf, -1, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            value.append(tree.value.reshape(tree.node_count, -1)[:, 0])
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+        feature, threshold = np.concatenate(feature), np.concatenate(threshold)
+        left, right = np.concatenate(left), np.concatenate(right)
+        is_leaf = feature < 0
+
+        # Internal nodes by (feature, threshold), then the leaves in tree order
+        n_features = len(model.feature_names_in_)
+        order = np.lexsort((threshold, np.where(is_leaf, n_features, feature)))
+        new_id = np.empty(offset, dtype=np.intp)
+        new_id[order] = np.arange(offset)
+        leaf = is_leaf[order]
+        own = np.arange(offset)
+        next_state = 2 * np.column_stack([
+            np.where(leaf, own, new_id[left[order]]), np.where(leaf, own, new_id[right[order]])
+        ]).reshape(-1)
+        return cls(
+            model.feature_names_in_, np.where(leaf, 0, feature[order]), threshold[order], next_state,
+            np.concatenate(value)[order], new_id[np.asarray(roots)], np.count_nonzero(~is_leaf), max_depth
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def split_thresholds(self):
+        """Sorted distinct split thresholds of every feature across all trees."""
+        return [np.unique(block) for block in self._blocks]
+
+    def _as_matrix(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = X[list(self.feature_names_in_)].to_numpy()
+        # sklearn evaluates splits on float32 inputs
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        # sklearn routes missing values by training statistics this copy does not keep
+        if np.isnan(X).any():
+            raise ValueError("Input X contains NaN.")
+        return X
+
+    def _row_walker(self):
+        """
+        This thread's successor array: successor[k] is the child of node k the
+        current row goes to (leaves point to themselves), with the per-feature
+        ranks it was built for. Starts as 'every node goes left' (all ranks 0).
+        """
+        walker = self._row_walkers.__dict__
+        if not walker:
+            if self._block_lists is None:
+                self._block_lists = [block.tolist() for block in self._blocks]
+            walker['left'] = self.next_state[0::2] >> 1
+            walker['right'] = self.next_state[1::2] >> 1
+            walker['successor'] = walker['left'].copy()
+            walker['ranks'] = [0] * len(self._blocks)
+        return walker
+
+    def _walk_row(self, x):
+        """Leaf node of one float32 row in every tree: (n_trees,)."""
+        walker = self._row_walker()
+        successor, ranks, left, right = walker['successor'], walker['ranks'], walker['left'], walker['right']
+        for j, (start, block, value) in enumerate(zip(self._block_start, self._block_lists, x.tolist())):
+            # x > threshold for the first bisect_left(...) nodes of the feature's block
+            rank, old = bisect_left(block, value), ranks[j]
+            if rank > old: successor[start + old:start + rank] = right[start + old:start + rank]
+            elif rank < old: successor[start + rank:start + old] = left[start + rank:start + old]
+            ranks[j] = rank
+        node, internal = self.roots, self.n_internal
+        for level in range(self.max_depth):
+            node = successor[node]
+            if level % LEAF_CHECK_LEVELS == LEAF_CHECK_LEVELS - 1 and node.min() >= internal:
+                break
+        return node
+
+    def _ranks(self, X):
+        """Number of split thresholds of each feature below each value: a row goes right at exactly those nodes."""
+        ranks = np.empty(X.shape, dtype=np.intp)
+        for j, block in enumerate(self._blocks):
+            ranks[:, j] = np.searchsorted(block, X[:, j], side='left')
+        return ranks
+
+    def _distinct_cells(self, X):
+        """
+        Ranks of the distinct cells between split thresholds in X, and the cell of
+        every row. Rows in the same cell reach the same leaves in every tree.
+        """
+        ranks = self._ranks(X)
+        sizes = [len(block) + 1 for block in self._blocks]
+        if np.prod(sizes, dtype=float) < 2**62:
+            strides = np.cumprod([1] + sizes[:-1], dtype=np.int64)
+            _, first, inverse = np.unique(ranks @ strides, return_index=True, return_inverse=True)
+            return ranks[first], inverse.reshape(-1)
+        cells, inverse = np.unique(ranks, axis=0, return_inverse=True)
+        return cells, inverse.reshape(-1)
+
+    def _walk_batch(self, ranks):
+        """Leaf state of every (tree, cell) pair: (n_trees, n_cells)."""
+        n_cells, n_features = ranks.shape
+        # The nodes sending cell i right are the states below right_end[i, j] in block j
+        right_end = (2 * (self._block_start[:-1] + ranks)).reshape(-1)
+
+        state = np.repeat(self._root_states, n_cells)
+        row_offset = np.tile(np.arange(n_cells) * n_features, self.n_trees)
+        leaves, pending = np.empty_like(state), np.arange(len(state))
+        internal = 2 * self.n_internal
+        for level in range(self.max_depth):
+            went_right = state < right_end[row_offset + self.feature[state >> 1]]
+            state = self.next_state[state + went_right]
+            if level % LEAF_CHECK_LEVELS == LEAF_CHECK_LEVELS - 1:
+                # Drop the pairs that reached a leaf, so deep trees don't carry the whole batch
+                done = state >= internal
+                leaves[pending[done]] = state[done]
+                pending, state, row_offset = pending[~done], state[~done], row_offset[~done]
+                if not len(pending): break
+        leaves[pending] = state
+        return leaves.reshape(self.n_trees, n_cells)
+
+    def _walk_cells(self, cells):
+        walks = [self._walk_batch(cells[start:start + BATCH_CELLS]) for start in range(0, len(cells), BATCH_CELLS)]
+        return np.hstack(walks) if walks else np.empty((self.n_trees, 0), dtype=np.intp)
+
+    def _forest_mean(self, per_tree):
+        """Mean over trees, summed tree by tree in sklearn's order (cumsum is sequential)."""
+        return np.cumsum(per_tree, axis=0)[-1] / self.n_trees
+
+    def apply(self, X):
+        """Leaf node (global index) reached by every row in every tree: (n_trees, n_rows)."""
+        X = self._as_matrix(X)
+        if X.shape[0] == 1:
+            return self._walk_row(X[0])[:, None]
+        cells, inverse = self._distinct_cells(X)
+        return self._walk_cells(cells)[:, inverse] >> 1
+
+    def predict_per_tree(self, X):
+        """Every tree's prediction for every row: (n_trees, n_rows)."""
+        return self.value[self.apply(X)]
+
+    def predict_matrix(self, X):
+        """Forest mean for an (n_rows, n_features) array, walking each distinct cell once (in blocks)."""
+        X = self._as_matrix(X)
+        if X.shape[0] == 1:
+            return self._forest_mean(self.value[self._walk_row(X[0])])[None]
+        cells, inverse = self._distinct_cells(X)
+        means = np.empty(len(cells))
+        for start in range(0, len(cells), PREDICT_BLOCK_CELLS):
+            block = cells[start:start + PREDICT_BLOCK_CELLS]
+            means[start:start + len(block)] = self._forest_mean(self.value[self._walk_cells(block) >> 1])
+        return means[inverse]
+
+    def predict(self, X):
+        return self.predict_matrix(X)
+
+    def save(self, directory):
+        """One .npy file per array (loadable memory-mapped) plus the feature names and sizes."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, STRUCTURE_FILE), 'w') as f:
+            json.dump({
+                'feature_names': [str(n) for n in self.feature_names_in_],
+                'n_internal': self.n_internal, 'max_depth': self.max_depth,
+            }, f, indent=1)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Opens a saved forest; with mmap_mode the arrays stay on disk, shared by every process reading them."""
+        with open(os.path.join(directory, STRUCTURE_FILE)) as f:
+            structure = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        return cls(structure['feature_names'], n_internal=structure['n_internal'], max_depth=structure['max_depth'], **arrays)
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES)
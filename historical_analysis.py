@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from degradation_rates import ols_coefficients
+
+# ===================================================================
+# --- HISTORICAL ANALYSIS FIGURES ---
+# Figures for the Historical Analysis tab, built once and cached by the
+# app per (track, driver). Sector trendlines are drawn from the track's
+# precomputed degradation rate table (degradation_rates.py) instead of
+# one statsmodels fit per figure. Scatters above WEBGL_MIN_POINTS render
+# with WebGL, and above MAX_SCATTER_POINTS they are downsampled on the
+# server, keeping each tire age's extremes.
+# The season view plots per-track medians rather than raw laps.
+# ===================================================================
+
+SECTORS = ['S1', 'S2', 'S3']
+X_COLUMN = 'Laps_on_this_Tireset'
+WEBGL_MIN_POINTS = 1000
+MAX_SCATTER_POINTS = 5000
+# Tire ages with fewer laps than this are left out of the season medians
+MIN_LAPS_PER_POINT = 3
+LABELS = {
+    'Laps_on_this_Tireset': 'Tire Age (Laps)',
+    'LAP_DELTA': 'Time Loss (s)',
+    'avg_aggressiveness': 'Driver Aggression (Lat-G)',
+    'TRACK_TEMP': 'Track Temp (°C)',
+}
+
+
+# --- Scatter Rendering ---
+
+def downsample(df, y, max_points=MAX_SCATTER_POINTS, by=X_COLUMN, seed=0):
+    """At most ~max_points rows, sampled evenly across `by`, always keeping each group's min and max of y."""
+    if len(df) <= max_points:
+        return df
+    keep = np.random.default_rng(seed).random(len(df)) < max_points / len(df)
+    valid = df.dropna(subset=[y])
+    extremes = pd.Index(valid.groupby(by)[y].idxmin()).union(pd.Index(valid.groupby(by)[y].idxmax()))
+    positions = df.index.get_indexer(extremes)
+    keep[positions[positions >= 0]] = True
+    return df[keep]
+
+def render_mode(n_points):
+    return 'webgl' if n_points > WEBGL_MIN_POINTS else 'svg'
+
+def degradation_overview_figure(df, track_name, color_var=None, max_points=MAX_SCATTER_POINTS):
+    """Every lap's LAP_DELTA against tire age (downsampled beyond max_points)."""
+    data = df.reset_index(drop=True)
+    shown = downsample(data, 'LAP_DELTA', max_points)
+    title = f'Tire Degradation Overview ({track_name})'
+    if len(shown) < len(data):
+        title += f' - {len(shown):,} of {len(data):,} laps'
+    return px.scatter(
+        shown, x=X_COLUMN, y='LAP_DELTA', color=color_var, title=title,
+        labels=LABELS, render_mode=render_mode(len(shown))
+    )
+
+def sector_figure(df_driver, sector, trendlines, driver):
+    """One driver's sector deltas against tire age, with its OLS trendline from `trendlines` (indexed by NUMBER, SECTOR)."""
+    y = f'{sector}_DELTA'
+    fig = px.scatter(
+        df_driver, x=X_COLUMN, y=y, render_mode=render_mode(len(df_driver)),
+        labels={X_COLUMN: 'Laps', y: f'Delta {sector} (s)'}
+    )
+    if (driver, sector) in trendlines.index:
+        fit = trendlines.loc[(driver, sector)]
+        if pd.notna(fit['slope']):
+            x = np.array([df_driver[X_COLUMN].min(), df_driver[X_COLUMN].max()], dtype=float)
+            fig.add_scatter(
+                x=x, y=fit['intercept'] + fit['slope'] * x, mode='lines', showlegend=False,
+                name=f"OLS: {fit['slope']:+.3f} s/lap (R2 {fit['r2']:.2f})"
+            )
+    return fig
+
+
+# --- Season View ---
+
+def season_medians(data_by_track, min_laps=MIN_LAPS_PER_POINT):
+    """Median LAP_DELTA and lap count per (track, tire age) across all tracks."""
+    frames = [df[[X_COLUMN, 'LAP_DELTA']].assign(track=track) for track, df in data_by_track.items() if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=['track', X_COLUMN, 'LAP_DELTA', 'laps'])
+    laps = pd.concat(frames, ignore_index=True).dropna()
+    medians = laps.groupby(['track', X_COLUMN])['LAP_DELTA'].agg(['median', 'size']).reset_index()
+    medians = medians.rename(columns={'median': 'LAP_DELTA', 'size': 'laps'})
+    return medians[medians['laps'] >= min_laps]
+
+def season_degradation_rates(data_by_track):
+    """Season-wide OLS degradation rate (s per lap of tire age) of every track."""
+    frames = [df[[X_COLUMN, 'LAP_DELTA']].assign(track=track) for track, df in data_by_track.items() if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=['slope', 'intercept', 'r2', 'n'])
+    return ols_coefficients(pd.concat(frames, ignore_index=True), X_COLUMN, 'LAP_DELTA', ['track'])
+
+def season_figure(data_by_track):
+    """Median time loss against tire age, one line per track."""
+    medians = season_medians(data_by_track)
+    return px.line(
+        medians, x=X_COLUMN, y='LAP_DELTA', color='track', markers=True,
+        hover_data={'laps': True}, title='Season View: Median Degradation by Track',
+        labels={**LABELS, 'LAP_DELTA': 'Median Time Loss (s)'}
+    )
@@ -0,0 +1,157 @@
+import sys
+import time
+import bisect
+import numpy as np
+import pandas as pd
+import process_data as pdp
+
+# ===================================================================
+# --- INCREMENTAL LAP TIMING ---
+# The values of process_data.add_lap_timing (BEST_LAP_TIME / BEST_S*,
+# LAP_DELTA / S*_DELTA, STINT_ID, Laps_on_this_Tireset) kept up to date
+# as laps arrive one at a time from timing. A lap costs O(1); only when it
+# sets a new personal best (lap or sector), or arrives out of order, are
+# that car's earlier laps re-based.
+# Usage: python lap_timing.py  (replays the race configured in process_data.py
+#        lap by lap and checks the result against the batch processing)
+# ===================================================================
+
+# Columns the engine adds to every kept lap
+TIMING_COLUMNS = (
+    list(pdp.TIME_COLUMNS.values()) + list(pdp.BEST_COLUMNS.values()) + list(pdp.DELTA_COLUMNS.values())
+    + ['CROSSING_FINISH_LINE_IN_PIT', 'STINT_ID', 'Laps_on_this_Tireset']
+)
+
+
+def is_missing(value):
+    return value is None or pd.isna(value)
+
+def pit_flag(value):
+    """CROSSING_FINISH_LINE_IN_PIT as an int, like to_numeric(errors='coerce').fillna(0).astype(int)."""
+    if is_missing(value): return 0
+    value = pd.to_numeric(value, errors='coerce')
+    return 0 if pd.isna(value) else int(value)
+
+
+class CarTiming:
+    """State of one car: its bests and its green-flag laps in LAP_NUMBER order."""
+
+    def __init__(self):
+        self.best = dict.fromkeys(pdp.BEST_COLUMNS, np.nan)
+        self.laps = []          # every green-flag lap (dicts), sorted by LAP_NUMBER then arrival
+        self.lap_numbers = []
+        self.kept = []          # laps that pass the filters, in the same order
+        self.stint_laps = {}    # STINT_ID -> laps counted so far
+
+    def update_bests(self, lap):
+        """Folds the lap's times into the bests. Returns True if any best changed."""
+        changed = False
+        for sec_col in pdp.BEST_COLUMNS:
+            value = lap[sec_col]
+            if not is_missing(value) and not value >= self.best[sec_col]: # NaN best: first time
+                self.best[sec_col] = value
+                changed = True
+        return changed
+
+    def time_lap(self, lap):
+        """Sets the lap's bests and deltas. Returns True if the lap passes the batch filters."""
+        for sec_col, best_col in pdp.BEST_COLUMNS.items():
+            lap[best_col] = self.best[sec_col]
+            seconds = lap[sec_col]
+            lap[pdp.DELTA_COLUMNS[sec_col]] = np.nan if is_missing(seconds) else seconds - self.best[sec_col]
+        if any(is_missing(lap.get(col)) for col in pdp.REQUIRED_COLUMNS):
+            return False
+        return 0 <= lap['LAP_DELTA'] < pdp.MAX_LAP_DELTA
+
+    def add_kept(self, lap):
+        """Stint of a kept lap: a pit crossing on the previous kept lap starts a new one."""
+        previous = self.kept[-1] if self.kept else None
+        stint_id = previous['STINT_ID'] + previous['CROSSING_FINISH_LINE_IN_PIT'] if previous else 0
+        self.stint_laps[stint_id] = self.stint_laps.get(stint_id, 0) + 1
+        lap['STINT_ID'] = stint_id
+        lap['Laps_on_this_Tireset'] = self.stint_laps[stint_id]
+        self.kept.append(lap)
+
+    def rebase(self):
+        """Recomputes every lap against the current bests."""
+        self.kept, self.stint_laps = [], {}
+        for lap in self.laps:
+            if self.time_lap(lap):
+                self.add_kept(lap)
+
+
+class LapTimingEngine:
+    """
+    Per-car lap timing updated one lap at a time. add_lap() takes a laps-file row
+    (a dict with NUMBER, LAP_NUMBER, LAP_TIME, S1-S3, FLAG_AT_FL,
+    CROSSING_FINISH_LINE_IN_PIT and TRACK_TEMP; other keys are carried along).
+    """
+
+    def __init__(self):
+        self.cars = {}
+
+    def add_lap(self, row):
+        """
+        Returns (changed laps, rebased). Normally the changed laps are just the new
+        lap (or nothing if it is filtered out); when the car was re-based they are
+        all of its kept laps, replacing whatever was published for it before.
+        """
+        if row.get('FLAG_AT_FL') != 'GF' or is_missing(row.get('NUMBER')):
+            return [], False # Only green-flag laps count, as in the batch
+        lap = dict(row)
+        for raw_col, sec_col in pdp.TIME_COLUMNS.items():
+            lap[sec_col] = pdp.convert_time_to_seconds(lap.get(raw_col))
+        lap['CROSSING_FINISH_LINE_IN_PIT'] = pit_flag(lap.get('CROSSING_FINISH_LINE_IN_PIT'))
+
+        car = self.cars.setdefault(lap['NUMBER'], CarTiming())
+        position = bisect.bisect_right(car.lap_numbers, lap['LAP_NUMBER'])
+        car.laps.insert(position, lap)
+        car.lap_numbers.insert(position, lap['LAP_NUMBER'])
+        new_best = car.update_bests(lap)
+
+        if new_best or position < len(car.laps) - 1:
+            car.rebase()
+            return list(car.kept), True
+        if car.time_lap(lap):
+            car.add_kept(lap)
+            return [lap], False
+        return [], False
+
+    def table(self):
+        """Every kept lap like add_lap_timing's output: sorted by NUMBER, LAP_NUMBER, NUMBER as str."""
+        laps = [lap for number in sorted(self.cars) for lap in self.cars[number].kept]
+        df = pd.DataFrame(laps)
+        if not df.empty:
+            df['NUMBER'] = df['NUMBER'].astype(str)
+        return df
+
+
+def replay_laps(df_laps, engine=None):
+    """Feeds the laps to the engine one at a time (in the given order). Returns the engine and seconds per lap."""
+    engine = engine or LapTimingEngine()
+    rows = df_laps.to_dict('records')
+    start = time.perf_counter()
+    for row in rows:
+        engine.add_lap(row)
+    return engine, (time.perf_counter() - start) / max(len(rows), 1)
+
+
+if __name__ == '__main__':
+    print(f"Replaying laps of {pdp.TRACK_NAME_OUT} - {pdp.RACE_NUM_OUT} one at a time...")
+    df = pdp.load_laps_with_weather(pdp.LAPS_FILE_PATH, pdp.WEATHER_FILE_PATH, pdp.RACE_DATE_STR, pdp.TRACK_TIMEZONE)
+    engine, seconds_per_lap = replay_laps(df)
+    live = engine.table()
+    batch = pdp.add_lap_timing(df.copy())
+
+    columns = ['NUMBER', 'LAP_NUMBER'] + TIMING_COLUMNS
+    if live.empty or batch.empty:
+        print("Error: no laps left after filtering."); sys.exit()
+    identical = len(live) == len(batch) and all(
+        np.array_equal(live[col].to_numpy(dtype=object if col == 'NUMBER' else float),
+                       batch[col].to_numpy(dtype=object if col == 'NUMBER' else float), equal_nan=col != 'NUMBER')
+        for col in columns
+    )
+    print("---")
+    print(f"{len(df)} laps in {seconds_per_lap * 1e6:.0f} us/lap; {len(live)} kept. Identical to batch: {identical}")
+    if not identical:
+        sys.exit(1)
@@ -0,0 +1,476 @@
+import io
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+from lap_timing import LapTimingEngine
+
+# ===================================================================
+# --- LIVE INGEST SERVER ---
+# Accepts timing-loop, ECU and weather messages over TCP and UDP (same
+# port) and keeps the last laps and samples of every car in fixed-size
+# numpy ring buffers. Messages are comma-separated lines:
+#   L,<NUMBER>,<LAP_NUMBER>,<LAP_TIME>,<S1>,<S2>,<S3>,<FLAG_AT_FL>,<CROSSING_FINISH_LINE_IN_PIT>
+#   S,<NUMBER>,<lap>,<timestamp ms>,<telemetry_name>,<telemetry_value>
+#   W,<AIR_TEMP>,<TRACK_TEMP>,<HUMIDITY>,<RAIN>
+# Laps go through lap_timing.LapTimingEngine (deltas, stints, tire age).
+# Samples are buffered and parsed in bulk. A TCP client sending
+# "SNAPSHOT [NUMBER|*] [n_samples]" gets one JSON line back.
+# Usage:
+#   python live_ingest.py serve [--port 9750]
+#   python live_ingest.py replay --telemetry FILE.csv [--format LONG] [--rate 20000]
+#   python live_ingest.py replay --laps LAPS.CSV [--rate 2]
+#   python live_ingest.py snapshot [--car 13]
+# ===================================================================
+
+HOST = '127.0.0.1'
+PORT = 9750
+LAPS_PER_CAR = 64
+SAMPLES_PER_CAR = 120_000
+# Samples are parsed once this many bytes are pending, or FLUSH_SECONDS after the first one
+FLUSH_BYTES = 256 * 1024
+FLUSH_SECONDS = 0.01
+SNAPSHOT_SAMPLES = 1000
+UDP_DATAGRAM_BYTES = 60_000
+# Larger kernel receive buffer so bursts of datagrams are not dropped while a block is parsed
+UDP_RECEIVE_BUFFER = 8 * 1024 * 1024
+
+SAMPLE_DTYPE = np.dtype([('timestamp', 'i8'), ('lap', 'i4'), ('channel', 'i2'), ('value', 'f8')])
+LAP_FIELDS = [
+    'LAP_NUMBER', 'LAP_TIME_SEC', 'S1_SEC', 'S2_SEC', 'S3_SEC', 'LAP_DELTA', 'S1_DELTA', 'S2_DELTA', 'S3_DELTA',
+    'STINT_ID', 'Laps_on_this_Tireset', 'TRACK_TEMP',
+]
+LAP_DTYPE = np.dtype([(name, 'i4' if name in ('LAP_NUMBER', 'STINT_ID', 'Laps_on_this_Tireset') else 'f8') for name in LAP_FIELDS])
+LAP_MESSAGE_FIELDS = ['NUMBER', 'LAP_NUMBER', 'LAP_TIME', 'S1', 'S2', 'S3', 'FLAG_AT_FL', 'CROSSING_FINISH_LINE_IN_PIT']
+WEATHER_FIELDS = ['AIR_TEMP', 'TRACK_TEMP', 'HUMIDITY', 'RAIN']
+SAMPLE_SCHEMA = pa.schema([
+    ('kind', pa.string()), ('NUMBER', pa.string()), ('lap', pa.int32()),
+    ('timestamp', pa.int64()), ('telemetry_name', pa.string()), ('telemetry_value', pa.float64()),
+])
+
+
+def parse_samples(data):
+    """
+    S lines as a table with SAMPLE_SCHEMA. Lines with the wrong number of fields
+    are dropped; unparsable numbers become nulls (the fast typed parse is retried
+    in pandas only when a block has one).
+    """
+    try:
+        return pacsv.read_csv(
+            io.BytesIO(data),
+            read_options=pacsv.ReadOptions(column_names=SAMPLE_SCHEMA.names),
+            parse_options=pacsv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+            convert_options=pacsv.ConvertOptions(column_types=SAMPLE_SCHEMA, strings_can_be_null=False),
+        )
+    except pa.ArrowInvalid:
+        df = pd.read_csv(io.BytesIO(data), names=SAMPLE_SCHEMA.names, dtype=str, keep_default_na=False, on_bad_lines='skip')
+        for col in ('lap', 'timestamp', 'telemetry_value'):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        for col, dtype in (('lap', 'Int32'), ('timestamp', 'Int64')):
+            df[col] = df[col].where(df[col] % 1 == 0).astype(dtype)
+        return pa.Table.from_pandas(df, schema=SAMPLE_SCHEMA, preserve_index=False)
+
+
+class RingBuffer:
+    """Fixed-capacity, array-backed buffer of records that overwrites the oldest ones."""
+
+    def __init__(self, capacity, dtype):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.head = 0 # Next write position
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.head = self.size = 0
+
+    def extend(self, records):
+        n = len(records)
+        if n >= self.capacity:
+            self.data[:] = records[n - self.capacity:]
+            self.head, self.size = 0, self.capacity
+            return
+        end = self.head + n
+        if end <= self.capacity:
+            self.data[self.head:end] = records
+        else:
+            split = self.capacity - self.head
+            self.data[self.head:] = records[:split]
+            self.data[:n - split] = records[split:]
+        self.head = end % self.capacity
+        self.size = min(self.capacity, self.size + n)
+
+    def snapshot(self, last=None):
+        """Copy of the newest `last` records (all by default), oldest first."""
+        n = self.size if last is None else min(last, self.size)
+        start = (self.head - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.data[start:start + n].copy()
+        return np.concatenate([self.data[start:], self.data[:start + n - self.capacity]])
+
+
+class CarBuffers:
+    def __init__(self, laps_per_car, samples_per_car):
+        self.laps = RingBuffer(laps_per_car, LAP_DTYPE)
+        self.samples = RingBuffer(samples_per_car, SAMPLE_DTYPE)
+
+
+def normalize_number(value):
+    """'013' and '13' are the same car."""
+    value = value.strip()
+    try: return str(int(value))
+    except ValueError: return value
+
+
+class IngestServer:
+    """Message handling and buffers; the asyncio protocols below only feed it bytes."""
+
+    def __init__(self, laps_per_car=LAPS_PER_CAR, samples_per_car=SAMPLES_PER_CAR):
+        self.laps_per_car, self.samples_per_car = laps_per_car, samples_per_car
+        self.cars = {}
+        self.channels = {}       # telemetry_name -> code stored in the sample buffers
+        self.channel_names = []
+        self.engine = LapTimingEngine()
+        self.weather = {field: np.nan for field in WEATHER_FIELDS}
+        self.counts = {'samples': 0, 'laps': 0, 'weather': 0, 'bad': 0}
+        self._pending, self._pending_bytes = [], 0
+        self._flush_handle = None
+
+    def car(self, number):
+        buffers = self.cars.get(number)
+        if buffers is None:
+            buffers = self.cars[number] = CarBuffers(self.laps_per_car, self.samples_per_car)
+        return buffers
+
+    def channel_code(self, name):
+        code = self.channels.get(name)
+        if code is None:
+            code = self.channels[name] = len(self.channel_names)
+            self.channel_names.append(name)
+        return code
+
+    # --- Messages ---
+
+    def feed(self, data):
+        """Handles a block of complete message lines."""
+        # Fast path: a block of samples only is queued as it is
+        if data[:1] == b'S' and b'\nL' not in data and b'\nW' not in data:
+            self._queue_samples(data)
+            return
+        samples = []
+        for line in data.split(b'\n'):
+            kind = line[:1]
+            if kind == b'S': samples.append(line)
+            elif kind == b'L': self.handle_lap(line)
+            elif kind == b'W': self.handle_weather(line)
+            elif line.strip(): self.counts['bad'] += 1
+        if samples:
+            self._queue_samples(b'\n'.join(samples))
+
+    def handle_lap(self, line):
+        fields = line.decode(errors='replace').rstrip('\r').split(',')[1:]
+        if len(fields) != len(LAP_MESSAGE_FIELDS):
+            self.counts['bad'] += 1; return
+        row = dict(zip(LAP_MESSAGE_FIELDS, fields))
+        try:
+            row['LAP_NUMBER'] = int(row['LAP_NUMBER'])
+        except ValueError:
+            self.counts['bad'] += 1; return
+        row['NUMBER'] = normalize_number(row['NUMBER'])
+        row['FLAG_AT_FL'] = row['FLAG_AT_FL'].strip()
+        # Latest weather reading; no reading yet counts as 0, like the batch's fillna(0)
+        row.update(self.weather)
+        if pd.isna(row['TRACK_TEMP']): row['TRACK_TEMP'] = 0
+        self.counts['laps'] += 1
+
+        laps, rebased = self.engine.add_lap(row)
+        buffers = self.car(row['NUMBER'])
+        if rebased:
+            buffers.laps.clear()
+            laps = laps[-self.laps_per_car:]
+        if laps:
+            records = np.zeros(len(laps), dtype=LAP_DTYPE)
+            for name in LAP_FIELDS:
+                records[name] = [lap[name] for lap in laps]
+            buffers.laps.extend(records)
+
+    def handle_weather(self, line):
+        fields = line.decode(errors='replace').split(',')[1:]
+        try:
+            values = [float(v) if v.strip() else np.nan for v in fields]
+        except ValueError:
+            self.counts['bad'] += 1; return
+        if len(values) != len(WEATHER_FIELDS):
+            self.counts['bad'] += 1; return
+        # Missing fields keep their last reading (the batch ffills)
+        for field, value in zip(WEATHER_FIELDS, values):
+            if not np.isnan(value): self.weather[field] = value
+        self.counts['weather'] += 1
+
+    # --- Samples ---
+
+    def _queue_samples(self, data):
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= FLUSH_BYTES:
+            self.flush()
+        elif self._flush_handle is None:
+            try:
+                self._flush_handle = asyncio.get_running_loop().call_later(FLUSH_SECONDS, self.flush)
+            except RuntimeError: # Fed outside an event loop: parsed by flush() or the next snapshot()
+                pass
+
+    def flush(self):
+        """Parses all pending sample lines in one pass and appends them to the cars' ring buffers."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        data = b'\n'.join(self._pending)
+        self._pending, self._pending_bytes = [], 0
+
+        table = parse_samples(data)
+        # The fast path in feed() queues whole blocks, so lines of other kinds can still be here
+        valid = pc.and_(pc.equal(table['kind'], 'S'), pc.and_(pc.is_valid(table['timestamp']), pc.not_equal(table['NUMBER'], '')))
+        valid = pc.fill_null(valid, False)
+        table = table.filter(valid)
+        self.counts['bad'] += len(valid) - table.num_rows
+        n = table.num_rows
+        if n == 0:
+            return
+
+        records = np.empty(n, dtype=SAMPLE_DTYPE)
+        records['timestamp'] = table['timestamp'].to_numpy()
+        records['lap'] = pc.fill_null(table['lap'], -1).to_numpy()
+        records['value'] = pc.fill_null(table['telemetry_value'], np.nan).to_numpy()
+        names = pc.dictionary_encode(table['telemetry_name']).combine_chunks()
+        codes = np.array([self.channel_code(name) for name in names.dictionary.to_pylist()], dtype=np.int16)
+        records['channel'] = codes[names.indices.to_numpy()]
+
+        numbers = pc.dictionary_encode(table['NUMBER']).combine_chunks()
+        # Grouped by the normalized number, so '013' and '13' in one block stay one car in arrival order
+        car_numbers, car_of_entry = np.unique([normalize_number(n) for n in numbers.dictionary.to_pylist()], return_inverse=True)
+        car_numbers = car_numbers.tolist()
+        car_index = car_of_entry.reshape(-1)[numbers.indices.to_numpy()]
+        if len(car_numbers) == 1:
+            self.car(car_numbers[0]).samples.extend(records)
+        else:
+            # Stable grouping keeps every car's samples in arrival order
+            order = np.argsort(car_index, kind='stable')
+            bounds = np.searchsorted(car_index[order], np.arange(len(car_numbers) + 1))
+            for i, number in enumerate(car_numbers):
+                self.car(number).samples.extend(records[order[bounds[i]:bounds[i + 1]]])
+        self.counts['samples'] += n
+
+    # --- Snapshots ---
+
+    def snapshot(self, number=None, n_samples=SNAPSHOT_SAMPLES):
+        """
+        Plain-dict view of the buffers: per car its buffered laps and newest
+        n_samples samples (columns as lists). Copies the arrays, never waits on ingest.
+        """
+        self.flush()
+        cars = {}
+        for car_number in ([number] if number is not None else sorted(self.cars)):
+            buffers = self.cars.get(car_number)
+            if buffers is None: continue
+            laps = buffers.laps.snapshot()
+            samples = buffers.samples.snapshot(n_samples)
+            cars[car_number] = {
+                'laps': {name: laps[name].tolist() for name in LAP_FIELDS},
+                'samples': {
+                    'timestamp': samples['timestamp'].tolist(),
+                    'lap': samples['lap'].tolist(),
+                    'telemetry_name': [self.channel_names[c] for c in samples['channel']],
+                    'telemetry_value': samples['value'].tolist(),
+                },
+            }
+        return {'time': time.time(), 'weather': self.weather, 'counts': dict(self.counts), 'cars': cars}
+
+
+# --- Network ---
+
+class IngestTCP(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        data = self.buffer + data
+        end = data.rfind(b'\n') + 1
+        self.buffer = data[end:]
+        if end == 0:
+            return
+        block = data[:end]
+        if b'SNAPSHOT' in block:
+            lines = block.split(b'\n')
+            messages = [line for line in lines if not line.startswith(b'SNAPSHOT')]
+            if messages: self.server.feed(b'\n'.join(messages))
+            for line in lines:
+                if line.startswith(b'SNAPSHOT'): self.reply_snapshot(line)
+        else:
+            self.server.feed(block)
+
+    def reply_snapshot(self, line):
+        args = line.decode(errors='replace').split()[1:]
+        number = normalize_number(args[0]) if args and args[0] != '*' else None
+        try:
+            n_samples = int(args[1]) if len(args) > 1 else SNAPSHOT_SAMPLES
+            if n_samples < 0: raise ValueError
+        except ValueError:
+            # A malformed request gets an error reply instead of dropping the connection
+            self.server.counts['bad'] += 1
+            self.transport.write(json.dumps({'error': f'bad n_samples: {args[1]!r}'}).encode() + b'\n')
+            return
+        payload = json.dumps(self.server.snapshot(number, n_samples), allow_nan=True)
+        self.transport.write(payload.encode() + b'\n')
+
+    def eof_received(self):
+        if self.buffer:
+            self.server.feed(self.buffer + b'\n'); self.buffer = b''
+
+class IngestUDP(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.feed(data)
+
+async def serve(host=HOST, port=PORT, server=None, ready=None):
+    server = server or IngestServer()
+    loop = asyncio.get_running_loop()
+    tcp = await loop.create_server(lambda: IngestTCP(server), host, port)
+    udp, _ = await loop.create_datagram_endpoint(lambda: IngestUDP(server), local_addr=(host, port))
+    udp.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+    print(f"Ingest server listening on {host}:{port} (TCP and UDP)")
+    if ready is not None: ready.set()
+    try:
+        async with tcp:
+            await tcp.serve_forever()
+    finally:
+        udp.close()
+
+
+# --- Clients ---
+
+def fetch_snapshot(number=None, n_samples=SNAPSHOT_SAMPLES, host=HOST, port=PORT, timeout=2.0):
+    """Blocking snapshot request (e.g. from the dashboard)."""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(f"SNAPSHOT {number if number is not None else '*'} {n_samples}\n".encode())
+        reply = b''
+        while not reply.endswith(b'\n'):
+            block = sock.recv(1 << 20)
+            if not block: break
+            reply += block
+    return json.loads(reply)
+
+def telemetry_messages(file_path, telemetry_format, chunksize=200_000):
+    """S lines of a raw telemetry CSV (every channel), in file order, one block per chunk."""
+    import process_telemetry as pt
+    with pd.read_csv(file_path, sep=',', chunksize=chunksize, on_bad_lines='skip') as reader:
+        for chunk in reader:
+            readings = pt.process_chunk(chunk, telemetry_format, channels=None, with_timestamp=True)
+            if readings is None: continue
+            readings = readings.dropna(subset=['NUMBER', 'lap', 'timestamp'])
+            lines = pd.DataFrame({
+                'kind': 'S',
+                'NUMBER': readings['NUMBER'].astype(str),
+                'lap': readings['lap'].astype('int64'),
+                'timestamp': readings['timestamp'].astype('int64') // 1_000_000,
+                'telemetry_name': readings['telemetry_name'],
+                'telemetry_value': readings['telemetry_value'],
+            })
+            yield lines.to_csv(header=False, index=False, lineterminator='\n').encode()
+
+def lap_messages(laps_file_path):
+    """L lines of a laps file, in timing order."""
+    # Raw strings, exactly as written by timing
+    df = pd.read_csv(laps_file_path, sep=';', dtype=str, keep_default_na=False)
+    df.columns = df.columns.str.strip().str.replace('"', '', regex=False)
+    df = df.sort_values('HOUR', kind='stable').reindex(columns=LAP_MESSAGE_FIELDS, fill_value='')
+    for row in df.itertuples(index=False):
+        yield ('L,' + ','.join(v.replace(',', '') for v in row) + '\n').encode()
+
+def split_lines(block, max_bytes):
+    """Splits a block of lines into pieces of at most max_bytes, at line boundaries."""
+    start = 0
+    while start < len(block):
+        end = start + max_bytes
+        if end < len(block):
+            end = block.rfind(b'\n', start, end) + 1
+            if end <= start: end = block.find(b'\n', start) + 1 or len(block)
+        yield block[start:end]
+        start = end
+
+def replay(blocks, rate=None, lines_per_block=None, host=HOST, port=PORT, protocol='tcp'):
+    """Sends message blocks to the server, paced at `rate` lines per second (as fast as possible if None)."""
+    if protocol == 'tcp':
+        sock = socket.create_connection((host, port))
+        send = sock.sendall
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        send = lambda piece: sock.sendto(piece, (host, port))
+    n_lines, start = 0, time.perf_counter()
+    try:
+        for block in blocks:
+            for piece in split_lines(block, UDP_DATAGRAM_BYTES if protocol == 'udp' else 1 << 20):
+                send(piece)
+                n_lines += piece.count(b'\n')
+                if rate:
+                    ahead = n_lines / rate - (time.perf_counter() - start)
+                    if ahead > 0: time.sleep(ahead)
+    finally:
+        sock.close()
+    return n_lines, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live timing and telemetry ingest.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_cmd = commands.add_parser('serve')
+    serve_cmd.add_argument('--host', default=HOST)
+    serve_cmd.add_argument('--port', type=int, default=PORT)
+    replay_cmd = commands.add_parser('replay', help="Local replay client for a telemetry or laps file")
+    replay_cmd.add_argument('--telemetry')
+    replay_cmd.add_argument('--format', default='LONG', choices=['LONG', 'JSON'])
+    replay_cmd.add_argument('--laps')
+    replay_cmd.add_argument('--rate', type=float, default=None, help="Messages per second (default: as fast as possible)")
+    replay_cmd.add_argument('--udp', action='store_true')
+    replay_cmd.add_argument('--host', default=HOST)
+    replay_cmd.add_argument('--port', type=int, default=PORT)
+    snapshot_cmd = commands.add_parser('snapshot')
+    snapshot_cmd.add_argument('--car')
+    snapshot_cmd.add_argument('--samples', type=int, default=10)
+    snapshot_cmd.add_argument('--host', default=HOST)
+    snapshot_cmd.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'replay':
+        if bool(args.telemetry) == bool(args.laps):
+            print("Error: give either --telemetry or --laps (run one client per stream)."); sys.exit()
+        blocks = telemetry_messages(args.telemetry, args.format) if args.telemetry else lap_messages(args.laps)
+        n_lines, seconds = replay(blocks, args.rate, host=args.host, port=args.port, protocol='udp' if args.udp else 'tcp')
+        print(f"Sent {n_lines} messages in {seconds:.1f}s ({n_lines / max(seconds, 1e-9):,.0f}/s)")
+    else:
+        print(json.dumps(fetch_snapshot(args.car, args.samples, args.host, args.port), indent=1))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+import os
+import sys
+import json
+import fcntl
+import shutil
+import hashlib
+import argparse
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from forest_engine import FlatForest
+
+# ===================================================================
+# --- MODEL REGISTRY ---
+# One entry per track in processed_data/{track}/model/: the FlatForest
+# arrays as .npy files plus metadata.json (features, training rows,
+# metrics, hashes of the training data and code, size). The arrays open
+# memory-mapped, so loading a model costs a few file opens and every
+# process serving the same track shares its pages.
+# model is a symlink to a versioned directory (model.<stamp>-<pid>/); a new
+# version is published by swapping the link with os.replace, so the entry
+# always exists and readers see either the old or the new version whole.
+# Entries are registered by train_final_model.py, or from an existing
+# FINAL_model.pkl the first time the track is loaded.
+# Usage: python model_registry.py [--register] [--tracks VIR COTA]
+# ===================================================================
+
+REGISTRY_DIRNAME = 'model'
+METADATA_FILE = 'metadata.json'
+LOCK_FILE = 'model.lock'
+TARGET = 'LAP_DELTA'
+# Source files whose hashes are recorded with every model
+CODE_FILES = ['train_final_model.py', 'forest_engine.py', 'model_registry.py']
+
+
+def registry_path(track_name):
+    return f'processed_data/{track_name}/{REGISTRY_DIRNAME}'
+
+def version_path(track_name):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    return f'{registry_path(track_name)}.{stamp}-{os.getpid()}'
+
+def pickle_path(track_name):
+    return f'processed_data/{track_name}/FINAL_model.pkl'
+
+def file_sha256(path):
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+# --- Registering ---
+
+def build_metadata(track_name, model, forest, X=None, metrics=None, inputs=(), model_path=None, lineage=None):
+    import sklearn
+    return {
+        'track': track_name,
+        'created_utc': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'model_type': type(model).__name__,
+        'params': {k: v for k, v in model.get_params().items() if isinstance(v, (int, float, str, bool, type(None)))},
+        'features': [str(f) for f in forest.feature_names_in_],
+        'target': TARGET,
+        'training_rows': None if X is None else int(len(X)),
+        'feature_ranges': None if X is None else {
+            str(f): [float(X[f].min()), float(X[f].max())] for f in forest.feature_names_in_
+        },
+        'metrics': {k: float(v) for k, v in (metrics or {}).items()},
+        'inputs': {path: file_sha256(path) for path in inputs},
+        'code': {path: file_sha256(path) for path in CODE_FILES},
+        'git_commit': git_commit(),
+        'versions': {'sklearn': sklearn.__version__, 'numpy': np.__version__},
+        'n_trees': forest.n_trees,
+        'n_nodes': int(len(forest.value)),
+        'max_depth': forest.max_depth,
+        'size_bytes': forest.nbytes(),
+        'pickle_bytes': os.path.getsize(model_path) if model_path and os.path.exists(model_path) else None,
+        'lineage': list(lineage or []),
+    }
+
+def register_model(track_name, model, X=None, metrics=None, inputs=(), model_path=None, lineage=None):
+    """
+    Flattens a fitted forest into a new version of the track's registry entry and
+    points the entry at it, so readers never see a missing or half-written model
+    (processes still mapping older files keep their pages until they reload).
+    lineage lists how the model was built: the full training and every update since.
+    """
+    forest = FlatForest.from_model(model)
+    metadata = build_metadata(track_name, model, forest, X, metrics, inputs, model_path or pickle_path(track_name), lineage)
+
+    path = registry_path(track_name)
+    with registry_lock(track_name):
+        version = version_path(track_name)
+        forest.save(version)
+        with open(os.path.join(version, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=1)
+        publish_version(track_name, version)
+
+    print(f"Registered {track_name}: {metadata['n_trees']} trees, {metadata['n_nodes']:,} nodes, "
+          f"{metadata['size_bytes'] / 1e6:.1f} MB in {path}")
+    return forest
+
+@contextlib.contextmanager
+def registry_lock(track_name):
+    """Registrations of the same track take turns, so none removes a version another is writing. Readers do not lock."""
+    os.makedirs(os.path.dirname(registry_path(track_name)), exist_ok=True)
+    with open(os.path.join(os.path.dirname(registry_path(track_name)), LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def publish_version(track_name, version):
+    """Points the entry at a saved version by swapping the symlink, then removes older versions (call under registry_lock)."""
+    path = registry_path(track_name)
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and previous is None:
+        # Entry written before versioning: move it aside once (it is briefly missing)
+        previous = os.path.realpath(version_path(track_name) + '-legacy')
+        os.replace(path, previous)
+    link = f'{path}.link-{os.getpid()}'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version), link)
+    os.replace(link, path)
+
+    # Keep the version just replaced: a reader may have resolved the link to it already
+    keep = {os.path.realpath(version), previous}
+    prefix = os.path.basename(path) + '.'
+    parent = os.path.dirname(path)
+    for name in os.listdir(parent):
+        old = os.path.join(parent, name)
+        if name.startswith(prefix) and os.path.isdir(old) and not os.path.islink(old) and os.path.realpath(old) not in keep:
+            shutil.rmtree(old, ignore_errors=True)
+
+def training_data(track_name, features):
+    """Rows the track's model is trained on (both races, cleaned as in train_final_model.py)."""
+    paths = [f'processed_data/{track_name}/{race}_processed.parquet' for race in ('R1', 'R2')]
+    try:
+        df = pd.concat([pd.read_parquet(p) for p in paths])
+    except Exception:
+        return None, None, []
+    if any(f not in df.columns for f in features + [TARGET]):
+        return None, None, []
+    df = df.dropna(subset=features + [TARGET])
+    return df[features], df[TARGET], paths
+
+def register_from_pickle(track_name):
+    """Registers a track from its FINAL_model.pkl, scoring it on its training data when that is available."""
+    import joblib
+    from sklearn.metrics import r2_score, mean_absolute_error
+    model = joblib.load(pickle_path(track_name))
+    X, y, inputs = training_data(track_name, [str(f) for f in model.feature_names_in_])
+    metrics = None
+    if X is not None and len(X):
+        y_pred = FlatForest.from_model(model).predict(X)
+        metrics = {'r2': r2_score(y, y_pred), 'mae': mean_absolute_error(y, y_pred)}
+    return register_model(track_name, model, X, metrics, inputs, pickle_path(track_name))
+
+
+# --- Loading ---
+
+def load_forest(track_name, mmap_mode='r'):
+    """The track's registered forest, memory-mapped. None if the track has no entry."""
+    # Resolve the link once so every array comes from the same version
+    path = os.path.realpath(registry_path(track_name))
+    if not os.path.exists(os.path.join(path, METADATA_FILE)):
+        return None
+    return FlatForest.load(path, mmap_mode=mmap_mode)
+
+def load_metadata(track_name):
+    path = os.path.join(os.path.realpath(registry_path(track_name)), METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def is_stale(track_name):
+    """True when the entry is missing or older than the track's FINAL_model.pkl."""
+    metadata_file = os.path.join(registry_path(track_name), METADATA_FILE)
+    if not os.path.exists(metadata_file):
+        return True
+    pkl = pickle_path(track_name)
+    return os.path.exists(pkl) and os.path.getmtime(metadata_file) < os.path.getmtime(pkl)
+
+def load_or_register(track_name):
+    """Loads the track's forest, registering it from FINAL_model.pkl first if needed. None if there is no model."""
+    if is_stale(track_name):
+        if not os.path.exists(pickle_path(track_name)):
+            return None
+        register_from_pickle(track_name)
+    return load_forest(track_name)
+
+def list_tracks():
+    return sorted(d for d in os.listdir('processed_data') if os.path.isdir(os.path.join('processed_data', d)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or (re)build the per-track model registry.")
+    parser.add_argument('--register', action='store_true', help="Register every track that has a FINAL_model.pkl")
+    parser.add_argument('--tracks', nargs='*', help="Only these tracks (default: all in processed_data)")
+    args = parser.parse_args()
+
+    if not os.path.isdir('processed_data'):
+        print("Error: processed_data/ not found. Run from the project root.")
+        sys.exit(1)
+    tracks = args.tracks or list_tracks()
+    if args.register:
+        for track in tracks:
+            if os.path.exists(pickle_path(track)):
+                register_from_pickle(track)
+
+    print(f"{'track':<14}{'trees':>6}{'nodes':>10}{'depth':>6}{'MB':>7}{'rows':>7}{'R2':>8}{'MAE':>8}  features")
+    for track in tracks:
+        metadata = load_metadata(track)
+        if metadata is None:
+            if os.path.exists(pickle_path(track)):
+                print(f"{track:<14}  (not registered - run with --register)")
+            continue
+        metrics = metadata.get('metrics') or {}
+        print(f"{track:<14}{metadata['n_trees']:>6}{metadata['n_nodes']:>10,}{metadata['max_depth']:>6}"
+              f"{metadata['size_bytes'] / 1e6:>7.1f}{metadata['training_rows'] or '-':>7}"
+              f"{metrics.get('r2', float('nan')):>8.3f}{metrics.get('mae', float('nan')):>8.3f}  {', '.join(metadata['features'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from simulation import simulate_scenarios
+
+# ===================================================================
+# --- MONTE CARLO RACE OUTCOMES ---
+# Turns the deterministic verdicts into probabilities by sampling many
+# race futures (caution timing, TRACK_TEMP drift, rival tire age, gap
+# evolution). Each chunk of futures is one batched simulate_scenarios
+# call; chunks can be fanned out to a process pool.
+# ===================================================================
+
+# --- Default Uncertainty Model ---
+CAUTION_RATE_PER_LAP = 0.04   # Chance a new caution comes out on any given lap
+TEMP_DRIFT_SD = 0.15          # °C random-walk step per lap
+RIVAL_AGE_SD = 2.0            # Laps of uncertainty on the rival's tire age
+GAP_SD_PER_LAP = 0.3          # Seconds of random gap change per lap (traffic, errors)
+# Weather reports come in 0.1°C steps; sampled temperatures are rounded to that
+# so repeated feature rows collapse before hitting the model
+TEMP_RESOLUTION = 0.1
+# Futures per chunk; chunking (not the worker count) fixes the random streams,
+# so results are identical for a given seed with or without a pool
+CHUNK_SAMPLES = 2500
+
+# time_diffs: per-future margin (> 0 means the evaluated call works out);
+# percentiles: {5, 25, 50, 75, 95} of time_diffs
+MonteCarloResult = namedtuple('MonteCarloResult', ['success_probability', 'time_diffs', 'percentiles'])
+
+
+# --- Sampling ---
+
+def sample_temp_paths(rng, n_samples, n_laps, track_temp, temp_drift_sd):
+    steps = rng.normal(0.0, temp_drift_sd, (n_samples, n_laps))
+    paths = track_temp + np.cumsum(steps, axis=1)
+    return np.round(paths / TEMP_RESOLUTION) * TEMP_RESOLUTION
+
+def sample_caution_laps(rng, n_samples, caution_rate):
+    """Relative lap of the next caution (geometric); values past the horizon mean none."""
+    if caution_rate <= 0:
+        return np.full(n_samples, np.iinfo(np.int32).max)
+    return rng.geometric(caution_rate, n_samples)
+
+
+# --- Per-Chunk Evaluators ---
+
+def _caution_chunk(model, seed, n_samples, params):
+    rng = np.random.default_rng(seed)
+    p = params
+    n_laps = p['laps_remaining']
+    temps = sample_temp_paths(rng, n_samples, n_laps, p['track_temp'], p['temp_drift_sd'])
+    # Lap 1 is the caution we are under now; the next one can only come later
+    next_caution = 1 + sample_caution_laps(rng, n_samples, p['caution_rate'])
+
+    # Staying out: if another caution falls before our planned stop, we take it
+    stay_cheap = next_caution <= p['green_pit_lap']
+    stay_pit_lap = np.where(stay_cheap, next_caution, p['green_pit_lap'])
+    stay_pit_cost = np.where(stay_cheap, p['yellow_pit_cost'], p['green_pit_cost'])
+
+    result = simulate_scenarios(
+        model, p['current_tire_laps'], n_laps,
+        np.concatenate([np.ones(n_samples, dtype=int), stay_pit_lap]),
+        np.concatenate([np.full(n_samples, p['yellow_pit_cost']), stay_pit_cost]),
+        np.vstack([temps, temps]), p['driver_aggression']
+    )
+    pit_now, stay_out = result.totals[:n_samples], result.totals[n_samples:]
+    return stay_out - pit_now
+
+def _battle_chunk(model, seed, n_samples, params):
+    rng = np.random.default_rng(seed)
+    p = params
+    n_laps = p['cycle_laps']
+    temps = sample_temp_paths(rng, n_samples, n_laps, p['track_temp'], p['temp_drift_sd'])
+    rival_ages = np.maximum(1, np.round(p['rival_tire_laps'] + rng.normal(0.0, p['rival_age_sd'], n_samples))).astype(int)
+    gap_change = rng.normal(0.0, p['gap_sd_per_lap'], (n_samples, n_laps)).sum(axis=1)
+
+    result = simulate_scenarios(
+        model, np.concatenate([np.full(n_samples, p['my_tire_laps']), rival_ages]), n_laps,
+        np.concatenate([np.full(n_samples, p['my_pit_lap']), np.full(n_samples, p['rival_pit_lap'])]),
+        p['green_pit_cost'], np.vstack([temps, temps]), p['driver_aggression']
+    )
+    my_time, rival_time = result.totals[:n_samples], result.totals[n_samples:]
+    # Margin over the (evolving) gap we need to close
+    return (rival_time - my_time) - (p['gap'] + gap_change)
+
+
+# --- Chunk Fan-Out ---
+
+_WORKER_MODEL = None
+
+def _init_worker(model):
+    global _WORKER_MODEL
+    _WORKER_MODEL = model
+
+def _run_worker_chunk(args):
+    evaluator, seed, n_samples, params = args
+    return evaluator(_WORKER_MODEL, seed, n_samples, params)
+
+def run_monte_carlo(model, evaluator, params, n_samples, seed, n_workers=1):
+    """Splits the futures into fixed, independently seeded chunks and evaluates them."""
+    sizes = [CHUNK_SAMPLES] * (n_samples // CHUNK_SAMPLES)
+    if n_samples % CHUNK_SAMPLES: sizes.append(n_samples % CHUNK_SAMPLES)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(evaluator, s, n, params) for s, n in zip(seeds, sizes)]
+
+    if n_workers > 1 and len(tasks) > 1:
+        # The model is shipped once per worker, not once per chunk
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(model,)) as pool:
+            chunks = list(pool.map(_run_worker_chunk, tasks))
+    else:
+        chunks = [evaluator(model, s, n, p) for evaluator, s, n, p in tasks]
+
+    time_diffs = np.concatenate(chunks)
+    percentiles = dict(zip((5, 25, 50, 75, 95), np.percentile(time_diffs, [5, 25, 50, 75, 95])))
+    return MonteCarloResult(float(np.mean(time_diffs > 0)), time_diffs, percentiles)
+
+
+# --- Decision Tools ---
+
+def monte_carlo_caution(model, current_tire_laps, laps_remaining, track_temp, driver_aggression, green_pit_lap, green_pit_cost, yellow_pit_cost, n_samples=10_000, seed=0, caution_rate=CAUTION_RATE_PER_LAP, temp_drift_sd=TEMP_DRIFT_SD, n_workers=1):
+    """
+    Probability that pitting now under the caution beats staying out, and the
+    distribution of the time saved (stay-out total - pit-now total).
+    """
+    params = dict(
+        current_tire_laps=current_tire_laps, laps_remaining=laps_remaining, track_temp=track_temp,
+        driver_aggression=driver_aggression, green_pit_lap=green_pit_lap, green_pit_cost=green_pit_cost,
+        yellow_pit_cost=yellow_pit_cost, caution_rate=caution_rate, temp_drift_sd=temp_drift_sd
+    )
+    return run_monte_carlo(model, _caution_chunk, params, n_samples, seed, n_workers)
+
+def monte_carlo_battle(model, my_tire_laps, rival_tire_laps, gap, track_temp, driver_aggression, my_pit_lap, rival_pit_lap, green_pit_cost, cycle_laps=3, n_samples=10_000, seed=0, rival_age_sd=RIVAL_AGE_SD, gap_sd_per_lap=GAP_SD_PER_LAP, temp_drift_sd=TEMP_DRIFT_SD, n_workers=1):
+    """
+    Probability that the pit call (undercut: my_pit_lap=1, rival_pit_lap=2) gains
+    the position, and the distribution of the margin over the gap.
+    """
+    params = dict(
+        my_tire_laps=my_tire_laps, rival_tire_laps=rival_tire_laps, gap=gap, track_temp=track_temp,
+        driver_aggression=driver_aggression, my_pit_lap=my_pit_lap, rival_pit_lap=rival_pit_lap,
+        green_pit_cost=green_pit_cost, cycle_laps=cycle_laps, rival_age_sd=rival_age_sd,
+        gap_sd_per_lap=gap_sd_per_lap, temp_drift_sd=temp_drift_sd
+    )
+    return run_monte_carlo(model, _battle_chunk, params, n_samples, seed, n_workers)
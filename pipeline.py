@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import contextlib
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# ===================================================================
+# --- PIPELINE RUNNER ---
+# Rebuilds every race and model from pipeline_manifest.json:
+#   telemetry (per race) -> laps (per race) -> training, degradation rates (per track)
+# Independent stages run in parallel on a process pool. A stage is skipped
+# when the content hash of its code, parameters and input files matches
+# the last successful run and its outputs still exist.
+# Usage: python pipeline.py [--workers N] [--tracks VIR COTA] [--force] [--dry-run]
+# ===================================================================
+
+MANIFEST_FILE = 'pipeline_manifest.json'
+STATE_FILE = 'processed_data/pipeline_state.json'
+LOG_DIR = 'processed_data/logs'
+# Source files whose content is part of each stage's hash
+STAGE_CODE = {
+    'telemetry': ['process_telemetry.py', 'telemetry_aggregator.py', 'telemetry_store.py'],
+    'laps': ['process_data.py'],
+    'train': ['train_final_model.py', 'degradation_surface.py', 'forest_engine.py', 'model_registry.py'],
+    'rates': ['degradation_rates.py'],
+}
+HASH_BLOCK_BYTES = 8 * 1024 * 1024
+
+# deps are stage names that must finish first; inputs are files whose
+# content is hashed (outputs of upstream stages included).
+Stage = namedtuple('Stage', ['name', 'kind', 'params', 'inputs', 'outputs', 'deps'])
+# (stage kind, dependency kind) edges that still run when the dependency fails:
+# process_data omits the telemetry features when they are missing. A failed
+# dependency over any other edge fails its dependents without running them.
+SOFT_DEPS = {('laps', 'telemetry')}
+
+
+# --- Dependency Graph ---
+
+def load_manifest(path=MANIFEST_FILE):
+    with open(path) as f:
+        return json.load(f)['races']
+
+def build_stages(races):
+    stages = {}
+    tracks = {}
+    for r in races:
+        track, race = r['track'], r['race']
+        tracks.setdefault(track, []).append(race)
+        telemetry_out = f'processed_data/{track}/{race}_telemetry_agg.parquet'
+        laps_out = f'processed_data/{track}/{race}_processed.parquet'
+        stages[f'telemetry:{track}:{race}'] = Stage(
+            f'telemetry:{track}:{race}', 'telemetry',
+            dict(track_name=track, race_num=race, telemetry_file_path=r['telemetry_file'], telemetry_format=r['telemetry_format']),
+            [r['telemetry_file']], [telemetry_out], []
+        )
+        # Laps run after telemetry even if it failed (SOFT_DEPS): process_data omits the features if they are missing
+        stages[f'laps:{track}:{race}'] = Stage(
+            f'laps:{track}:{race}', 'laps',
+            dict(track_name=track, race_num=race, laps_file_path=r['laps_file'], weather_file_path=r['weather_file'],
+                 race_date_str=r['race_date'], track_timezone=r['timezone']),
+            [r['laps_file'], r['weather_file'], telemetry_out], [laps_out], [f'telemetry:{track}:{race}']
+        )
+    for track, track_races in tracks.items():
+        stages[f'train:{track}'] = Stage(
+            f'train:{track}', 'train', dict(track_name=track),
+            [f'processed_data/{track}/{race}_processed.parquet' for race in sorted(track_races)],
+            [f'processed_data/{track}/FINAL_model.pkl', f'processed_data/{track}/model/metadata.json', f'processed_data/{track}/FINAL_surface.npz'],
+            [f'laps:{track}:{race}' for race in sorted(track_races)]
+        )
+        stages[f'rates:{track}'] = Stage(
+            f'rates:{track}', 'rates', dict(track_name=track),
+            [f'processed_data/{track}/{race}_processed.parquet' for race in sorted(track_races)],
+            [f'processed_data/{track}/degradation_rates.parquet'],
+            [f'laps:{track}:{race}' for race in sorted(track_races)]
+        )
+    return stages
+
+def select_tracks(stages, tracks):
+    return {name: s for name, s in stages.items() if s.params['track_name'] in tracks}
+
+
+# --- Content Hashing ---
+
+def file_digest(path, cache):
+    """sha256 of a file's content; cached by (size, mtime) so unchanged raw files are not re-read."""
+    if not os.path.exists(path):
+        return 'missing'
+    st = os.stat(path)
+    key = f'{st.st_size}:{st.st_mtime_ns}'
+    cached = cache.get(path)
+    if cached and cached['key'] == key:
+        return cached['sha256']
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            h.update(block)
+    cache[path] = {'key': key, 'sha256': h.hexdigest()}
+    return cache[path]['sha256']
+
+def stage_hash(stage, file_cache):
+    h = hashlib.sha256()
+    h.update(json.dumps({'kind': stage.kind, 'params': stage.params}, sort_keys=True).encode())
+    for path in STAGE_CODE[stage.kind] + stage.inputs:
+        h.update(f'{path}={file_digest(path, file_cache)}'.encode())
+    return h.hexdigest()
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+# --- Stage Execution ---
+
+def run_stage(kind, params, log_path, n_jobs):
+    """Worker: runs one stage with its output captured in a log file. Returns (ok, seconds)."""
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            if kind == 'telemetry':
+                import process_telemetry
+                # The pool already runs races in parallel; one reader process per race
+                process_telemetry.process_race_telemetry(**params, n_workers=1)
+            elif kind == 'laps':
+                import process_data
+                process_data.process_race(**params)
+            elif kind == 'train':
+                import train_final_model
+                train_final_model.train_track(**params, n_jobs=n_jobs)
+            elif kind == 'rates':
+                import degradation_rates
+                degradation_rates.build_and_save_rates(**params)
+            ok = True
+        except BaseException: # The scripts report errors with sys.exit()
+            traceback.print_exc()
+            ok = False
+    return ok, time.perf_counter() - start
+
+def is_soft_dep(stage, dep, stages):
+    return (stage.kind, stages[dep].kind) in SOFT_DEPS
+
+def run_pipeline(stages, n_workers, force=False, dry_run=False):
+    state = load_state()
+    done, failed, rebuilt, running = set(), set(), set(), {}
+    pending = dict(stages)
+    # Cores left per training job while the other workers are busy
+    n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        while pending or running:
+            # Dependents of a failed stage would run on stale or missing inputs: fail them too
+            for stage in [s for s in pending.values() if any(d in failed and not is_soft_dep(s, d, stages) for d in s.deps)]:
+                del pending[stage.name]
+                failed.add(stage.name)
+                print(f"  [FAIL] {stage.name} (not run: {', '.join(d for d in stage.deps if d in failed)} failed)")
+            ready = [s for s in pending.values()
+                     if all(d in done or d not in stages or (d in failed and is_soft_dep(s, d, stages)) for d in s.deps)]
+            for stage in ready:
+                del pending[stage.name]
+                digest = stage_hash(stage, state['files'])
+                previous = state['stages'].get(stage.name, {})
+                up_to_date = previous.get('hash') == digest and all(os.path.exists(p) for p in stage.outputs)
+                # In a dry run upstream outputs are not rebuilt, so follow the graph instead
+                upstream_changed = dry_run and any(d in rebuilt for d in stage.deps)
+                if up_to_date and not force and not upstream_changed:
+                    print(f"  [skip] {stage.name} (unchanged)")
+                    done.add(stage.name)
+                    continue
+                if dry_run:
+                    print(f"  [would run] {stage.name}")
+                    done.add(stage.name); rebuilt.add(stage.name)
+                    continue
+                print(f"  [run]  {stage.name}")
+                log_path = os.path.join(LOG_DIR, stage.name.replace(':', '_') + '.log')
+                running[pool.submit(run_stage, stage.kind, stage.params, log_path, n_jobs)] = (stage, digest, log_path)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, digest, log_path = running.pop(future)
+                ok, seconds = future.result()
+                if ok:
+                    done.add(stage.name); rebuilt.add(stage.name)
+                    # Outputs are inputs of later stages: re-hash them now
+                    for path in stage.outputs: file_digest(path, state['files'])
+                    state['stages'][stage.name] = {'hash': digest, 'seconds': round(seconds, 1)}
+                    print(f"  [done] {stage.name} in {seconds:.1f}s")
+                else:
+                    failed.add(stage.name)
+                    state['stages'].pop(stage.name, None)
+                    print(f"  [FAIL] {stage.name} (see {log_path})")
+                if not dry_run: save_state(state)
+    if not dry_run: save_state(state)
+    return done, failed, rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild telemetry, lap data and models from the manifest.")
+    parser.add_argument('--manifest', default=MANIFEST_FILE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--tracks', nargs='*', help="Only these tracks (default: all in the manifest)")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if nothing changed")
+    parser.add_argument('--dry-run', action='store_true', help="Only list the stages that would run")
+    args = parser.parse_args()
+
+    stages = build_stages(load_manifest(args.manifest))
+    if args.tracks:
+        stages = select_tracks(stages, args.tracks)
+    print(f"Pipeline: {len(stages)} stages on {args.workers} workers")
+    done, failed, rebuilt = run_pipeline(stages, args.workers, args.force, args.dry_run)
+    print("---")
+    verb = 'would be rebuilt' if args.dry_run else 'rebuilt'
+    print(f"{len(rebuilt)} stages {verb}, {len(done) - len(rebuilt)} unchanged, {len(failed)} failed" + (f": {sorted(failed)}" if failed else ""))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import pytz
 import os
 import sys
+import csv
 
 # ===================================================================
 # --- DATA PROCESSING CONFIGURATION ---
@@ -127,14 +132,34 @@ TRACK_TIMEZONE = 'America/New_York'
 # ===================================================================
 
 # Define input/output paths
-OUTPUT_FILE = f'processed_data/{TRACK_NAME_OUT}/{RACE_NUM_OUT}_processed.parquet'
-TELEMETRY_AGG_FILE = f'processed_data/{TRACK_NAME_OUT}/{RACE_NUM_OUT}_telemetry_agg.parquet'
+def processed_file(track_name, race_num):
+    return f'processed_data/{track_name}/{race_num}_processed.parquet'
+def telemetry_agg_file(track_name, race_num):
+    return f'processed_data/{track_name}/{race_num}_telemetry_agg.parquet'
 
 
 def clean_col_names(df):
     df.columns = df.columns.str.strip().str.replace('"', '', regex=False)
     return df
 
+# --- Lap Timing Columns ---
+# Raw timing column -> seconds; seconds -> per-car best (green-flag laps); seconds -> delta to that best
+TIME_COLUMNS = {'LAP_TIME': 'LAP_TIME_SEC', 'S1': 'S1_SEC', 'S2': 'S2_SEC', 'S3': 'S3_SEC'}
+BEST_COLUMNS = {'LAP_TIME_SEC': 'BEST_LAP_TIME', 'S1_SEC': 'BEST_S1', 'S2_SEC': 'BEST_S2', 'S3_SEC': 'BEST_S3'}
+DELTA_COLUMNS = {'LAP_TIME_SEC': 'LAP_DELTA', 'S1_SEC': 'S1_DELTA', 'S2_SEC': 'S2_DELTA', 'S3_SEC': 'S3_DELTA'}
+# A lap is kept when it is green-flag, all of these are present and 0 <= LAP_DELTA < MAX_LAP_DELTA
+REQUIRED_COLUMNS = ['LAP_TIME_SEC', 'LAP_DELTA', 'S1_DELTA', 'S2_DELTA', 'S3_DELTA', 'BEST_LAP_TIME', 'TRACK_TEMP']
+MAX_LAP_DELTA = 20
+# Columns read from the laps file and their types (times stay text until parsed)
+LAP_FILE_TYPES = {
+    'NUMBER': pa.int64(), 'LAP_NUMBER': pa.int64(), 'LAP_TIME': pa.string(), 'S1': pa.string(), 'S2': pa.string(),
+    'S3': pa.string(), 'FLAG_AT_FL': pa.string(), 'HOUR': pa.string(), 'CROSSING_FINISH_LINE_IN_PIT': pa.string(),
+    'TOP_SPEED': pa.float64(),
+}
+# pd.read_csv's default missing-value strings
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
 def convert_time_to_seconds(time_val):
     if pd.isna(time_val): return None
     time_str = str(time_val).strip()
@@ -146,110 +171,185 @@ def convert_time_to_seconds(time_val):
             milliseconds = float(time_val); return milliseconds / 1000.0
     except Exception: return None
 
+def parse_times(text):
+    """
+    Seconds of an Arrow string array of lap/sector times, by the rules of
+    convert_time_to_seconds. 'm:ss.fff' and plain millisecond values are split and
+    parsed by Arrow in one pass; anything it rejects (blanks, stray spaces, text)
+    goes through convert_time_to_seconds once per distinct value.
+    """
+    parts = pc.split_pattern(text, ':')
+    offsets = parts.offsets.to_numpy()
+    n_parts = np.diff(offsets) # 0 for missing values
+    fast, timed = (n_parts == 1) | (n_parts == 2), n_parts == 2
+    seconds = np.full(len(text), np.nan)
+    try:
+        flat = pc.list_flatten(parts)
+        sec = pc.cast(flat.take(offsets[1:][fast] - 1), pa.float64()).to_numpy()
+        minutes = pc.cast(flat.take(offsets[:-1][timed]), pa.int64()).to_numpy()
+        seconds[fast] = sec / 1000.0
+        seconds[timed] = minutes * 60 + sec[timed[fast]]
+    except pa.ArrowInvalid: # Something Arrow cannot parse: use the row-by-row rules for every value
+        fast[:] = False
+    slow = ~fast & text.is_valid().to_numpy(zero_copy_only=False)
+    if slow.any():
+        codes, uniques = pd.factorize(np.asarray(text.filter(pa.array(slow)), dtype=object))
+        seconds[slow] = np.array([convert_time_to_seconds(u) for u in uniques], dtype=float)[codes]
+    return seconds
+
+def stack_text(columns):
+    """One Arrow large_string array of the given columns (Arrow or pandas), end to end."""
+    chunks = []
+    for col in columns:
+        if not isinstance(col, (pa.Array, pa.ChunkedArray)):
+            col = pa.array(col if col.dtype == 'str' else col.astype('str'))
+        chunks += col.chunks if isinstance(col, pa.ChunkedArray) else [col]
+    return pa.concat_arrays([chunk if chunk.type == pa.large_string() else chunk.cast(pa.large_string()) for chunk in chunks])
+
+def times_to_seconds(values):
+    """convert_time_to_seconds over whole columns: a Series or a DataFrame, returned with the same shape."""
+    frame = values.to_frame() if isinstance(values, pd.Series) else values
+    seconds = parse_times(stack_text(frame[col] for col in frame.columns)).reshape(len(frame.columns), len(frame)).T
+    if isinstance(values, pd.Series):
+        return pd.Series(seconds[:, 0], index=values.index, name=values.name)
+    return pd.DataFrame(seconds, index=values.index, columns=values.columns)
+
+def add_lap_timing(df):
+    """
+    Lap/sector times in seconds, each car's best lap and best sectors (over its
+    green-flag laps), the deltas to them, and stints. Returns the clean green-flag
+    laps sorted by NUMBER, LAP_NUMBER with STINT_ID and Laps_on_this_Tireset.
+    lap_timing.LapTimingEngine computes the same values one lap at a time.
+    """
+    # Convert times (read_laps_file already has when the laps come from a file)
+    unparsed = [raw_col for raw_col, sec_col in TIME_COLUMNS.items() if sec_col not in df.columns]
+    if unparsed:
+        df[[TIME_COLUMNS[raw_col] for raw_col in unparsed]] = times_to_seconds(df[unparsed]).to_numpy()
+
+    # Best times per driver (one groupby for the lap and all sectors)
+    best = df[df['FLAG_AT_FL'] == 'GF'].groupby('NUMBER')[list(BEST_COLUMNS)].min()
+    df = pd.merge(df, best.rename(columns=BEST_COLUMNS).reset_index(), on='NUMBER', how='left')
+
+    # Calculate deltas
+    for sec_col, delta_col in DELTA_COLUMNS.items():
+        df[delta_col] = df[sec_col] - df[BEST_COLUMNS[sec_col]]
+
+    # Filter laps
+    df = df[df['FLAG_AT_FL'] == 'GF'].copy()
+    df = df.dropna(subset=REQUIRED_COLUMNS)
+    df = df[(df['LAP_DELTA'] >= 0) & (df['LAP_DELTA'] < MAX_LAP_DELTA)].copy() 
+
+    # Stint logic
+    df['CROSSING_FINISH_LINE_IN_PIT'] = pd.to_numeric(df['CROSSING_FINISH_LINE_IN_PIT'], errors='coerce').fillna(0).astype(int)
+    df = df.sort_values(by=['NUMBER', 'LAP_NUMBER'])
+    df['NEW_STINT_START'] = df.groupby('NUMBER')['CROSSING_FINISH_LINE_IN_PIT'].shift(1).fillna(0)
+    df['STINT_ID'] = df.groupby('NUMBER')['NEW_STINT_START'].cumsum().astype(int)
+    df['Laps_on_this_Tireset'] = df.groupby(['NUMBER', 'STINT_ID']).cumcount() + 1
+    df['NUMBER'] = df['NUMBER'].astype(str)
+    return df
+
+def read_laps_file(laps_file_path):
+    """
+    The LAP_FILE_TYPES columns of a laps file, typed, with clean names, plus the
+    times in seconds (TIME_COLUMNS, parsed once here). Read with Arrow's CSV reader;
+    missing values and dtypes come out as with pd.read_csv.
+    """
+    with open(laps_file_path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f, delimiter=';'))
+    raw_names = {name.strip().replace('"', ''): name for name in header} # Headers may be padded
+    types = {raw_names[col]: col_type for col, col_type in LAP_FILE_TYPES.items() if col in raw_names}
+    table = pacsv.read_csv(
+        laps_file_path,
+        read_options=pacsv.ReadOptions(use_threads=False),
+        parse_options=pacsv.ParseOptions(delimiter=';'),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=list(types), column_types=types, null_values=NA_VALUES, strings_can_be_null=True,
+        ),
+    )
+    table = table.rename_columns([name.strip().replace('"', '') for name in table.column_names])
+    time_columns = [raw_col for raw_col in TIME_COLUMNS if raw_col in table.column_names]
+    if time_columns:
+        seconds = parse_times(stack_text(table[raw_col] for raw_col in time_columns)).reshape(len(time_columns), -1)
+        for raw_col, col_seconds in zip(time_columns, seconds):
+            table = table.append_column(TIME_COLUMNS[raw_col], pa.array(col_seconds))
+    return table.to_pandas()
+
+def load_laps_with_weather(laps_file_path, weather_file_path, race_date_str, track_timezone):
+    """Every lap of the race (sorted by time) with the latest weather reading at that time."""
+    # --- 1. Load Weather Data ---
+    try:
+        df_weather = pd.read_csv(weather_file_path, sep=';')
+    except Exception as e:
+        print(f"Error reading weather file: {e}"); sys.exit()
+    df_weather = clean_col_names(df_weather)
+    df_weather['datetime'] = pd.to_datetime(df_weather['TIME_UTC_STR'], errors='coerce')
+    df_weather['datetime'] = df_weather['datetime'].dt.tz_localize('UTC').dt.tz_convert(track_timezone)
+    df_weather = df_weather.sort_values(by='datetime')
+
+    # --- 2. Load Lap Data ---
+    try:
+        df_laps = read_laps_file(laps_file_path)
+    except Exception as e:
+        print(f"Error reading laps file: {e}"); sys.exit()
+
+    # --- 3. Merge Weather and Laps ---
+    print("Merging laps and weather data...")
+    df_laps['datetime_str'] = race_date_str + ' ' + df_laps['HOUR']
+    df_laps['datetime'] = pd.to_datetime(df_laps['datetime_str'], format='%Y-%m-%d %H:%M:%S.%f', errors='coerce')
+    df_laps['datetime'] = df_laps['datetime'].dt.tz_localize(track_timezone, ambiguous='infer')
+    df_laps = df_laps.sort_values(by='datetime')
+    df = pd.merge_asof(df_laps, df_weather[['datetime', 'AIR_TEMP', 'TRACK_TEMP', 'HUMIDITY', 'RAIN']], on='datetime')
+    df[['AIR_TEMP', 'TRACK_TEMP', 'HUMIDITY', 'RAIN']] = df[['AIR_TEMP', 'TRACK_TEMP', 'HUMIDITY', 'RAIN']].ffill()
+    df[['TRACK_TEMP']] = df[['TRACK_TEMP']].fillna(0) # Handle missing data (e.g. Barber)
+    return df
+
 # --- START PROCESSING ---
-print(f"Starting data processing (v13 - Sectors) for: {TRACK_NAME_OUT} - {RACE_NUM_OUT}")
-
-# --- 1. Load Weather Data ---
-try:
-    df_weather = pd.read_csv(WEATHER_FILE_PATH, sep=';')
-except Exception as e:
-    print(f"Error reading weather file: {e}"); sys.exit()
-df_weather = clean_col_names(df_weather)
-df_weather['datetime'] = pd.to_datetime(df_weather['TIME_UTC_STR'], errors='coerce')
-df_weather['datetime'] = df_weather['datetime'].dt.tz_localize('UTC').dt.tz_convert(TRACK_TIMEZONE)
-df_weather = df_weather.sort_values(by='datetime')
-
-# --- 2. Load Lap Data ---
-try:
-    df_laps = pd.read_csv(LAPS_FILE_PATH, sep=';')
-except Exception as e:
-    print(f"Error reading laps file: {e}"); sys.exit()
-df_laps = clean_col_names(df_laps)
-
-# --- 3. Calculate Ideal Times (Best Lap & Best Sectors) ---
-print("Calculating ideal times (lap and sectors)...")
-df_laps_gf = df_laps[df_laps['FLAG_AT_FL'] == 'GF'].copy()
-df_laps_gf['LAP_TIME_SEC'] = df_laps_gf['LAP_TIME'].apply(convert_time_to_seconds)
-# Convert sector times
-df_laps_gf['S1_SEC'] = df_laps_gf['S1'].apply(convert_time_to_seconds)
-df_laps_gf['S2_SEC'] = df_laps_gf['S2'].apply(convert_time_to_seconds)
-df_laps_gf['S3_SEC'] = df_laps_gf['S3'].apply(convert_time_to_seconds)
-
-# Calculate best times per driver
-best_lap = df_laps_gf.groupby('NUMBER')['LAP_TIME_SEC'].min().reset_index().rename(columns={'LAP_TIME_SEC': 'BEST_LAP_TIME'})
-best_s1 = df_laps_gf.groupby('NUMBER')['S1_SEC'].min().reset_index().rename(columns={'S1_SEC': 'BEST_S1'})
-best_s2 = df_laps_gf.groupby('NUMBER')['S2_SEC'].min().reset_index().rename(columns={'S2_SEC': 'BEST_S2'})
-best_s3 = df_laps_gf.groupby('NUMBER')['S3_SEC'].min().reset_index().rename(columns={'S3_SEC': 'BEST_S3'})
-
-# --- 4. Merge Weather and Laps ---
-print("Merging laps and weather data...")
-df_laps['datetime_str'] = RACE_DATE_STR + ' ' + df_laps['HOUR']
-df_laps['datetime'] = pd.to_datetime(df_laps['datetime_str'], format='%Y-%m-%d %H:%M:%S.%f', errors='coerce')
-df_laps['datetime'] = df_laps['datetime'].dt.tz_localize(TRACK_TIMEZONE, ambiguous='infer')
-df_laps = df_laps.sort_values(by='datetime')
-df = pd.merge_asof(df_laps, df_weather[['datetime', 'AIR_TEMP', 'TRACK_TEMP', 'HUMIDITY', 'RAIN']], on='datetime')
-df[['AIR_TEMP', 'TRACK_TEMP', 'HUMIDITY', 'RAIN']] = df[['AIR_TEMP', 'TRACK_TEMP', 'HUMIDITY', 'RAIN']].ffill()
-df[['TRACK_TEMP']] = df[['TRACK_TEMP']].fillna(0) # Handle missing data (e.g. Barber)
-
-# --- 5. Create "Stints" and "Deltas" ---
-print("Cleaning data and creating stints/deltas...")
-# Merge best times
-df = pd.merge(df, best_lap, on='NUMBER', how='left')
-df = pd.merge(df, best_s1, on='NUMBER', how='left')
-df = pd.merge(df, best_s2, on='NUMBER', how='left')
-df = pd.merge(df, best_s3, on='NUMBER', how='left')
-
-# Convert times
-df['LAP_TIME_SEC'] = df['LAP_TIME'].apply(convert_time_to_seconds)
-df['S1_SEC'] = df['S1'].apply(convert_time_to_seconds)
-df['S2_SEC'] = df['S2'].apply(convert_time_to_seconds)
-df['S3_SEC'] = df['S3'].apply(convert_time_to_seconds)
-
-# Calculate deltas
-df['LAP_DELTA'] = df['LAP_TIME_SEC'] - df['BEST_LAP_TIME']
-df['S1_DELTA'] = df['S1_SEC'] - df['BEST_S1']
-df['S2_DELTA'] = df['S2_SEC'] - df['BEST_S2']
-df['S3_DELTA'] = df['S3_SEC'] - df['BEST_S3']
-
-# Filter laps
-df = df[df['FLAG_AT_FL'] == 'GF'].copy()
-df = df.dropna(subset=['LAP_TIME_SEC', 'LAP_DELTA', 'S1_DELTA', 'S2_DELTA', 'S3_DELTA', 'BEST_LAP_TIME', 'TRACK_TEMP'])
-df = df[(df['LAP_DELTA'] >= 0) & (df['LAP_DELTA'] < 20)].copy() 
-
-# Stint logic
-df['CROSSING_FINISH_LINE_IN_PIT'] = pd.to_numeric(df['CROSSING_FINISH_LINE_IN_PIT'], errors='coerce').fillna(0).astype(int)
-df = df.sort_values(by=['NUMBER', 'LAP_NUMBER'])
-df['NEW_STINT_START'] = df.groupby('NUMBER')['CROSSING_FINISH_LINE_IN_PIT'].shift(1).fillna(0)
-df['STINT_ID'] = df.groupby('NUMBER')['NEW_STINT_START'].cumsum().astype(int)
-df['Laps_on_this_Tireset'] = df.groupby(['NUMBER', 'STINT_ID']).cumcount() + 1
-df['NUMBER'] = df['NUMBER'].astype(str)
-
-# --- 6. Merge with Telemetry (Aggression) Data ---
-print("Merging telemetry data (aggression metric)...")
-try:
-    df_agg = pd.read_parquet(TELEMETRY_AGG_FILE)
-    df_agg['NUMBER'] = df_agg['NUMBER'].astype(str)
-    df_agg['LAP_NUMBER'] = df_agg['LAP_NUMBER'].astype(int)
-    df_final = pd.merge(df, df_agg, on=['NUMBER', 'LAP_NUMBER'], how='left')
-except FileNotFoundError:
-    print(f"Warning: {TELEMETRY_AGG_FILE} not found. Aggression metric will be omitted.")
-    df_final = df.copy()
-    df_final['avg_aggressiveness'] = pd.NA
-
-# --- 7. Save Output ---
-print("Saving final dataset...")
-columns_to_keep = [
-    'NUMBER', 'LAP_NUMBER', 'LAP_TIME', 'LAP_TIME_SEC',
-    'STINT_ID', 'Laps_on_this_Tireset',
-    'S1_SEC', 'S2_SEC', 'S3_SEC', 'TOP_SPEED',
-    'TRACK_TEMP', 'AIR_TEMP', 'RAIN',
-    'BEST_LAP_TIME', 'LAP_DELTA',
-    'S1_DELTA', 'S2_DELTA', 'S3_DELTA', 
-    'avg_aggressiveness'
-]
-cols_exist = [col for col in columns_to_keep if col in df_final.columns]
-df_final = df_final[cols_exist].copy()
-
-os.makedirs(f'processed_data/{TRACK_NAME_OUT}', exist_ok=True)
-df_final.to_parquet(OUTPUT_FILE, index=False)
-print(f"Success! Data saved to {OUTPUT_FILE}")
\ No newline at end of file
+def process_race(track_name, race_num, laps_file_path, weather_file_path, race_date_str, track_timezone):
+    """Cleans and merges one race's laps, weather and telemetry features into {race}_processed.parquet."""
+    output_file = processed_file(track_name, race_num)
+    telemetry_file = telemetry_agg_file(track_name, race_num)
+    print(f"Starting data processing (v13 - Sectors) for: {track_name} - {race_num}")
+
+    df = load_laps_with_weather(laps_file_path, weather_file_path, race_date_str, track_timezone)
+
+    # --- 4. Ideal Times, "Deltas" and "Stints" ---
+    print("Calculating ideal times (lap and sectors), deltas and stints...")
+    df = add_lap_timing(df)
+
+    # --- 5. Merge with Telemetry (Aggression) Data ---
+    print("Merging telemetry data (aggression metric)...")
+    try:
+        df_agg = pd.read_parquet(telemetry_file)
+        df_agg['NUMBER'] = df_agg['NUMBER'].astype(str)
+        df_agg['LAP_NUMBER'] = df_agg['LAP_NUMBER'].astype(int)
+        df_final = pd.merge(df, df_agg, on=['NUMBER', 'LAP_NUMBER'], how='left')
+        # Every per-lap telemetry feature (avg_aggressiveness, brake, throttle, speed...)
+        telemetry_columns = [col for col in df_agg.columns if col not in ('NUMBER', 'LAP_NUMBER')]
+    except FileNotFoundError:
+        print(f"Warning: {telemetry_file} not found. Aggression metric will be omitted.")
+        df_final = df.copy()
+        df_final['avg_aggressiveness'] = pd.NA
+        telemetry_columns = []
+
+    # --- 6. Save Output ---
+    print("Saving final dataset...")
+    columns_to_keep = [
+        'NUMBER', 'LAP_NUMBER', 'LAP_TIME', 'LAP_TIME_SEC',
+        'STINT_ID', 'Laps_on_this_Tireset',
+        'S1_SEC', 'S2_SEC', 'S3_SEC', 'TOP_SPEED',
+        'TRACK_TEMP', 'AIR_TEMP', 'RAIN',
+        'BEST_LAP_TIME', 'LAP_DELTA',
+        'S1_DELTA', 'S2_DELTA', 'S3_DELTA', 
+        'avg_aggressiveness'
+    ]
+    columns_to_keep += [col for col in telemetry_columns if col not in columns_to_keep]
+    cols_exist = [col for col in columns_to_keep if col in df_final.columns]
+    df_final = df_final[cols_exist].copy()
+
+    os.makedirs(f'processed_data/{track_name}', exist_ok=True)
+    df_final.to_parquet(output_file, index=False)
+    print(f"Success! Data saved to {output_file}")
+    return output_file
+
+if __name__ == '__main__':
+    process_race(TRACK_NAME_OUT, RACE_NUM_OUT, LAPS_FILE_PATH, WEATHER_FILE_PATH, RACE_DATE_STR, TRACK_TIMEZONE)
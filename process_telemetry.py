@@ -1,9 +1,15 @@
 import pandas as pd
+import numpy as np
 import pytz
 import os
 import sys
 import json
 import re 
+import io
+import multiprocessing
+import pyarrow as pa
+import pyarrow.compute as pc
+from telemetry_aggregator import LapAggregator, stat_column
 
 # ===================================================================
 # --- TELEMETRY PROCESSING CONFIGURATION ---
@@ -114,8 +120,38 @@ TELEMETRY_FORMAT = 'LONG'
 # ===================================================================
 
 # Define output path
-OUTPUT_FILE = f'processed_data/{TRACK_NAME_OUT}/{RACE_NUM_OUT}_telemetry_agg.parquet'
+def telemetry_output_file(track_name, race_num):
+    return f'processed_data/{track_name}/{race_num}_telemetry_agg.parquet'
+OUTPUT_FILE = telemetry_output_file(TRACK_NAME_OUT, RACE_NUM_OUT)
 CHUNKSIZE = 3_000_000 
+# Parallel reading: the file is split into byte ranges (aligned to line
+# boundaries) that workers stream, filter and fold into per-lap partial
+# aggregates; the parent only merges those (a few thousand laps each).
+N_WORKERS = os.cpu_count() or 1
+RANGE_BYTES = 256 * 1024 * 1024
+# Rows per parsed chunk inside a worker (bounds each worker's memory)
+RANGE_CHUNKSIZE = 500_000
+
+# --- Per-Lap Telemetry Features ---
+# Every channel listed here is aggregated per (NUMBER, lap) in the same scan.
+#   'abs':   aggregate |value| (lateral/longitudinal G in both directions)
+#   'range': histogram range for percentiles (readings outside go to the edge bins)
+#   'stats': 'mean', 'min', 'max', 'var', 'p<q>' (e.g. 'p90'), 'above:<x>' (share of
+#            the lap's readings above x; channels are sampled at a fixed rate, so
+#            this is the share of lap time)
+# Columns are named <channel>[_abs]_<stat>; the mean |accy_can| keeps its
+# historical name, avg_aggressiveness (the model feature).
+TELEMETRY_CHANNELS = {
+    'accy_can': {'abs': True, 'range': (0, 3), 'stats': ['mean', 'p90']},
+    'accx_can': {'abs': True, 'range': (0, 3), 'stats': ['mean', 'p90']},
+    'pbrake_f': {'range': (0, 200), 'stats': ['mean', 'max', 'above:10']},
+    'aps': {'range': (0, 100), 'stats': ['mean', 'above:95']},
+    'speed': {'range': (0, 300), 'stats': ['mean', 'max', 'p10']},
+}
+FEATURE_ALIASES = {('accy_can', 'mean'): 'avg_aggressiveness'}
+# Aggregate from the partitioned store (telemetry_store.py) when the race has
+# been ingested there from the current CSV, instead of re-parsing the CSV.
+USE_TELEMETRY_STORE = True
 
 def clean_col_names(df):
     df.columns = df.columns.str.strip().str.replace('"', '', regex=False)
@@ -125,25 +161,42 @@ def clean_col_data(series):
 def extract_number_from_id(vehicle_id_str):
     """
     Extracts car number (e.g. '21') from ID (e.g. 'GR86-047-21')
+    Returns '0' for '000' IDs and None when the ID cannot be parsed.
     """
     try:
         vehicle_id_str = str(vehicle_id_str).strip().replace('"', '')
         # Logic: GR86-004-78 -> 78
         num_str = vehicle_id_str.split('-')[-1]
-        # Handle '000' cases (e.g. GR86-002-000)
-        if int(num_str) == 0 and 'vehicle_number' in globals():
-             # Fallback to global vehicle_number if ID is 000
-             return str(int(globals()['vehicle_number']))
         return str(int(num_str))
     except: 
-        # General Fallback
-        if 'vehicle_number' in globals():
-            return str(int(globals()['vehicle_number']))
         return None
+def number_from_vehicle_number(value):
+    try: return str(int(str(value).strip().replace('"', '')))
+    except: return None
+def map_unique(series, fn):
+    """series.apply(fn), calling fn once per distinct value."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    mapped = np.array([fn(u) for u in uniques], dtype=object)
+    return pd.Series(mapped[codes], index=series.index, dtype=object)
+def extract_numbers(chunk_df):
+    """
+    Car numbers from vehicle_id. IDs without a number (e.g. GR86-002-000) fall
+    back to the row's own vehicle_number column when the file has one.
+    """
+    # A race only has a few dozen distinct IDs: parse each once and map
+    numbers = map_unique(chunk_df['vehicle_id'], extract_number_from_id)
+    if 'vehicle_number' in chunk_df.columns:
+        missing = numbers.isna() | (numbers == '0')
+        numbers[missing] = map_unique(chunk_df.loc[missing, 'vehicle_number'], number_from_vehicle_number)
+    return numbers
 
 # --- Chunk Processors ---
 
-def process_long_chunk(chunk_df):
+def parse_timestamps(series):
+    return pd.to_datetime(clean_col_data(series), utc=True, errors='coerce', format='ISO8601')
+
+# channels=None keeps every channel; with_timestamp adds the parsed reading time.
+def process_long_chunk(chunk_df, channels=TELEMETRY_CHANNELS, with_timestamp=False):
     chunk_df = clean_col_names(chunk_df)
     
     # Clean data BEFORE filtering
@@ -152,7 +205,9 @@ def process_long_chunk(chunk_df):
     else:
         return None # Useless chunk
     
-    chunk_df = chunk_df[chunk_df['telemetry_name'] == 'accy_can'].copy()
+    if channels is not None:
+        chunk_df = chunk_df[chunk_df['telemetry_name'].isin(list(channels))]
+    chunk_df = chunk_df.copy()
     if chunk_df.empty: return None
 
     # Clean join columns
@@ -165,88 +220,342 @@ def process_long_chunk(chunk_df):
         chunk_df['NUMBER'] = clean_col_data(chunk_df['vehicle_number'])
     else:
         # Otherwise extract from ID
-        chunk_df['NUMBER'] = chunk_df['vehicle_id'].apply(extract_number_from_id)
-
-    return chunk_df[['NUMBER', 'lap', 'telemetry_value']]
-
-def process_json_chunk(chunk_df):
+        chunk_df['NUMBER'] = extract_numbers(chunk_df)
+
+    columns = ['NUMBER', 'lap', 'telemetry_name', 'telemetry_value']
+    if with_timestamp:
+        chunk_df['timestamp'] = parse_timestamps(chunk_df['timestamp'])
+        columns.append('timestamp')
+    return chunk_df[columns]
+
+# --- JSON Channel Extraction ---
+# Rows whose 'value' is a plain list of {"name": ..., "value": <number|null>}
+# objects are parsed with vectorized (pyarrow/RE2) regexes; anything else (escapes, extra
+# keys, strings, malformed JSON) falls back to json.loads row by row, so the
+# result is the same as parsing every row with json.loads.
+_WS = r'[ \t\n\r]*'
+_NUM = r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?'
+_ITEM = rf'\{{{_WS}"name"{_WS}:{_WS}"[A-Za-z0-9_.\-]*"{_WS},{_WS}"value"{_WS}:{_WS}(?:{_NUM}|null){_WS}\}}'
+SIMPLE_JSON_LIST = rf'{_WS}\[{_WS}(?:{_ITEM}(?:{_WS},{_WS}{_ITEM})*)?{_WS}\]{_WS}'
+
+def parse_json_value(json_str, channel='accy_can'):
+    try:
+        data = json.loads(json_str)
+        for item in data:
+            name = item.get('name', '').strip().replace('"', '')
+            if name == channel:
+                return item.get('value')
+        return None
+    except: return None
+
+def extract_json_channels(values, channels=('accy_can',)):
+    """Numeric value of every channel in every row of a JSON 'value' column: one column per channel (NaN when absent)."""
+    values = values.astype(str)
+    text = pa.array(values)
+    simple = pc.match_substring_regex(text, f'^{SIMPLE_JSON_LIST}$').to_numpy(zero_copy_only=False)
+    other = np.flatnonzero(~simple)
+    other_text = pa.array(values.iloc[other])
+
+    out = {}
+    for channel in channels:
+        # Bulk path: one RE2 pass over the column; the first occurrence wins, like the json.loads loop
+        pattern = rf'"{re.escape(channel)}"{_WS},{_WS}"value"{_WS}:{_WS}(?P<value>{_NUM}|null)'
+        matched = pc.struct_field(pc.extract_regex(text, pattern), 'value')
+        matched = pc.if_else(pc.equal(matched, 'null'), pa.scalar(None, pa.string()), matched)
+        column = pc.cast(matched, pa.float64()).to_numpy(zero_copy_only=False)
+        column[other] = np.nan
+
+        # Row-by-row path for everything the grammar does not cover
+        slow = other[pc.match_substring(other_text, channel).to_numpy(zero_copy_only=False)] if len(other) else other
+        if len(slow):
+            column[slow] = pd.to_numeric(values.iloc[slow].apply(parse_json_value, channel=channel), errors='coerce')
+        out[channel] = column
+    return pd.DataFrame(out, index=values.index)
+
+def parse_json_items(json_str):
+    """Every channel of one row ({name: first value}), like running parse_json_value for each name."""
+    found = {}
+    try:
+        for item in json.loads(json_str):
+            name = item.get('name', '').strip().replace('"', '')
+            found.setdefault(name, item.get('value'))
+    except: pass
+    return found
+
+def explode_json_values(values):
+    """Every reading of a JSON 'value' column as (row position, telemetry_name, telemetry_value) rows."""
+    values = values.astype(str)
+    text = pa.array(values)
+    simple = pc.match_substring_regex(text, f'^{SIMPLE_JSON_LIST}$').to_numpy(zero_copy_only=False)
+
+    # Bulk path: split the valid rows into items, then one RE2 pass pulls out (name, value)
+    rows = np.flatnonzero(simple)
+    items = pc.split_pattern_regex(text.take(pa.array(rows)), rf'\}}{_WS},{_WS}\{{')
+    pairs = pc.extract_regex(
+        pc.list_flatten(items),
+        rf'"name"{_WS}:{_WS}"(?P<name>[A-Za-z0-9_.\-]*)"{_WS},{_WS}"value"{_WS}:{_WS}(?P<value>{_NUM}|null)'
+    )
+    readings = pc.struct_field(pairs, 'value')
+    readings = pc.if_else(pc.equal(readings, 'null'), pa.scalar(None, pa.string()), readings)
+    fast = pd.DataFrame({
+        'row': rows[pc.list_parent_indices(items).to_numpy()],
+        'telemetry_name': pc.struct_field(pairs, 'name').to_numpy(zero_copy_only=False),
+        'telemetry_value': pc.cast(readings, pa.float64()).to_numpy(zero_copy_only=False),
+    }).dropna(subset=['telemetry_name']) # Items of empty lists
+
+    # Row-by-row path for everything the grammar does not cover
+    slow = [
+        (row, name, value)
+        for row in np.flatnonzero(~simple)
+        for name, value in parse_json_items(values.iloc[row]).items()
+    ]
+    slow = pd.DataFrame(slow, columns=['row', 'telemetry_name', 'telemetry_value'])
+    slow['telemetry_value'] = pd.to_numeric(slow['telemetry_value'], errors='coerce')
+
+    readings = pd.concat([fast, slow]) if len(slow) else fast
+    # First occurrence of a channel in a row wins, like the json.loads loop
+    readings = readings.drop_duplicates(['row', 'telemetry_name'])
+    return readings.sort_values('row', kind='stable').reset_index(drop=True)
+
+def json_channel_readings(values, channels):
+    """Readings of the wanted channels as (row position, telemetry_name, telemetry_value) rows."""
+    wide = extract_json_channels(values, channels)
+    parts = []
+    for channel in channels:
+        rows = np.flatnonzero(wide[channel].notna().to_numpy())
+        parts.append(pd.DataFrame({'row': rows, 'telemetry_name': channel, 'telemetry_value': wide[channel].to_numpy()[rows]}))
+    return pd.concat(parts, ignore_index=True)
+
+# channels=None keeps every channel; with_timestamp adds the parsed reading time.
+def process_json_chunk(chunk_df, channels=TELEMETRY_CHANNELS, with_timestamp=False):
     chunk_df = clean_col_names(chunk_df)
-    
-    def parse_json_value(json_str):
-        try:
-            data = json.loads(json_str)
-            for item in data:
-                name = item.get('name', '').strip().replace('"', '')
-                if name == 'accy_can':
-                    return item.get('value')
-            return None
-        except: return None
-            
-    chunk_df['telemetry_value'] = chunk_df['value'].apply(parse_json_value)
-    chunk_df = chunk_df.dropna(subset=['telemetry_value'])
-    if chunk_df.empty: return None
+    if channels is None:
+        readings = explode_json_values(chunk_df['value'])
+    else:
+        readings = json_channel_readings(chunk_df['value'], list(channels))
+    if readings.empty: return None
 
+    rows = np.unique(readings['row'])
+    chunk_df = chunk_df.iloc[rows].copy()
     # Clean join columns
     chunk_df['vehicle_id'] = clean_col_data(chunk_df['vehicle_id'])
     chunk_df['lap'] = pd.to_numeric(clean_col_data(chunk_df['lap']), errors='coerce')
-    chunk_df['telemetry_value'] = pd.to_numeric(chunk_df['telemetry_value'], errors='coerce')
-    
     # Extract car number
-    chunk_df['NUMBER'] = chunk_df['vehicle_id'].apply(extract_number_from_id)
+    chunk_df['NUMBER'] = extract_numbers(chunk_df)
+
+    # One row per (reading, channel), like the LONG format
+    columns = ['NUMBER', 'lap'] + (['timestamp'] if with_timestamp else [])
+    if with_timestamp:
+        chunk_df['timestamp'] = parse_timestamps(chunk_df['timestamp'])
+    out = chunk_df[columns].take(np.searchsorted(rows, readings['row']))
+    out['telemetry_name'] = readings['telemetry_name'].to_numpy()
+    out['telemetry_value'] = readings['telemetry_value'].to_numpy()
+    return out[['NUMBER', 'lap', 'telemetry_name', 'telemetry_value'] + columns[2:]]
+
+def process_chunk(chunk_df, telemetry_format, channels=TELEMETRY_CHANNELS, with_timestamp=False):
+    if telemetry_format == 'LONG':
+        return process_long_chunk(chunk_df, channels, with_timestamp)
+    elif telemetry_format == 'JSON':
+        return process_json_chunk(chunk_df, channels, with_timestamp)
+    raise ValueError(f"Unknown format '{telemetry_format}'.")
+
+# --- Readers ---
+# The serial reader yields the filtered (NUMBER, lap, telemetry_value) rows
+# in file order; the parallel one returns the merged per-lap aggregates,
+# equal to the serial result up to the rounding of the merged sums.
+
+def read_telemetry_serial(file_path, telemetry_format):
+    with pd.read_csv(file_path, sep=',', chunksize=CHUNKSIZE, on_bad_lines='skip') as reader:
+        for i, chunk in enumerate(reader):
+            print(f"  Processing chunk #{i+1}...")
+            agg_chunk = process_chunk(chunk, telemetry_format)
+            if agg_chunk is not None and not agg_chunk.empty:
+                print(f"    > Success! Found {len(agg_chunk)} channel readings.")
+                yield agg_chunk
+
+def split_byte_ranges(file_path, n_ranges):
+    """
+    Splits the data rows of a CSV into ~n_ranges byte ranges, each starting right
+    after a newline. Returns the header line and the (start, end) offsets.
+    Assumes no quoted field contains a newline (true for the telemetry exports).
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        bounds = [data_start]
+        for k in range(1, n_ranges):
+            target = data_start + (size - data_start) * k // n_ranges
+            if target <= bounds[-1]: continue
+            f.seek(target - 1)
+            f.readline() # Move to the start of the next full line
+            if f.tell() >= size: break
+            if f.tell() > bounds[-1]: bounds.append(f.tell())
+    bounds.append(size)
+    return header, [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+class ByteRangeFile(io.RawIOBase):
+    """Read-only stream of a CSV header followed by bytes [start, end) of the file, read as it is consumed."""
+
+    def __init__(self, file_path, header, start, end):
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._header, self._remaining = header, end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        if self._header:
+            n = min(len(view), len(self._header))
+            view[:n] = self._header[:n]
+            self._header = self._header[n:]
+            return n
+        n = min(len(view), self._remaining)
+        if n <= 0:
+            return 0
+        n = self._file.readinto(view[:n])
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def process_byte_range(args):
+    """Worker: streams one byte range chunk by chunk and folds it into per-lap aggregators."""
+    file_path, header, start, end, telemetry_format = args
+    aggregators, n_readings = make_aggregators(), 0
+    with io.BufferedReader(ByteRangeFile(file_path, header, start, end)) as stream:
+        with pd.read_csv(stream, sep=',', chunksize=RANGE_CHUNKSIZE, on_bad_lines='skip') as reader:
+            for chunk in reader:
+                agg_chunk = process_chunk(chunk, telemetry_format)
+                if agg_chunk is not None and not agg_chunk.empty:
+                    n_readings += len(fold_telemetry(aggregators, agg_chunk))
+    return aggregators, n_readings
+
+def aggregate_telemetry_parallel(file_path, telemetry_format, n_workers=N_WORKERS, channels=TELEMETRY_CHANNELS):
+    """Like aggregate_telemetry(read_telemetry_serial(...)), with the byte ranges folded in worker processes."""
+    n_ranges = max(n_workers, -(-os.path.getsize(file_path) // RANGE_BYTES))
+    header, ranges = split_byte_ranges(file_path, n_ranges)
+    tasks = [(file_path, header, start, end, telemetry_format) for start, end in ranges]
+    print(f"  Split into {len(tasks)} byte ranges across {n_workers} workers...")
+    aggregators = make_aggregators(channels)
+    with multiprocessing.Pool(n_workers) as pool:
+        # imap returns the ranges in file order, so each lap's partials merge in reading order
+        for i, (partial, n_readings) in enumerate(pool.imap(process_byte_range, tasks)):
+            print(f"    > Range #{i+1}: folded {n_readings} channel readings.")
+            for channel, aggregator in partial.items():
+                aggregators[channel].merge(aggregator)
+    return telemetry_features(aggregators, channels)
+
+# --- Aggregation ---
+# Chunks are folded into running per-(NUMBER, lap) sums as they arrive, so
+# memory stays bounded by the number of laps, not the number of readings.
+
+def feature_column(channel, stat, config):
+    alias = FEATURE_ALIASES.get((channel, stat))
+    if alias: return alias
+    return f"{channel}{'_abs' if config.get('abs') else ''}_{stat_column(stat)}"
+
+def make_aggregators(channels=TELEMETRY_CHANNELS):
+    return {
+        channel: LapAggregator(config['stats'], config.get('range'))
+        for channel, config in channels.items()
+    }
+
+def fold_telemetry(aggregators, agg_chunk, channels=TELEMETRY_CHANNELS):
+    """Folds one filtered chunk into the running per-lap stats of each channel. Returns the readings kept."""
+    agg_chunk = agg_chunk.dropna(subset=['NUMBER', 'lap', 'telemetry_value'])
+    # Filter out invalid telemetry laps
+    agg_chunk = agg_chunk[agg_chunk['lap'] < 1000]
+    # groupby keeps every channel's readings in file order
+    for channel, readings in agg_chunk.groupby('telemetry_name', sort=False):
+        values = readings['telemetry_value']
+        if channels[channel].get('abs'): values = values.abs()
+        aggregators[channel].add(readings['NUMBER'], readings['lap'], values)
+    return agg_chunk
+
+def aggregate_telemetry(agg_chunks, channels=TELEMETRY_CHANNELS):
+    """Wide per-(NUMBER, lap) feature table, streamed from the filtered chunks in one pass."""
+    aggregators = make_aggregators(channels)
+    for agg_chunk in agg_chunks:
+        fold_telemetry(aggregators, agg_chunk, channels)
+    return telemetry_features(aggregators, channels)
+
+def telemetry_features(aggregators, channels=TELEMETRY_CHANNELS, keys=None, verbose=True):
+    """
+    Wide per-(NUMBER, LAP_NUMBER) feature table of the laps folded so far (None if
+    there are none); keys limits it to those (NUMBER, lap) pairs.
+    """
+    parts, columns = [], []
+    for channel, aggregator in aggregators.items():
+        names = {stat_column(stat): feature_column(channel, stat, channels[channel]) for stat in channels[channel]['stats']}
+        columns += list(names.values())
+        if len(aggregator) == 0:
+            continue
+        if verbose: print(f"Calculating {channel} features for {len(aggregator)} laps...")
+        parts.append(aggregator.result(keys).rename(columns=names))
+    if not parts:
+        return None
 
-    return chunk_df[['NUMBER', 'lap', 'telemetry_value']]
+    first = parts[0]
+    if all(p['lap'].dtype == first['lap'].dtype and p['NUMBER'].equals(first['NUMBER']) and p['lap'].equals(first['lap']) for p in parts[1:]):
+        # Usual case: every channel has the same (sorted) laps, so columns line up as they are
+        df_final = pd.concat([first] + [p.drop(columns=['NUMBER', 'lap']) for p in parts[1:]], axis=1)
+    else:
+        df_final = first
+        for df_channel in parts[1:]:
+            df_final = pd.merge(df_final, df_channel, on=['NUMBER', 'lap'], how='outer')
+        df_final = df_final.sort_values(['NUMBER', 'lap']).reset_index(drop=True)
+    df_final = df_final.reindex(columns=['NUMBER', 'lap'] + columns)
+    return df_final.rename(columns={'lap': 'LAP_NUMBER'})
 
 # --- START TELEMETRY PROCESSING ---
-print(f"Starting telemetry processing (v-FINAL-v2) for: {TRACK_NAME_OUT} - {RACE_NUM_OUT}")
-
-print(f"Loading giant file in chunks: {TELEMETRY_FILE_PATH}")
-all_agg_chunks = []
-try:
-    with pd.read_csv(TELEMETRY_FILE_PATH, sep=',', chunksize=CHUNKSIZE, on_bad_lines='skip') as reader:
-        for i, chunk in enumerate(reader):
-            print(f"  Processing chunk #{i+1}...")
-            
-            # Set global vehicle_number fallback if available
-            if 'vehicle_number' in chunk.columns:
-                globals()['vehicle_number'] = chunk['vehicle_number'].iloc[0]
-            
-            if TELEMETRY_FORMAT == 'LONG':
-                agg_chunk = process_long_chunk(chunk)
-            elif TELEMETRY_FORMAT == 'JSON':
-                agg_chunk = process_json_chunk(chunk)
-            else:
-                print(f"Error: Unknown format '{TELEMETRY_FORMAT}'."); sys.exit()
-            
-            if agg_chunk is not None:
-                if not agg_chunk.empty:
-                    all_agg_chunks.append(agg_chunk)
-                    print(f"    > Success! Found {len(agg_chunk)} 'accy_can' readings.")
-
-except Exception as e:
-    print(f"Unexpected error reading CSV: {e}"); sys.exit()
-
-if not all_agg_chunks:
-    print("Error: Could not process any telemetry data."); sys.exit()
-
-# --- PHASE 2: Concatenate ---
-print("Merging chunk results...")
-df_full_agg = pd.concat(all_agg_chunks)
-
-if df_full_agg.empty:
-    print("Error: No matching 'accy_can' data found."); sys.exit()
-
-# --- PHASE 3: Final Aggregation ---
-print("Calculating average aggression per lap...")
-df_full_agg = df_full_agg.dropna(subset=['NUMBER', 'lap', 'telemetry_value'])
-df_full_agg['telemetry_value'] = df_full_agg['telemetry_value'].abs()
-# Filter out invalid telemetry laps
-df_full_agg = df_full_agg[df_full_agg['lap'] < 1000] 
-    
-df_final = df_full_agg.groupby(['NUMBER', 'lap'])['telemetry_value'].mean().reset_index()
-df_final = df_final.rename(columns={'telemetry_value': 'avg_aggressiveness', 'lap': 'LAP_NUMBER'})
-
-# --- PHASE 4: Save ---
-os.makedirs(f'processed_data/{TRACK_NAME_OUT}', exist_ok=True)
-df_final.to_parquet(OUTPUT_FILE, index=False)
-print("---")
-print(f"Success! Aggregated telemetry data saved to {OUTPUT_FILE}")
\ No newline at end of file
+def process_race_telemetry(track_name, race_num, telemetry_file_path, telemetry_format, n_workers=N_WORKERS):
+    """Per-lap telemetry features of one race, saved to {race}_telemetry_agg.parquet."""
+    print(f"Starting telemetry processing (v-FINAL-v2) for: {track_name} - {race_num}")
+    if telemetry_format not in ('LONG', 'JSON'):
+        print(f"Error: Unknown format '{telemetry_format}'."); sys.exit()
+
+    import telemetry_store
+    use_store = USE_TELEMETRY_STORE and telemetry_store.has_race(track_name, race_num)
+    if use_store and not telemetry_store.is_current(track_name, race_num, telemetry_file_path):
+        print(f"Stored partitions were not ingested from the current {telemetry_file_path}: ignoring them "
+              f"(re-ingest with telemetry_store.py).")
+        use_store = False
+    try:
+        if use_store:
+            print(f"Reading stored partitions: {telemetry_store.race_path(track_name, race_num)}")
+            df_final = aggregate_telemetry(telemetry_store.iter_race_chunks(track_name, race_num, channels=list(TELEMETRY_CHANNELS)))
+        elif n_workers > 1:
+            print(f"Loading giant file in chunks: {telemetry_file_path}")
+            df_final = aggregate_telemetry_parallel(telemetry_file_path, telemetry_format, n_workers)
+        else:
+            print(f"Loading giant file in chunks: {telemetry_file_path}")
+            df_final = aggregate_telemetry(read_telemetry_serial(telemetry_file_path, telemetry_format))
+    except Exception as e:
+        print(f"Unexpected error reading CSV: {e}"); sys.exit()
+
+    if df_final is None:
+        print("Error: No matching telemetry channels found."); sys.exit()
+
+    # --- Save ---
+    output_file = telemetry_output_file(track_name, race_num)
+    os.makedirs(f'processed_data/{track_name}', exist_ok=True)
+    df_final.to_parquet(output_file, index=False)
+    print("---")
+    print(f"Success! Aggregated telemetry data saved to {output_file}")
+    return output_file
+
+def main():
+    # python process_telemetry.py --live follows the configured file while it is being written
+    if '--live' in sys.argv[1:]:
+        import telemetry_live
+        telemetry_live.follow(TRACK_NAME_OUT, RACE_NUM_OUT, TELEMETRY_FILE_PATH, TELEMETRY_FORMAT)
+        return
+    process_race_telemetry(TRACK_NAME_OUT, RACE_NUM_OUT, TELEMETRY_FILE_PATH, TELEMETRY_FORMAT)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import numpy as np
+import pandas as pd
+import heapq
+import weakref
+from collections import namedtuple, defaultdict
+from forest_engine import FlatForest
+
+# ===================================================================
+# --- STRATEGY SIMULATION ENGINE ---
+# Shared by the Streamlit app and the offline tools. Every scenario is
+# laid out as a (n_scenarios, n_laps) array of tire ages and evaluated
+# with a single batched model call.
+# ===================================================================
+
+# --- Calibration Constants ---
+# Time lost in pit lane (excluding tire change time)
+PIT_LANE_TIMES = {
+    'Barber': 34.0, 'COTA': 36.0, 'Indianapolis': 63.0, 'RoadAmerica': 52.0,
+    'Sebring': 39.0, 'Sonoma': 45.0, 'VIR': 25.0
+}
+# Estimated time lost under Full Course Yellow (FCY)
+GLOBAL_YELLOW_PIT_COST = 20.0
+
+# tire_ages, lap_deltas and pit_costs are (n_scenarios, n_laps) arrays,
+# totals is (n_scenarios,) = degradation + pit lane time per scenario.
+# tree_totals (only with per_tree=True) is (n_trees, n_scenarios): the totals
+# each tree of the forest would predict on its own.
+SimulationResult = namedtuple('SimulationResult', ['tire_ages', 'lap_deltas', 'pit_costs', 'totals', 'tree_totals'], defaults=(None,))
+# time_loss[k] is the race time lost when stopping on pit_laps[k]; the window is
+# the contiguous run of laps around the optimum within `tolerance` seconds of it.
+PitWindow = namedtuple('PitWindow', [
+    'pit_laps', 'time_loss', 'optimal_lap', 'optimal_loss',
+    'window_start', 'window_end', 'window_width', 'no_stop_loss'
+])
+# pit_laps is the tuple of relative laps with a stop (empty = no stop)
+StrategyPlan = namedtuple('StrategyPlan', ['pit_laps', 'total_loss'])
+
+# --- Model Inputs ---
+
+def get_feature_matrix(model, laps, temp, aggressiveness):
+    """Broadcasts the inputs and stacks them as (n_rows, n_features) in the model's feature order."""
+    laps, temp, aggressiveness = np.broadcast_arrays(laps, temp, aggressiveness)
+    columns = {'Laps_on_this_Tireset': laps, 'TRACK_TEMP': temp, 'avg_aggressiveness': aggressiveness}
+    return np.column_stack([np.ravel(columns[f]) for f in model.feature_names_in_]).astype(float)
+
+def get_prediction_dataframe(model, laps, temp, aggressiveness):
+    """Creates the input DataFrame for the model with correct feature names."""
+    X = get_feature_matrix(model, laps, temp, aggressiveness)
+    return pd.DataFrame(X, columns=model.feature_names_in_)
+
+def predict_batch(model, laps, temp, aggressiveness):
+    """
+    Predicted LAP_DELTA for broadcastable inputs, returned in the broadcast shape.
+    Identical feature rows (constant temp/aggression, repeated tire ages) are
+    collapsed so the model only sees each distinct row once, in one predict call.
+    Fitted forests run on their FlatForest copy (same predictions, without
+    sklearn's per-call overhead). Predictors with a predict_matrix method (the
+    flat forest, the degradation surface) take the raw array directly.
+    """
+    shape = np.broadcast(laps, temp, aggressiveness).shape
+    X = get_feature_matrix(model, laps, temp, aggressiveness)
+    if hasattr(model, 'estimators_'):
+        model = get_flat_forest(model)
+    if hasattr(model, 'predict_matrix'):
+        return np.asarray(model.predict_matrix(X), dtype=float).reshape(shape)
+    unique_rows, inverse = np.unique(X, axis=0, return_inverse=True)
+    preds = np.asarray(model.predict(pd.DataFrame(unique_rows, columns=model.feature_names_in_)), dtype=float)
+    return preds[inverse.reshape(-1)].reshape(shape)
+
+def get_prediction(model, laps, temp, aggressiveness):
+    """Returns the predicted LAP_DELTA for a specific lap."""
+    return float(predict_batch(model, laps, temp, aggressiveness).reshape(-1)[0])
+
+# --- Per-Tree Predictions (Uncertainty) ---
+
+_FLAT_FORESTS = weakref.WeakKeyDictionary()
+
+def get_flat_forest(model):
+    """FlatForest copy of a fitted forest, built once per model object."""
+    if isinstance(model, FlatForest): return model
+    flat = _FLAT_FORESTS.get(model)
+    if flat is None:
+        flat = _FLAT_FORESTS[model] = FlatForest.from_model(model)
+    return flat
+
+def predict_batch_per_tree(model, laps, temp, aggressiveness):
+    """
+    LAP_DELTA from every tree of the forest: (n_trees, *broadcast shape).
+    All trees walk the distinct cells of the batch together in one pass.
+    """
+    shape = np.broadcast(laps, temp, aggressiveness).shape
+    X = get_feature_matrix(model, laps, temp, aggressiveness)
+    per_tree = get_flat_forest(model).predict_per_tree(X)
+    return per_tree.reshape((per_tree.shape[0],) + shape)
+
+def prediction_band(tree_values, coverage=0.9):
+    """(low, high) quantiles across trees (axis 0) holding `coverage` of the tree predictions."""
+    alpha = (1.0 - coverage) / 2.0
+    low, high = np.quantile(tree_values, [alpha, 1.0 - alpha], axis=0)
+    return low, high
+
+def predict_quantiles(model, laps, temp, aggressiveness, quantiles=(0.05, 0.5, 0.95)):
+    """Quantiles of LAP_DELTA across the forest's trees: (len(quantiles), *broadcast shape)."""
+    return np.quantile(predict_batch_per_tree(model, laps, temp, aggressiveness), quantiles, axis=0)
+
+def get_prediction_interval(model, laps, temp, aggressiveness, coverage=0.9):
+    """Returns (low, mean, high) of the predicted LAP_DELTA for a specific lap across the trees."""
+    per_tree = predict_batch_per_tree(model, laps, temp, aggressiveness).reshape(-1)
+    low, high = prediction_band(per_tree, coverage)
+    return float(low), float(per_tree.mean()), float(high)
+
+# --- Scenario Construction ---
+
+def _per_scenario(value):
+    """Turns a per-scenario vector into a column so it broadcasts against (n_scenarios, n_laps)."""
+    value = np.asarray(value, dtype=float)
+    return value[:, None] if value.ndim == 1 else value
+
+def build_tire_trajectories(start_tire_laps, n_laps, pit_laps):
+    """
+    Tire age on each of the next n_laps, one row per scenario.
+    pit_laps is the relative lap (1-based) of the stop; 0 or anything past
+    n_laps means the car stays out. The tires are new (age 1) on the pit lap.
+    """
+    start = np.atleast_1d(np.asarray(start_tire_laps, dtype=int))[:, None]
+    pit = np.atleast_1d(np.asarray(pit_laps, dtype=int))[:, None]
+    start, pit = np.broadcast_arrays(start, pit)
+    lap = np.arange(1, n_laps + 1)
+    pitted = (pit >= 1) & (lap >= pit)
+    return np.where(pitted, lap - pit + 1, start + lap)
+
+def simulate_scenarios(model, start_tire_laps, n_laps, pit_laps, pit_costs, track_temp, driver_aggression, per_tree=False):
+    """
+    Simulates many single-stop scenarios at once.
+    start_tire_laps, pit_laps and pit_costs are scalars or one value per scenario;
+    track_temp and driver_aggression may also be (n_scenarios, n_laps) trajectories.
+    per_tree=True (forest models only) also returns every tree's totals.
+    """
+    tire_ages = build_tire_trajectories(start_tire_laps, n_laps, pit_laps)
+    n_scenarios = tire_ages.shape[0]
+    temps, aggs = _per_scenario(track_temp), _per_scenario(driver_aggression)
+    tree_deltas = None
+    if per_tree:
+        tree_deltas = np.broadcast_to(predict_batch_per_tree(model, tire_ages, temps, aggs), (get_flat_forest(model).n_trees,) + tire_ages.shape)
+        lap_deltas = tree_deltas.mean(axis=0)
+    else:
+        lap_deltas = np.broadcast_to(predict_batch(model, tire_ages, temps, aggs), tire_ages.shape)
+
+    pit = np.broadcast_to(np.atleast_1d(pit_laps), (n_scenarios,))[:, None]
+    cost = np.broadcast_to(np.atleast_1d(np.asarray(pit_costs, dtype=float)), (n_scenarios,))[:, None]
+    lap = np.arange(1, n_laps + 1)
+    pit_costs_per_lap = np.where(lap == pit, cost, 0.0)
+
+    totals = lap_deltas.sum(axis=1) + pit_costs_per_lap.sum(axis=1)
+    tree_totals = None if tree_deltas is None else tree_deltas.sum(axis=2) + pit_costs_per_lap.sum(axis=1)
+    return SimulationResult(tire_ages, lap_deltas, pit_costs_per_lap, totals, tree_totals)
+
+# --- Decision Tools ---
+
+def simulate_caution_scenarios(model, current_tire_laps, laps_remaining, track_temp, driver_aggression, green_pit_lap, green_pit_cost, yellow_pit_cost, per_tree=False):
+    """
+    Caution Flag Calculator: row 0 pits now under yellow (relative lap 1),
+    row 1 stays out and pits under green on green_pit_lap.
+    """
+    return simulate_scenarios(
+        model, current_tire_laps, laps_remaining,
+        [1, green_pit_lap], [yellow_pit_cost, green_pit_cost],
+        track_temp, driver_aggression, per_tree
+    )
+
+def simulate_battle_scenarios(model, my_tire_laps, rival_tire_laps, track_temp, driver_aggression, my_pit_lap, rival_pit_lap, green_pit_cost, cycle_laps=3, per_tree=False):
+    """Battle Simulator: row 0 is our car, row 1 the rival, over the same cycle."""
+    return simulate_scenarios(
+        model, [my_tire_laps, rival_tire_laps], cycle_laps,
+        [my_pit_lap, rival_pit_lap], green_pit_cost,
+        track_temp, driver_aggression, per_tree
+    )
+
+def simulate_race_remaining(model, current_tire_laps, laps_remaining, track_temp, driver_aggression, pit_now, green_pit_lap, green_pit_cost, yellow_pit_cost):
+    """
+    Simulates the total time lost (delta) for the remainder of the race.
+    """
+    # Logic: If we pit now, we pit on relative lap 1.
+    # If we stay out, we pit on the target green flag lap.
+    target_pit_lap = 1 if pit_now else green_pit_lap
+    actual_pit_cost = yellow_pit_cost if pit_now else green_pit_cost
+    result = simulate_scenarios(model, current_tire_laps, laps_remaining, target_pit_lap, actual_pit_cost, track_temp, driver_aggression)
+    return float(result.totals[0])
+
+def simulate_pit_battle(model, initial_tire_laps, track_temp, driver_aggression, pit_lap, green_pit_cost, cycle_laps=3):
+    """
+    Simulates a 3-lap battle (Undercut/Overcut) to calculate total time.
+    """
+    result = simulate_scenarios(model, initial_tire_laps, cycle_laps, pit_lap, green_pit_cost, track_temp, driver_aggression)
+    return float(result.totals[0])
+
+def optimize_pit_window(model, current_tire_laps, laps_remaining, track_temp, driver_aggression, green_pit_cost, yellow_pit_cost=None, tolerance=1.0):
+    """
+    Sweeps every candidate pit lap of the remaining distance in one batched simulation.
+    With yellow_pit_cost set (a caution is out now), a stop on relative lap 1 costs
+    the yellow price and every later stop the green one.
+    """
+    pit_laps = np.arange(1, laps_remaining + 1)
+    costs = np.full(laps_remaining, float(green_pit_cost))
+    if yellow_pit_cost is not None:
+        costs[0] = yellow_pit_cost
+
+    # Last row is the "no stop" reference (pit lap 0)
+    result = simulate_scenarios(
+        model, current_tire_laps, laps_remaining,
+        np.append(pit_laps, 0), np.append(costs, 0.0),
+        track_temp, driver_aggression
+    )
+    time_loss, no_stop_loss = result.totals[:-1], float(result.totals[-1])
+
+    best = int(np.argmin(time_loss))
+    within = time_loss <= time_loss[best] + tolerance
+    start, end = best, best
+    while start > 0 and within[start - 1]: start -= 1
+    while end < laps_remaining - 1 and within[end + 1]: end += 1
+
+    return PitWindow(
+        pit_laps, time_loss, int(pit_laps[best]), float(time_loss[best]),
+        int(pit_laps[start]), int(pit_laps[end]), end - start + 1, no_stop_loss
+    )
+
+# --- Multi-Stop Strategy Solver ---
+
+def degradation_cost_table(model, max_tire_age, track_temp, driver_aggression):
+    """LAP_DELTA for every tire age 1..max_tire_age in one batched call (index 0 is unused)."""
+    ages = np.arange(1, max_tire_age + 1)
+    return np.concatenate([[np.nan], predict_batch(model, ages, track_temp, driver_aggression)])
+
+def solve_pit_strategy(model, current_tire_laps, laps_remaining, track_temp, driver_aggression, green_pit_cost, yellow_pit_cost=GLOBAL_YELLOW_PIT_COST, caution_laps=(), max_stops=2, n_plans=5):
+    """
+    Exact multi-stop plan by dynamic programming over (lap, tire age, stops used).
+    Stops on laps listed in caution_laps (relative, 1-based) cost yellow_pit_cost,
+    all others green_pit_cost. Each state keeps its n_plans cheapest partial plans,
+    so the runner-up plans come out of the same O(laps^2 * stops * n_plans) pass.
+    """
+    deg = degradation_cost_table(model, current_tire_laps + laps_remaining, track_temp, driver_aggression)
+    caution_laps = set(caution_laps)
+
+    # (tire age, stops used) -> sorted list of (time lost so far, pit laps)
+    states = {(current_tire_laps, 0): [(0.0, ())]}
+    for lap in range(1, laps_remaining + 1):
+        pit_cost = yellow_pit_cost if lap in caution_laps else green_pit_cost
+        candidates = defaultdict(list)
+        for (age, stops), plans in states.items():
+            for loss, pits in plans:
+                candidates[(age + 1, stops)].append((loss + deg[age + 1], pits))
+                if stops < max_stops:
+                    candidates[(1, stops + 1)].append((loss + pit_cost + deg[1], pits + (lap,)))
+        states = {key: heapq.nsmallest(n_plans, plans) for key, plans in candidates.items()}
+
+    finals = heapq.nsmallest(n_plans, (plan for plans in states.values() for plan in plans))
+    return [StrategyPlan(pits, float(loss)) for loss, pits in finals]
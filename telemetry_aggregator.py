@@ -0,0 +1,243 @@
+import re
+import numpy as np
+import pandas as pd
+
+# ===================================================================
+# --- STREAMING PER-LAP TELEMETRY AGGREGATION ---
+# Keeps running statistics per (NUMBER, lap) and folds every parsed
+# chunk into them, so memory grows with the number of laps instead of
+# the number of telemetry rows. Aggregators of different parts of a file
+# (e.g. the byte ranges parsed by separate workers) merge into one.
+# ===================================================================
+
+# Statistics a LapAggregator can keep:
+#   'mean', 'min', 'max', 'var'   exact running statistics
+#   'p<q>' (e.g. 'p90')           percentile from a fixed histogram over value_range
+#   'above:<x>'                   share of the lap's readings above x
+EXACT_STATS = ('mean', 'min', 'max', 'var')
+HISTOGRAM_BINS = 512
+
+
+def stat_column(stat):
+    """Column suffix of a statistic ('above:5' -> 'above_5')."""
+    return stat.replace(':', '_')
+
+
+class LapAggregator:
+    """
+    Running statistics of one value stream per (NUMBER, lap).
+    The mean is a Kahan-compensated sum folded in file order, exactly like
+    pandas' groupby().mean(), so it is bit-identical to a concat-then-groupby
+    over the same rows. merge() adds another aggregator's laps; merged sums are
+    compensated too, but may differ from a single pass in the last bit.
+    """
+
+    def __init__(self, stats=('mean',), value_range=None, n_bins=HISTOGRAM_BINS):
+        self.stats = tuple(stats)
+        self.percentiles, self.thresholds = [], []
+        for stat in self.stats:
+            if stat in EXACT_STATS: continue
+            if re.fullmatch(r'p\d+(\.\d+)?', stat): self.percentiles.append(float(stat[1:]))
+            elif stat.startswith('above:'): self.thresholds.append(float(stat.split(':', 1)[1]))
+            else: raise ValueError(f"Unknown statistic: {stat}")
+        if self.percentiles and value_range is None:
+            raise ValueError("Percentiles need a value_range for the histogram.")
+        self.bin_edges = np.linspace(value_range[0], value_range[1], n_bins + 1) if self.percentiles else None
+
+        self._slots = {}       # (NUMBER, lap) -> row in the state arrays
+        self._numbers, self._laps = [], []
+        self._lap_dtype = None
+        self._size = 0
+        self._state = {name: np.zeros((0,) + shape) for name, shape in self._state_shapes().items()}
+
+    def _state_shapes(self):
+        shapes = {'sum': (), 'compensation': (), 'count': ()}
+        if 'min' in self.stats: shapes['min'] = ()
+        if 'max' in self.stats: shapes['max'] = ()
+        if 'var' in self.stats: shapes.update(mean=(), m2=())
+        if self.percentiles: shapes['histogram'] = (len(self.bin_edges) - 1,)
+        if self.thresholds: shapes['above'] = (len(self.thresholds),)
+        return shapes
+
+    def __len__(self):
+        return self._size
+
+    # --- State Management ---
+
+    def _grow(self, needed):
+        capacity = len(self._state['sum'])
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, 2 * capacity, 64)
+        for name, array in self._state.items():
+            fill = np.inf if name == 'min' else -np.inf if name == 'max' else 0.0
+            grown = np.full((new_capacity,) + array.shape[1:], fill)
+            grown[:capacity] = array
+            self._state[name] = grown
+
+    def _slots_for(self, numbers, laps):
+        """State row of every input row, registering (NUMBER, lap) pairs seen for the first time."""
+        # Factorize each column, then the pair codes (cheaper than a MultiIndex)
+        number_codes, number_uniques = pd.factorize(numbers)
+        lap_codes, lap_uniques = pd.factorize(laps)
+        codes, pairs = pd.factorize(number_codes * len(lap_uniques) + lap_codes)
+        unique_slots = np.empty(len(pairs), dtype=np.intp)
+        for i, pair in enumerate(pairs):
+            key = (number_uniques[pair // len(lap_uniques)], lap_uniques[pair % len(lap_uniques)])
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = self._size
+                self._numbers.append(key[0]); self._laps.append(key[1])
+                self._size += 1
+            unique_slots[i] = slot
+        self._grow(self._size)
+        return unique_slots[codes]
+
+    # --- Folding ---
+
+    def add(self, numbers, laps, values):
+        """Folds one chunk of readings (already cleaned; no missing values)."""
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        laps = np.asarray(laps)
+        self._lap_dtype = laps.dtype if self._lap_dtype is None else np.result_type(self._lap_dtype, laps.dtype)
+        slots = self._slots_for(np.asarray(numbers, dtype=object), laps)
+        self._kahan_fold(slots, values)
+
+        s = self._state
+        if 'min' in self.stats: np.minimum.at(s['min'], slots, values)
+        if 'max' in self.stats: np.maximum.at(s['max'], slots, values)
+        if 'var' in self.stats: self._merge_variance(slots, values)
+        if self.percentiles: self._add_histogram(slots, values)
+        for j, threshold in enumerate(self.thresholds):
+            s['above'][:self._size, j] += np.bincount(slots, weights=values > threshold, minlength=self._size)
+
+    def _kahan_fold(self, slots, values):
+        """
+        Adds the values to their running sums one position at a time: step k
+        takes the k-th reading of every lap in the chunk, so each lap still sees
+        its readings in file order while all laps are updated together.
+        """
+        s = self._state
+        order = np.argsort(slots, kind='stable')
+        sorted_slots = slots[order]
+        starts = np.flatnonzero(np.r_[True, sorted_slots[1:] != sorted_slots[:-1]])
+        group_sizes = np.diff(np.r_[starts, len(order)])
+        np.add.at(s['count'], sorted_slots[starts], group_sizes)
+
+        rank = np.arange(len(order)) - np.repeat(starts, group_sizes)
+        by_rank = np.argsort(rank, kind='stable')
+        level_slots = sorted_slots[by_rank]
+        level_values = values[order][by_rank]
+        bounds = np.searchsorted(rank[by_rank], np.arange(group_sizes.max() + 1))
+        bounds = np.r_[bounds, len(order)]
+
+        total, compensation = s['sum'], s['compensation']
+        for k in range(len(bounds) - 1):
+            idx = level_slots[bounds[k]:bounds[k + 1]]
+            y = level_values[bounds[k]:bounds[k + 1]] - compensation[idx]
+            t = total[idx] + y
+            c = (t - total[idx]) - y
+            c[c != c] = 0.0 # Infinite readings: keep the sum at +/-inf
+            compensation[idx] = c
+            total[idx] = t
+
+    def merge(self, other):
+        """Folds the state of another aggregator (same stats, readings that came after this one's) into this one."""
+        if other._size == 0:
+            return
+        if other.stats != self.stats:
+            raise ValueError("Only aggregators of the same statistics can be merged.")
+        self._lap_dtype = other._lap_dtype if self._lap_dtype is None else np.result_type(self._lap_dtype, other._lap_dtype)
+        n = other._size
+        s, o = self._state, {name: array[:n] for name, array in other._state.items()}
+        slots = self._slots_for(np.asarray(other._numbers, dtype=object), np.asarray(other._laps))
+
+        # Compensated sum of the two running totals (each is sum - compensation)
+        y = (o['sum'] - o['compensation']) - s['compensation'][slots]
+        t = s['sum'][slots] + y
+        c = (t - s['sum'][slots]) - y
+        c[c != c] = 0.0
+        s['sum'][slots], s['compensation'][slots] = t, c
+
+        if 'min' in self.stats: s['min'][slots] = np.minimum(s['min'][slots], o['min'])
+        if 'max' in self.stats: s['max'][slots] = np.maximum(s['max'][slots], o['max'])
+        if 'var' in self.stats:
+            n_a, n_b = s['count'][slots], o['count']
+            total = np.maximum(n_a + n_b, 1)
+            delta = o['mean'] - s['mean'][slots]
+            s['mean'][slots] += delta * n_b / total
+            s['m2'][slots] += o['m2'] + delta ** 2 * n_a * n_b / total
+        if self.percentiles: s['histogram'][slots] += o['histogram']
+        if self.thresholds: s['above'][slots] += o['above']
+        s['count'][slots] += o['count']
+
+    def _merge_variance(self, slots, values):
+        """Chan et al. merge of the chunk's per-lap mean/M2 into the running ones."""
+        s = self._state
+        size = self._size
+        n_b = np.bincount(slots, minlength=size).astype(float)
+        mean_b = np.bincount(slots, weights=values, minlength=size) / np.maximum(n_b, 1)
+        m2_b = np.bincount(slots, weights=(values - mean_b[slots]) ** 2, minlength=size)
+        touched = np.flatnonzero(n_b)
+
+        n_a = s['count'][touched] - n_b[touched] # count already includes this chunk
+        n = n_a + n_b[touched]
+        delta = mean_b[touched] - s['mean'][touched]
+        s['mean'][touched] += delta * n_b[touched] / n
+        s['m2'][touched] += m2_b[touched] + delta ** 2 * n_a * n_b[touched] / n
+
+    def _add_histogram(self, slots, values):
+        n_bins = len(self.bin_edges) - 1
+        # Readings outside value_range land in the edge bins
+        bins = np.clip(np.searchsorted(self.bin_edges, values, side='right') - 1, 0, n_bins - 1)
+        counts = np.bincount(slots * n_bins + bins, minlength=self._size * n_bins)
+        self._state['histogram'][:self._size] += counts.reshape(self._size, n_bins)
+
+    def _histogram_percentile(self, histogram, q):
+        """Percentile q of every row's histogram, interpolated linearly inside the bin."""
+        cumulative = histogram.cumsum(axis=1)
+        target = q / 100.0 * cumulative[:, -1]
+        idx = np.minimum((cumulative < target[:, None]).sum(axis=1), histogram.shape[1] - 1)
+        rows = np.arange(len(histogram))
+        before = cumulative[rows, idx] - histogram[rows, idx]
+        fraction = np.where(histogram[rows, idx] > 0, (target - before) / np.maximum(histogram[rows, idx], 1), 0.0)
+        width = self.bin_edges[1] - self.bin_edges[0]
+        return np.where(cumulative[:, -1] > 0, self.bin_edges[idx] + fraction * width, np.nan)
+
+    # --- Output ---
+
+    def keys(self):
+        """(NUMBER, lap) of every lap folded so far."""
+        return self._slots.keys()
+
+    def result(self, keys=None):
+        """
+        One row per (NUMBER, lap), sorted like groupby: NUMBER, lap and one column
+        per statistic. keys limits the result to those laps (unknown ones are ignored).
+        """
+        if keys is None:
+            rows = range(self._size)
+        else:
+            rows = [self._slots[key] for key in keys if key in self._slots]
+        # Sort the (few thousand at most) keys up front and build the frame in one go
+        numbers = [str(self._numbers[i]) for i in rows]
+        order = sorted(range(len(numbers)), key=lambda i: (numbers[i], self._laps[rows[i]]))
+        rows = np.asarray(rows, dtype=np.intp)[order]
+        n = len(rows)
+        s = {name: array[rows] for name, array in self._state.items()}
+        count = s['count']
+        columns = {
+            'NUMBER': pd.Series([numbers[i] for i in order], dtype=object).astype(str),
+            'lap': np.asarray(self._laps, dtype=self._lap_dtype if self._lap_dtype is not None else float)[rows],
+        }
+        percentiles, thresholds = iter(self.percentiles), iter(range(len(self.thresholds)))
+        for stat in self.stats:
+            if stat == 'mean': column = s['sum'] / count if n else np.zeros(0)
+            elif stat in ('min', 'max'): column = s[stat]
+            elif stat == 'var': column = np.where(count > 1, s['m2'] / np.maximum(count - 1, 1), np.nan)
+            elif stat.startswith('p'): column = self._histogram_percentile(s['histogram'], next(percentiles))
+            else: column = s['above'][:, next(thresholds)] / np.maximum(count, 1)
+            columns[stat_column(stat)] = column
+        return pd.DataFrame(columns)
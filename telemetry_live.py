@@ -0,0 +1,214 @@
+import os
+import io
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import process_telemetry as pt
+
+# ===================================================================
+# --- LIVE TELEMETRY ---
+# Follows a telemetry CSV while the logger is still writing it. Every poll
+# parses only the complete rows appended since the last byte offset and
+# folds them into the running per-(NUMBER, lap) aggregates of
+# process_telemetry, so a lap's features are published as soon as the
+# car starts its next lap.
+# Usage:
+#   python telemetry_live.py follow [--file F --format LONG --offset N]
+#   python telemetry_live.py replay SOURCE.csv TARGET.csv [--rows-per-second N]
+# ===================================================================
+
+POLL_SECONDS = 0.5
+# Stop following when the file has not grown for this long (race over)
+IDLE_TIMEOUT_SECONDS = 120
+REPLAY_ROWS_PER_SECOND = 50_000
+REPLAY_TICK_SECONDS = 0.25
+
+def live_output_file(track_name, race_num):
+    return f'processed_data/{track_name}/{race_num}_telemetry_live.parquet'
+
+
+class TelemetryTail:
+    """
+    Incremental per-lap features of a growing telemetry CSV.
+    offset=None starts at the first data row; any other byte offset starts at
+    the next full line after it (e.g. joining a race already under way).
+    """
+
+    def __init__(self, file_path, telemetry_format, offset=None, channels=pt.TELEMETRY_CHANNELS):
+        self.file_path = file_path
+        self.telemetry_format = telemetry_format
+        self.channels = channels
+        self.offset = offset
+        self.header = None
+        self.aggregators = pt.make_aggregators(channels)
+        self.current_lap = {}    # NUMBER -> highest lap seen
+        self.published = set()   # (NUMBER, lap) already published as finished
+        self.table = None        # Per-lap features of every lap seen so far
+
+    # --- Reading ---
+
+    def _open_header(self, f):
+        header = f.readline()
+        if not header.endswith(b'\n'):
+            return False # Logger has not written the header yet
+        self.header = header
+        if self.offset is None or self.offset <= len(header):
+            self.offset = len(header)
+        else:
+            f.seek(self.offset - 1)
+            f.readline() # Align to the start of the next full line
+            self.offset = f.tell()
+        return True
+
+    def read_new_rows(self):
+        """DataFrame of the complete rows appended since the last call (None if there are none)."""
+        if not os.path.exists(self.file_path):
+            return None
+        with open(self.file_path, 'rb') as f:
+            if self.header is None and not self._open_header(f):
+                return None
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offset:
+                raise RuntimeError(f"{self.file_path} shrank below offset {self.offset}; was it restarted?")
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        # A partially written last line is left for the next poll
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return None
+        self.offset += end
+        return pd.read_csv(io.BytesIO(self.header + data[:end]), sep=',', on_bad_lines='skip')
+
+    # --- Updating ---
+
+    def features(self):
+        """Features of every lap seen so far, with LAP_COMPLETE set once the car has started a later lap."""
+        if self.table is None:
+            return None
+        df = self.table.copy()
+        current = df['NUMBER'].map(self.current_lap).to_numpy(dtype=float)
+        df.insert(2, 'LAP_COMPLETE', df['LAP_NUMBER'].to_numpy(dtype=float) < current)
+        return df
+
+    def update(self):
+        """
+        Folds the newly appended rows. Returns the finished laps to publish:
+        laps finished by this update plus finished laps that received late readings.
+        """
+        chunk = self.read_new_rows()
+        if chunk is None or chunk.empty:
+            return None
+        readings = pt.process_chunk(chunk, self.telemetry_format, self.channels)
+        if readings is None or readings.empty:
+            return None
+        readings = pt.fold_telemetry(self.aggregators, readings, self.channels)
+        if readings.empty:
+            return None
+        for number, lap in readings.groupby('NUMBER', sort=False)['lap'].max().items():
+            if lap > self.current_lap.get(number, -np.inf):
+                self.current_lap[number] = lap
+
+        # Only the laps that received readings are recomputed
+        touched = list(readings[['NUMBER', 'lap']].drop_duplicates().itertuples(index=False, name=None))
+        changed = pt.telemetry_features(self.aggregators, self.channels, keys=touched, verbose=False)
+        if self.table is not None:
+            changed = pd.concat([self.table, changed]).drop_duplicates(['NUMBER', 'LAP_NUMBER'], keep='last')
+        self.table = changed.sort_values(['NUMBER', 'LAP_NUMBER']).reset_index(drop=True)
+
+        df = self.features()
+        touched = set(touched)
+        keys = zip(df['NUMBER'], df['LAP_NUMBER'])
+        publish = [complete and (key not in self.published or key in touched) for key, complete in zip(keys, df['LAP_COMPLETE'])]
+        new_laps = df[publish].drop(columns='LAP_COMPLETE')
+        self.published.update(zip(new_laps['NUMBER'], new_laps['LAP_NUMBER']))
+        return new_laps.reset_index(drop=True)
+
+
+# --- Follow ---
+
+def save_live(df, output_file):
+    """Replaces the live parquet atomically (readers never see a half-written file)."""
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    df.to_parquet(output_file + '.tmp', index=False)
+    os.replace(output_file + '.tmp', output_file)
+
+def follow(track_name, race_num, telemetry_file_path, telemetry_format, offset=None,
+           poll_seconds=POLL_SECONDS, idle_timeout=IDLE_TIMEOUT_SECONDS):
+    """Publishes per-lap features of a growing telemetry file until it stops growing."""
+    print(f"Following live telemetry for: {track_name} - {race_num} ({telemetry_file_path})")
+    output_file = live_output_file(track_name, race_num)
+    tail = TelemetryTail(telemetry_file_path, telemetry_format, offset)
+    last_growth = time.monotonic()
+    try:
+        while time.monotonic() - last_growth < idle_timeout:
+            start = time.perf_counter()
+            previous_offset = tail.offset
+            new_laps = tail.update()
+            if tail.offset != previous_offset:
+                last_growth = time.monotonic()
+                df = tail.features()
+                if df is not None:
+                    save_live(df, output_file)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                print(f"  +{tail.offset - (previous_offset or 0)} bytes, {len(tail.current_lap)} cars, update took {elapsed_ms:.0f} ms")
+                if new_laps is not None:
+                    for row in new_laps.itertuples(index=False):
+                        print(f"    > Car {row.NUMBER} lap {row.LAP_NUMBER:.0f} finished: avg_aggressiveness {row.avg_aggressiveness:.3f}")
+            time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    print("---")
+    print(f"Stopped at byte offset {tail.offset}. Live features saved to {output_file}")
+    return tail
+
+
+# --- Replay Stand-in ---
+
+def replay(source_file, target_file, rows_per_second=REPLAY_ROWS_PER_SECOND, tick_seconds=REPLAY_TICK_SECONDS):
+    """Rewrites a finished telemetry CSV into target_file at a fixed row rate, like a logger would."""
+    rows_per_tick = max(1, int(rows_per_second * tick_seconds))
+    print(f"Replaying {source_file} -> {target_file} at {rows_per_second} rows/s")
+    n_rows = 0
+    with open(source_file, 'rb') as src, open(target_file, 'wb') as dst:
+        dst.write(src.readline())
+        while True:
+            start = time.perf_counter()
+            lines = [line for _, line in zip(range(rows_per_tick), src)]
+            if not lines:
+                break
+            dst.writelines(lines)
+            dst.flush()
+            n_rows += len(lines)
+            time.sleep(max(0.0, tick_seconds - (time.perf_counter() - start)))
+    print(f"Replay finished: {n_rows} rows.")
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live per-lap telemetry features from a growing CSV.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    follow_cmd = commands.add_parser('follow', help="Follow a telemetry file (defaults: process_telemetry.py config)")
+    follow_cmd.add_argument('--track', default=pt.TRACK_NAME_OUT)
+    follow_cmd.add_argument('--race', default=pt.RACE_NUM_OUT)
+    follow_cmd.add_argument('--file', default=pt.TELEMETRY_FILE_PATH)
+    follow_cmd.add_argument('--format', default=pt.TELEMETRY_FORMAT, choices=['LONG', 'JSON'])
+    follow_cmd.add_argument('--offset', type=int, default=None, help="Start at this byte offset instead of the first row")
+    follow_cmd.add_argument('--poll', type=float, default=POLL_SECONDS)
+    follow_cmd.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT_SECONDS)
+    replay_cmd = commands.add_parser('replay', help="Write a finished CSV into a growing file")
+    replay_cmd.add_argument('source')
+    replay_cmd.add_argument('target')
+    replay_cmd.add_argument('--rows-per-second', type=int, default=REPLAY_ROWS_PER_SECOND)
+    args = parser.parse_args(argv)
+
+    if args.command == 'follow':
+        follow(args.track, args.race, args.file, args.format, args.offset, args.poll, args.idle_timeout)
+    else:
+        if not os.path.exists(args.source):
+            print(f"Error: {args.source} not found."); sys.exit()
+        replay(args.source, args.target, args.rows_per_second)
+
+if __name__ == '__main__':
+    main()
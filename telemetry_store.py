@@ -0,0 +1,175 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import process_telemetry as pt
+
+# ===================================================================
+# --- PARTITIONED TELEMETRY STORE ---
+# One-time ingest of a race's raw telemetry CSV into typed Parquet files,
+# one per (track, race, vehicle, telemetry_name):
+#   telemetry_store/track=VIR/race=R1/vehicle=13/telemetry_name=accy_can/part-0.parquet
+# Readings keep their CSV order inside each file. Reads only open the
+# partitions they need and push lap filters down to the row groups.
+# Each ingest records the size, mtime and sha256 of its source CSV, so a
+# race whose CSV has changed since is not read from the store.
+# Usage: python telemetry_store.py  (ingests the race configured in process_telemetry.py)
+# ===================================================================
+
+STORE_ROOT = 'telemetry_store'
+PARTITION_KEYS = ['track', 'race', 'vehicle', 'telemetry_name']
+# Partition values are kept as strings (car '07' must not become 7)
+PARTITIONING = ds.partitioning(pa.schema([(key, pa.string()) for key in PARTITION_KEYS]), flavor='hive')
+READING_SCHEMA = pa.schema([
+    ('lap', pa.int32()),
+    ('timestamp', pa.timestamp('ms', tz='UTC')),
+    ('telemetry_value', pa.float64()),
+])
+INGEST_CHUNKSIZE = 3_000_000
+SOURCE_FILE = '_source.json'
+
+
+def race_path(track, race, root=STORE_ROOT):
+    return os.path.join(root, f'track={track}', f'race={race}')
+
+def partition_path(track, race, vehicle, telemetry_name, root=STORE_ROOT):
+    return os.path.join(race_path(track, race, root), f'vehicle={vehicle}', f'telemetry_name={telemetry_name}')
+
+def has_race(track, race, root=STORE_ROOT):
+    return os.path.isdir(race_path(track, race, root))
+
+
+# --- Source Tracking ---
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def source_record(file_path):
+    stat = os.stat(file_path)
+    return {'file': file_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(file_path)}
+
+def is_current(track, race, file_path, root=STORE_ROOT):
+    """
+    True when the race is in the store and was ingested from the current content of
+    file_path. The CSV is only re-hashed when its size matches but its mtime does not.
+    """
+    try:
+        with open(os.path.join(race_path(track, race, root), SOURCE_FILE)) as f:
+            recorded = json.load(f)
+        stat = os.stat(file_path)
+    except (OSError, ValueError):
+        return False
+    if stat.st_size != recorded.get('size'):
+        return False
+    if stat.st_mtime_ns == recorded.get('mtime_ns'):
+        return True
+    return file_sha256(file_path) == recorded.get('sha256')
+
+
+# --- Ingest ---
+
+def ingest_race(file_path, telemetry_format, track, race, root=STORE_ROOT, chunksize=INGEST_CHUNKSIZE):
+    """
+    Parses a raw telemetry CSV once (every channel) and writes it to the store,
+    replacing any previous ingest of the race. Rows without a car number or lap
+    are dropped (they cannot be assigned to a lap). Returns the number of readings.
+    """
+    target = race_path(track, race, root)
+    staging = target + '.ingesting'
+    shutil.rmtree(staging, ignore_errors=True)
+    source = source_record(file_path) # Taken before parsing: a CSV edited meanwhile reads as changed
+    writers, n_readings = {}, 0
+    try:
+        with pd.read_csv(file_path, sep=',', chunksize=chunksize, on_bad_lines='skip') as reader:
+            for i, chunk in enumerate(reader):
+                readings = pt.process_chunk(chunk, telemetry_format, channels=None, with_timestamp=True)
+                if readings is None: continue
+                readings = readings.dropna(subset=['NUMBER', 'lap'])
+                readings = readings.astype({'NUMBER': str, 'telemetry_name': str, 'lap': 'int32'})
+                for (vehicle, name), part in readings.groupby(['NUMBER', 'telemetry_name'], sort=False):
+                    writer = writers.get((vehicle, name))
+                    if writer is None:
+                        path = partition_path(track, race, vehicle, name, root).replace(target, staging, 1)
+                        os.makedirs(path, exist_ok=True)
+                        writer = writers[(vehicle, name)] = pq.ParquetWriter(os.path.join(path, 'part-0.parquet'), READING_SCHEMA)
+                    writer.write_table(pa.Table.from_pandas(part[READING_SCHEMA.names], schema=READING_SCHEMA, preserve_index=False))
+                n_readings += len(readings)
+                print(f"  Ingested chunk #{i+1}: {len(readings)} readings ({len(writers)} partitions so far)")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    os.makedirs(staging, exist_ok=True)
+    with open(os.path.join(staging, SOURCE_FILE), 'w') as f:
+        json.dump(source, f, indent=1)
+    # Swap in the complete ingest only
+    shutil.rmtree(target, ignore_errors=True)
+    if os.path.isdir(staging):
+        os.rename(staging, target)
+    return n_readings
+
+
+# --- Reads ---
+
+def open_store(root=STORE_ROOT):
+    return ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+
+def stored_partitions(track, race, root=STORE_ROOT):
+    """(vehicle, telemetry_name) of every partition of one race."""
+    rows = []
+    vehicle_dirs = [d for d in os.listdir(race_path(track, race, root)) if d.startswith('vehicle=')]
+    for vehicle_dir in sorted(vehicle_dirs):
+        for name_dir in sorted(os.listdir(os.path.join(race_path(track, race, root), vehicle_dir))):
+            rows.append((vehicle_dir.split('=', 1)[1], name_dir.split('=', 1)[1]))
+    return pd.DataFrame(rows, columns=['vehicle', 'telemetry_name'])
+
+def read_readings(track, race, channels=None, vehicles=None, laps=None, columns=('lap', 'telemetry_value'), root=STORE_ROOT):
+    """
+    Readings of one race as a DataFrame with vehicle, telemetry_name and `columns`.
+    channels/vehicles prune partitions; laps=(first, last) is pushed down to the
+    Parquet row groups. Files are memory-mapped instead of read into buffers.
+    """
+    filters = [('track', '=', track), ('race', '=', race)]
+    if channels is not None: filters.append(('telemetry_name', 'in', list(channels)))
+    if vehicles is not None: filters.append(('vehicle', 'in', [str(v) for v in vehicles]))
+    if laps is not None:
+        filters += [('lap', '>=', laps[0]), ('lap', '<=', laps[1])]
+    table = pq.read_table(
+        root, columns=['vehicle', 'telemetry_name'] + list(columns), filters=filters,
+        partitioning=PARTITIONING, memory_map=True
+    )
+    return table.to_pandas()
+
+def iter_race_chunks(track, race, channels=None, vehicles=None, root=STORE_ROOT):
+    """
+    Per-(vehicle, channel) readings in the chunk layout of process_telemetry
+    (NUMBER, lap, telemetry_name, telemetry_value), one partition at a time.
+    """
+    partitions = stored_partitions(track, race, root)
+    if channels is not None: partitions = partitions[partitions['telemetry_name'].isin(list(channels))]
+    if vehicles is not None: partitions = partitions[partitions['vehicle'].isin([str(v) for v in vehicles])]
+    for vehicle, name in partitions.itertuples(index=False):
+        path = os.path.join(partition_path(track, race, vehicle, name, root), 'part-0.parquet')
+        table = pq.read_table(path, columns=['lap', 'telemetry_value'], memory_map=True)
+        chunk = pd.DataFrame({
+            'NUMBER': vehicle,
+            'lap': table.column('lap').to_numpy().astype(np.int64),
+            'telemetry_name': name,
+            'telemetry_value': table.column('telemetry_value').to_numpy(),
+        })
+        yield chunk
+
+
+if __name__ == '__main__':
+    print(f"Ingesting {pt.TELEMETRY_FILE_PATH} into {race_path(pt.TRACK_NAME_OUT, pt.RACE_NUM_OUT)}")
+    n = ingest_race(pt.TELEMETRY_FILE_PATH, pt.TELEMETRY_FORMAT, pt.TRACK_NAME_OUT, pt.RACE_NUM_OUT)
+    print("---")
+    print(f"Success! Stored {n} readings.")
@@ -0,0 +1,254 @@
+import numpy as np
+import pandas as pd
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import contextlib
+import traceback
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ===================================================================
+# --- ALL-TRACK TRAINING ---
+# Trains every track's model in one run on a shared process pool:
+#   1. leave-one-race-out validation (fit on R1 -> score on R2, fit on
+#      R2 -> score on R1) of every candidate in PARAM_GRID, one fit per
+#      task on a single core, largest tracks first
+#   2. the final model of each track on R1 + R2 with the candidate of
+#      lowest held-out MAE, registered with that MAE as its selection
+#      score and the untuned default's held-out MAE next to it
+#   3. single-row and batch inference latency of each registered model
+# The cores are split between the running tasks (no task uses n_jobs=-1),
+# and the per-track report goes to processed_data/training_report.json.
+# Usage: python train_all_tracks.py [--tracks VIR COTA] [--workers N] [--default-params]
+# ===================================================================
+
+REPORT_FILE = 'processed_data/training_report.json'
+LOG_DIR = 'processed_data/logs'
+# Candidates tried on top of train_final_model.MODEL_PARAMS ({} is the current model)
+PARAM_GRID = [
+    {},
+    {'min_samples_leaf': 3},
+    {'min_samples_leaf': 5},
+    {'max_depth': 12},
+    {'max_features': 0.5},
+]
+FOLDS = [('R1', 'R2'), ('R2', 'R1')] # (train race, held-out race)
+LATENCY_SECONDS = 0.5
+
+
+def list_tracks():
+    return sorted(d for d in os.listdir('processed_data')
+                  if all(os.path.exists(f'processed_data/{d}/{race}_processed.parquet') for race in ('R1', 'R2')))
+
+def data_bytes(track_name):
+    return sum(os.path.getsize(f'processed_data/{track_name}/{race}_processed.parquet') for race in ('R1', 'R2'))
+
+def param_label(params):
+    return ', '.join(f'{k}={v}' for k, v in params.items()) or 'default'
+
+
+# --- Workers ---
+
+def _quiet_worker():
+    warnings.simplefilter('ignore')
+
+def track_data(track_name):
+    """Per-race (X, y) of the track, on the features train_final_model.py would pick for it."""
+    import train_final_model as tfm
+    with contextlib.redirect_stdout(None):
+        races = tfm.load_race_data(track_name)
+        features = tfm.select_features(pd.concat(list(races.values())))
+    data = {}
+    for race, df in races.items():
+        df = df.dropna(subset=features + [tfm.TARGET])
+        data[race] = (df[features], df[tfm.TARGET])
+    return data
+
+def validate(train, test, params):
+    """Worker: one leave-one-race-out fit on a single core of the (X, y) of two races. Returns the held-out scores."""
+    import train_final_model as tfm
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import r2_score, mean_absolute_error
+    (X_train, y_train), (X_test, y_test) = train, test
+    if X_train.empty or X_test.empty:
+        return None
+    model = RandomForestRegressor(**{**tfm.MODEL_PARAMS, **params}, n_jobs=1)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    y_pred = model.predict(X_test)
+    return {
+        'mae': float(mean_absolute_error(y_test, y_pred)), 'r2': float(r2_score(y_test, y_pred)),
+        'fit_seconds': fit_seconds, 'train_rows': len(X_train), 'test_rows': len(X_test),
+    }
+
+def train_final(track_name, params, validation, n_jobs):
+    """Worker: trains, registers and tabulates the track's final model, with its output in a log file."""
+    import train_final_model as tfm
+    log_path = os.path.join(LOG_DIR, f'train_all_{track_name}.log')
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.perf_counter()
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            tfm.train_track(track_name, n_jobs=n_jobs, params=params, validation=validation)
+            ok = True
+        except BaseException: # train_final_model reports errors with sys.exit()
+            traceback.print_exc()
+            ok = False
+    return ok, time.perf_counter() - start, log_path
+
+
+# --- Latency ---
+
+def median_call_seconds(fn, min_seconds=LATENCY_SECONDS):
+    fn()
+    times, start = [], time.perf_counter()
+    while time.perf_counter() - start < min_seconds or len(times) < 5:
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times))
+
+def measure_latency(track_name):
+    """Single-row and batch latency of the registered model, timed in this process once training is over."""
+    from model_registry import load_forest
+    forest = load_forest(track_name)
+    X = pd.concat([X for X, _ in track_data(track_name).values()]).to_numpy(dtype=float)
+    row = X[:1]
+    return {
+        'single_row_us': median_call_seconds(lambda: forest.predict_matrix(row)) * 1e6,
+        'batch_rows': len(X),
+        'batch_ms': median_call_seconds(lambda: forest.predict_matrix(X)) * 1e3,
+    }
+
+
+# --- Report ---
+
+def best_candidate(scores):
+    """Candidate with the lowest held-out MAE averaged over both folds (ties keep the earlier, simpler one)."""
+    complete = [(i, s) for i, s in enumerate(scores) if all(f is not None for f in s)]
+    if not complete:
+        return None
+    return min(complete, key=lambda item: np.mean([f['mae'] for f in item[1]]))[0]
+
+def summarize(fold_scores):
+    return {
+        'holdout_mae': float(np.mean([f['mae'] for f in fold_scores])),
+        'holdout_r2': float(np.mean([f['r2'] for f in fold_scores])),
+        'holdout_folds': {f'{train}->{test}': s['mae'] for (train, test), s in zip(FOLDS, fold_scores)},
+        'fit_seconds': float(np.mean([f['fit_seconds'] for f in fold_scores])),
+    }
+
+def print_report(report):
+    print("---")
+    print(f"{'track':<14}{'candidate':<22}{'R1->R2':>8}{'R2->R1':>8}{'default':>9}{'fit s':>7}{'train s':>8}{'row us':>8}{'batch ms':>9}")
+    for track, entry in report['tracks'].items():
+        if 'error' in entry:
+            print(f"{track:<14}{entry['error']}")
+            continue
+        folds = entry['holdout_folds']
+        default_mae = entry['default_holdout_mae'] if entry['default_holdout_mae'] is not None else float('nan')
+        latency = entry.get('latency', {})
+        print(f"{track:<14}{entry['params_label']:<22}{folds['R1->R2']:>8.3f}{folds['R2->R1']:>8.3f}"
+              f"{default_mae:>9.3f}{entry['fit_seconds']:>7.2f}{entry.get('train_seconds', float('nan')):>8.1f}"
+              f"{latency.get('single_row_us', float('nan')):>8.0f}{latency.get('batch_ms', float('nan')):>9.2f}")
+    print("(held-out MAE in seconds; the candidate was picked on these folds, so its MAE is a selection score;")
+    print(" default = MAE of the current parameters; fit = one race on one core;")
+    print(" train = final model on R1 + R2 with its surface; row/batch = registered model, batch = all laps)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate, tune and train every track's model in parallel.")
+    parser.add_argument('--tracks', nargs='*', help="Only these tracks (default: every track with R1 and R2 laps)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--default-params', action='store_true', help="Validate and train with MODEL_PARAMS only")
+    parser.add_argument('--report', default=REPORT_FILE)
+    args = parser.parse_args()
+
+    tracks = args.tracks or list_tracks()
+    if not tracks:
+        print("Error: no tracks with R1 and R2 processed laps found.")
+        sys.exit(1)
+    grid = PARAM_GRID[:1] if args.default_params else PARAM_GRID
+    cores = os.cpu_count() or 1
+    workers = max(1, min(args.workers, cores))
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_quiet_worker) as pool:
+        # --- 1. Leave-one-race-out validation of every candidate ---
+        # Single-core fits on every worker keep all cores busy without oversubscribing them
+        tasks = [(track, i, fold) for track in sorted(tracks, key=data_bytes, reverse=True)
+                 for i in range(len(grid)) for fold in range(len(FOLDS))]
+        print(f"Validating {len(grid)} candidates x {len(FOLDS)} folds on {len(tracks)} tracks ({len(tasks)} fits, {workers} workers)...")
+        # Each track is read once here; the workers get its races' arrays
+        data = {}
+        for track in tracks:
+            try:
+                data[track] = track_data(track)
+            except (Exception, SystemExit) as e:
+                print(f"  [FAIL] {track}: could not load its laps: {e}")
+        futures = {pool.submit(validate, data[track][FOLDS[fold][0]], data[track][FOLDS[fold][1]], grid[i]): (track, i, fold)
+                   for track, i, fold in tasks if track in data}
+        scores = {track: [[None] * len(FOLDS) for _ in grid] for track in tracks}
+        for future in as_completed(futures):
+            track, i, fold = futures[future]
+            try:
+                scores[track][i][fold] = future.result()
+            except (Exception, SystemExit) as e:
+                print(f"  [FAIL] {track} {param_label(grid[i])} {'->'.join(FOLDS[fold])}: {e}")
+
+        # --- 2. Final models with the best candidate ---
+        report = {'created_utc': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'cores': cores,
+                  'workers': workers, 'param_grid': grid, 'tracks': {}}
+        finals = {}
+        # Cores left per final fit while the other tracks train
+        n_jobs = max(1, cores // min(workers, len(tracks)))
+        for track in tracks:
+            best = best_candidate(scores[track])
+            if best is None:
+                report['tracks'][track] = {'error': 'validation failed (see above)'}
+                continue
+            entry = {'params': grid[best], 'params_label': param_label(grid[best]), **summarize(scores[track][best])}
+            entry['default_holdout_mae'] = summarize(scores[track][0])['holdout_mae'] if all(scores[track][0]) else None
+            entry['candidates'] = [
+                {'params': grid[i], **summarize(s)} if all(s) else {'params': grid[i], 'error': 'failed'}
+                for i, s in enumerate(scores[track])
+            ]
+            report['tracks'][track] = entry
+            # The best MAE of the grid is scored on the folds that picked it, so it is optimistic:
+            # record it as the selection score, with the untuned default's held-out scores next to it
+            validation = {'selection_mae': entry['holdout_mae'], 'selection_r2': entry['holdout_r2']}
+            if all(scores[track][0]):
+                default = summarize(scores[track][0])
+                validation.update(holdout_mae=default['holdout_mae'], holdout_r2=default['holdout_r2'])
+            finals[pool.submit(train_final, track, grid[best], validation, n_jobs)] = track
+        print(f"Training {len(finals)} final models ({n_jobs} cores each)...")
+        for future in as_completed(finals):
+            track = finals[future]
+            ok, seconds, log_path = future.result()
+            if ok:
+                report['tracks'][track]['train_seconds'] = seconds
+                print(f"  [done] {track} in {seconds:.1f}s")
+            else:
+                report['tracks'][track] = {'error': f'training failed (see {log_path})'}
+                print(f"  [FAIL] {track} (see {log_path})")
+
+    # --- 3. Inference latency (uncontended, after the pool is gone) ---
+    for track, entry in report['tracks'].items():
+        if 'error' not in entry:
+            entry['latency'] = measure_latency(track)
+
+    os.makedirs(os.path.dirname(args.report), exist_ok=True)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=1)
+    print_report(report)
+    print(f"Report saved to {args.report} ({time.perf_counter() - start:.1f}s total)")
+    if any('error' in entry for entry in report['tracks'].values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
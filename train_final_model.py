@@ -3,6 +3,17 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import r2_score, mean_absolute_error
 import joblib
 import os
+import re
+import sys
+import copy
+import time
+import pickle
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+from degradation_surface import build_and_save_surface
+from model_registry import register_model, load_metadata
+from forest_engine import FlatForest
 
 # ===================================================================
 # --- TRACK CONFIGURATION ---
@@ -19,68 +30,359 @@ TRACK_NAME = 'VIR'
 
 # ===================================================================
 
-print(f"Starting Master Model training for: {TRACK_NAME}")
-
-# --- 1. Load BOTH datasets for this track ---
-R1_PATH = f'processed_data/{TRACK_NAME}/R1_processed.parquet'
-R2_PATH = f'processed_data/{TRACK_NAME}/R2_processed.parquet'
-
-try:
-    df_r1 = pd.read_parquet(R1_PATH)
-    df_r2 = pd.read_parquet(R2_PATH)
-except Exception as e:
-    print(f"Error reading parquet files for {TRACK_NAME}: {e}. SKIPPING.")
-    sys.exit()
-
-# --- 2. Combine data ---
-df_master = pd.concat([df_r1, df_r2])
-print(f"Combined data: {len(df_master)} total laps.")
-
-# --- 3. SMART LOGIC: Feature Detection ---
-target = 'LAP_DELTA'
-features = [] 
-features.append('Laps_on_this_Tireset') # Base feature
-
-# Check for valid Temperature data
-# (Detects issues like Barber where temp is 0)
-if 'TRACK_TEMP' in df_master.columns and df_master['TRACK_TEMP'].mean() > 5: # Use 5°C as threshold
-    print("TRACK_TEMP data found! Adding to model.")
-    features.append('TRACK_TEMP')
-else:
-    print("WARNING: No valid TRACK_TEMP data found (e.g. Barber). Switching to simplified model.")
-
-# Check for valid Aggression data
-if 'avg_aggressiveness' in df_master.columns and not df_master['avg_aggressiveness'].isna().all():
-    print("AGGRESSION data found! Adding to model.")
-    features.append('avg_aggressiveness')
-else:
-    print("WARNING: No AGGRESSION data found.")
-
-print(f"Training model with {len(features)} features: {features}")
-
-# --- 4. Clean master data ---
-df_master = df_master.dropna(subset=features + [target])
-if df_master.empty:
-    print("Error: Not enough data after cleaning. SKIPPING.")
-    sys.exit()
-
-X = df_master[features]
-y = df_master[target]
-
-# --- 5. Create and Train FINAL Model ---
-model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
-print("Training Master Model...")
-model.fit(X, y)
-
-# --- 6. Evaluate the model ---
-print("Training complete! Evaluating model on all data...")
-y_pred = model.predict(X)
-r2 = r2_score(y, y_pred)
-mae = mean_absolute_error(y, y_pred)
-print(f"Results (R2): {r2:.4f}, (MAE): {mae:.4f} seconds")
-
-# --- 7. Save FINAL Model ---
-model_filename = f'processed_data/{TRACK_NAME}/FINAL_model.pkl'
-joblib.dump(model, model_filename)
-
-print(f"Success! Model saved to {model_filename}")
\ No newline at end of file
+RACES = ['R1', 'R2'] # Required for every track; later race weekends (R3, ...) are picked up when present
+TARGET = 'LAP_DELTA'
+MODEL_PARAMS = {'n_estimators': 100, 'random_state': 42}
+# Trees added per update (the full model has MODEL_PARAMS['n_estimators'] trees for all races)
+UPDATE_TREES = 50
+
+# Budgeted search: every combination is scored by leave-one-race-out MAE
+SEARCH_TREES = [10, 25, 50, 100]
+SEARCH_MAX_DEPTH = [6, 8, 10, 12, None]
+SEARCH_MIN_LEAF = [1, 2, 5, 10]
+# A candidate is as accurate as the full model if its held-out MAE is at most this much (relative) worse
+ACCURACY_TOLERANCE = 0.05
+SEARCH_LATENCY_SECONDS = 0.1
+PARETO_FILENAME = 'FINAL_pareto.csv'
+
+def track_races(track_name):
+    """R1, R2 and every later race with processed laps, in race order."""
+    found = set(RACES)
+    track_dir = f'processed_data/{track_name}'
+    if os.path.isdir(track_dir):
+        found |= {m.group(1) for m in map(re.compile(r'^(R\d+)_processed\.parquet$').match, os.listdir(track_dir)) if m}
+    return sorted(found, key=lambda race: int(race[1:]))
+
+def race_path(track_name, race):
+    return f'processed_data/{track_name}/{race}_processed.parquet'
+
+def load_race_data(track_name, races=None):
+    """Processed laps of each race of the track: {race: DataFrame}."""
+    data = {}
+    for race in races or track_races(track_name):
+        try:
+            data[race] = pd.read_parquet(race_path(track_name, race))
+        except Exception as e:
+            print(f"Error reading parquet files for {track_name}: {e}. SKIPPING.")
+            sys.exit()
+    return data
+
+def select_features(df_master):
+    """SMART LOGIC: the base feature plus TRACK_TEMP / aggression when the track has valid data for them."""
+    features = [] 
+    features.append('Laps_on_this_Tireset') # Base feature
+
+    # Check for valid Temperature data
+    # (Detects issues like Barber where temp is 0)
+    if 'TRACK_TEMP' in df_master.columns and df_master['TRACK_TEMP'].mean() > 5: # Use 5°C as threshold
+        print("TRACK_TEMP data found! Adding to model.")
+        features.append('TRACK_TEMP')
+    else:
+        print("WARNING: No valid TRACK_TEMP data found (e.g. Barber). Switching to simplified model.")
+
+    # Check for valid Aggression data
+    if 'avg_aggressiveness' in df_master.columns and not df_master['avg_aggressiveness'].isna().all():
+        print("AGGRESSION data found! Adding to model.")
+        features.append('avg_aggressiveness')
+    else:
+        print("WARNING: No AGGRESSION data found.")
+    return features
+
+# --- Budgeted Model Search ---
+
+def median_seconds(fn, min_seconds=SEARCH_LATENCY_SECONDS):
+    fn()
+    times, start = [], time.perf_counter()
+    while time.perf_counter() - start < min_seconds or len(times) < 5:
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times))
+
+def first_trees(model, n_trees):
+    """The forest's first n_trees trees: the same model as training it with n_estimators=n_trees."""
+    small = copy.copy(model)
+    small.estimators_ = model.estimators_[:n_trees]
+    small.n_estimators = n_trees
+    return small
+
+def holdout_mae_by_trees(params, X, y, race):
+    """Leave-one-race-out MAE of the first k trees, for every k in SEARCH_TREES."""
+    maes = []
+    for held_out in race.unique():
+        train, test = race != held_out, race == held_out
+        model = RandomForestRegressor(**params).fit(X[train], y[train])
+        X_test = X[test].to_numpy(dtype=np.float32)
+        # Mean of the first k trees for every k at once
+        running = np.cumsum([tree.predict(X_test) for tree in model.estimators_], axis=0)
+        maes.append([mean_absolute_error(y[test], running[k - 1] / k) for k in SEARCH_TREES])
+    return np.mean(maes, axis=0)
+
+def pareto_front(table, columns):
+    """True for the rows no other row beats on every column (lower is better)."""
+    values = table[columns].to_numpy(dtype=float)
+    better_or_equal = (values[None, :, :] <= values[:, None, :]).all(axis=2)
+    strictly_better = (values[None, :, :] < values[:, None, :]).any(axis=2)
+    return ~(better_or_equal & strictly_better).any(axis=1)
+
+def search_model(X, y, race, latency_budget_us=None, size_budget_mb=None, tolerance=ACCURACY_TOLERANCE, n_jobs=-1):
+    """
+    Scores tree count x max depth x min leaf size: held-out MAE (leave one race out),
+    single-row and batch latency of the served FlatForest, and pickle size. Picks
+    the smallest model within the budgets whose MAE is within tolerance of the full
+    model (MODEL_PARAMS). Returns (params, table).
+    """
+    rows = []
+    row_X, batch_X = X.iloc[:1].to_numpy(dtype=float), X.to_numpy(dtype=float)
+    for max_depth in SEARCH_MAX_DEPTH:
+        for min_leaf in SEARCH_MIN_LEAF:
+            params = {**MODEL_PARAMS, 'n_estimators': max(SEARCH_TREES), 'max_depth': max_depth,
+                      'min_samples_leaf': min_leaf, 'n_jobs': n_jobs}
+            maes = holdout_mae_by_trees(params, X, y, race)
+            model = RandomForestRegressor(**params).fit(X, y)
+            for n_trees, mae in zip(SEARCH_TREES, maes):
+                small = first_trees(model, n_trees)
+                forest = FlatForest.from_model(small)
+                rows.append({
+                    'n_estimators': n_trees, 'max_depth': max_depth, 'min_samples_leaf': min_leaf,
+                    'holdout_mae': mae, 'n_nodes': len(forest.value),
+                    'pickle_kb': len(pickle.dumps(small, protocol=pickle.HIGHEST_PROTOCOL)) / 1e3,
+                    'flat_kb': forest.nbytes() / 1e3,
+                    'single_row_us': median_seconds(lambda: forest.predict_matrix(row_X)) * 1e6,
+                    'batch_ms': median_seconds(lambda: forest.predict_matrix(batch_X)) * 1e3,
+                })
+    table = pd.DataFrame(rows)
+    table['max_depth'] = table['max_depth'].astype('Int64') # None (unbounded) shows as <NA>
+
+    full = (table['n_estimators'] == MODEL_PARAMS['n_estimators']) & table['max_depth'].isna() & (table['min_samples_leaf'] == 1)
+    full_mae = float(table.loc[full, 'holdout_mae'].iloc[0])
+    table['mae_vs_full_pct'] = 100 * (table['holdout_mae'] / full_mae - 1)
+    table['within_budget'] = True
+    if latency_budget_us is not None:
+        table['within_budget'] &= table['single_row_us'] <= latency_budget_us
+    if size_budget_mb is not None:
+        table['within_budget'] &= table['pickle_kb'] <= size_budget_mb * 1e3
+    table['accurate'] = table['holdout_mae'] <= full_mae * (1 + tolerance)
+    table['pareto'] = pareto_front(table, ['holdout_mae', 'pickle_kb', 'single_row_us'])
+
+    eligible = table[table['within_budget'] & table['accurate']]
+    if eligible.empty:
+        in_budget = table[table['within_budget']]
+        if in_budget.empty:
+            print("WARNING: No candidate fits the budgets. Using the smallest model.")
+            eligible = table.nsmallest(1, 'pickle_kb')
+        else:
+            print(f"WARNING: No candidate within the budgets is within {tolerance:.0%} of the full model. Using the most accurate one.")
+            eligible = in_budget.nsmallest(1, 'holdout_mae')
+    best = eligible.sort_values(['pickle_kb', 'holdout_mae']).index[0]
+    table['selected'] = table.index == best
+
+    chosen = table.loc[best]
+    params = {'n_estimators': int(chosen['n_estimators']), 'min_samples_leaf': int(chosen['min_samples_leaf']),
+              'max_depth': None if pd.isna(chosen['max_depth']) else int(chosen['max_depth'])}
+    return params, table
+
+def print_pareto(table):
+    columns = ['n_estimators', 'max_depth', 'min_samples_leaf', 'holdout_mae', 'mae_vs_full_pct',
+               'single_row_us', 'batch_ms', 'pickle_kb', 'within_budget', 'selected']
+    front = table[table['pareto'] | table['selected']].sort_values('pickle_kb')
+    print(front[columns].to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+
+
+def train_track(track_name, n_jobs=-1, params=None, validation=None, search=False,
+                latency_budget_us=None, size_budget_mb=None, tolerance=ACCURACY_TOLERANCE):
+    """
+    Trains the track's master model on all its races, saves it, registers it and builds its lookup surface.
+    params override MODEL_PARAMS; validation holds held-out metrics recorded with the model.
+    With search (implied by a budget) the parameters come from search_model instead, and the
+    candidate table is written next to the model.
+    """
+    print(f"Starting Master Model training for: {track_name}")
+
+    # --- 1. Load ALL datasets for this track ---
+    races = load_race_data(track_name)
+    input_paths = [race_path(track_name, race) for race in races]
+
+    # --- 2. Combine data ---
+    df_master = pd.concat(list(races.values()), keys=list(races), names=['race', None])
+    print(f"Combined data: {len(df_master)} total laps.")
+
+    # --- 3. SMART LOGIC: Feature Detection ---
+    target = TARGET
+    features = select_features(df_master)
+
+    print(f"Training model with {len(features)} features: {features}")
+
+    # --- 4. Clean master data ---
+    df_master = df_master.dropna(subset=features + [target])
+    if df_master.empty:
+        print("Error: Not enough data after cleaning. SKIPPING.")
+        sys.exit()
+
+    X = df_master[features]
+    y = df_master[target]
+
+    # --- 4b. Budgeted search (optional) ---
+    search_info = None
+    if search or latency_budget_us is not None or size_budget_mb is not None:
+        print(f"Searching {len(SEARCH_TREES) * len(SEARCH_MAX_DEPTH) * len(SEARCH_MIN_LEAF)} candidates "
+              f"(latency budget: {latency_budget_us} us, size budget: {size_budget_mb} MB)...")
+        race = pd.Series(df_master.index.get_level_values('race'), index=df_master.index)
+        params, table = search_model(X, y, race, latency_budget_us, size_budget_mb, tolerance, n_jobs)
+        pareto_path = f'processed_data/{track_name}/{PARETO_FILENAME}'
+        table.to_csv(pareto_path, index=False)
+        print_pareto(table)
+        print(f"Selected {params}. Candidate table saved to {pareto_path}")
+        chosen = table[table['selected']].iloc[0]
+        # Picked on the same held-out races: a selection score, not an unbiased estimate
+        validation = {**(validation or {}), 'selection_mae': float(chosen['holdout_mae'])}
+        search_info = {'latency_budget_us': latency_budget_us, 'size_budget_mb': size_budget_mb,
+                       'tolerance': tolerance, 'candidates': len(table), 'selected': params}
+
+    # --- 5. Create and Train FINAL Model ---
+    model = RandomForestRegressor(**{**MODEL_PARAMS, **(params or {})}, n_jobs=n_jobs)
+    print("Training Master Model...")
+    start = time.perf_counter()
+    model.fit(X, y)
+    fit_seconds = time.perf_counter() - start
+
+    # --- 6. Evaluate the model ---
+    print("Training complete! Evaluating model on all data...")
+    y_pred = model.predict(X)
+    r2 = r2_score(y, y_pred)
+    mae = mean_absolute_error(y, y_pred)
+    print(f"Results (R2): {r2:.4f}, (MAE): {mae:.4f} seconds")
+
+    # --- 7. Save FINAL Model ---
+    model_filename = f'processed_data/{track_name}/FINAL_model.pkl'
+    joblib.dump(model, model_filename)
+
+    print(f"Success! Model saved to {model_filename}")
+    metrics = {'r2': r2, 'mae': mae, **(validation or {})}
+    lineage = [{'action': 'train', 'created_utc': utc_now(), 'races': list(races), 'rows': len(X),
+                'trees_added': len(model.estimators_), 'trees_dropped': 0, 'n_trees': len(model.estimators_),
+                'fit_seconds': round(fit_seconds, 3)}]
+    if search_info:
+        lineage[0]['search'] = search_info
+    register_model(track_name, model, X, metrics=metrics, inputs=input_paths, model_path=model_filename, lineage=lineage)
+
+    # --- 8. Precompute Degradation Surface ---
+    print("Building degradation lookup surface...")
+    build_and_save_surface(model, X, track_name)
+    return model_filename
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+def update_track(track_name, new_races, n_new_trees=UPDATE_TREES, old_weight=1.0, max_trees=None, n_jobs=-1, build_surface=False):
+    """
+    Incremental update after a new race weekend: warm-starts n_new_trees trees on the new races
+    only and adds them to the saved forest, then saves and registers it (servable right away).
+    The lookup surface is only rebuilt with build_surface; otherwise the app rebuilds it on first use.
+    old_weight < 1 keeps that fraction of the existing trees (a random subset), so the new
+    races weigh more in the forest mean; max_trees drops the oldest trees beyond that count.
+    """
+    print(f"Starting incremental update for: {track_name} with {', '.join(new_races)}")
+    if not 0 < old_weight <= 1:
+        print(f"Error: old_weight must be in (0, 1], got {old_weight}. SKIPPING.")
+        sys.exit()
+
+    # --- 1. Load the current model and the new races ---
+    model_filename = f'processed_data/{track_name}/FINAL_model.pkl'
+    if not os.path.exists(model_filename):
+        print(f"Error: no model at {model_filename} to update. Run a full training first. SKIPPING.")
+        sys.exit()
+    model = joblib.load(model_filename)
+    features, target = list(model.feature_names_in_), TARGET
+    all_races = sorted(set(track_races(track_name)) | set(new_races), key=lambda race: int(race[1:]))
+    data = load_race_data(track_name, all_races)
+    for race, df in data.items():
+        missing = [c for c in features + [target] if c not in df.columns]
+        if missing:
+            print(f"Error: {race} has no {missing} (the model uses {features}). SKIPPING.")
+            sys.exit()
+        data[race] = df.dropna(subset=features + [target])
+    df_new = pd.concat([data[race] for race in new_races])
+    if df_new.empty:
+        print("Error: Not enough new data after cleaning. SKIPPING.")
+        sys.exit()
+    X_new, y_new = df_new[features], df_new[target]
+
+    # How far off the current model is on the race it has not seen
+    pre_update_mae = mean_absolute_error(y_new, model.predict(X_new))
+    print(f"Current model on the new data: (MAE): {pre_update_mae:.4f} seconds")
+
+    # --- 2. Warm-start the new trees on the new races ---
+    previous = load_metadata(track_name) or {}
+    lineage = previous.get('lineage') or [{'action': 'train', 'races': list(RACES), 'n_trees': len(model.estimators_)}]
+    n_old, saved_n_jobs = len(model.estimators_), model.n_jobs
+    # A seed per generation, so new trees don't repeat the bootstraps of earlier ones
+    seed = MODEL_PARAMS['random_state'] + len(lineage)
+    model.set_params(warm_start=True, n_estimators=n_old + n_new_trees, random_state=seed, n_jobs=n_jobs)
+    print(f"Adding {n_new_trees} trees to {n_old} on {len(X_new)} new laps...")
+    start = time.perf_counter()
+    model.fit(X_new, y_new)
+    fit_seconds = time.perf_counter() - start
+
+    # --- 3. Down-weight / prune the old trees ---
+    old, new = model.estimators_[:n_old], model.estimators_[n_old:]
+    if old_weight < 1.0:
+        keep = np.sort(np.random.default_rng(seed).choice(n_old, int(round(old_weight * n_old)), replace=False))
+        old = [old[i] for i in keep]
+    if max_trees is not None:
+        old = old[max(0, len(old) + len(new) - max_trees):]
+    model.estimators_ = old + new
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_), n_jobs=saved_n_jobs)
+    dropped = n_old - len(old)
+    print(f"Update fitted in {fit_seconds:.2f}s: {len(model.estimators_)} trees ({dropped} old trees dropped)")
+
+    # --- 4. Evaluate on all races ---
+    df_all = pd.concat(list(data.values()))
+    X, y = df_all[features], df_all[target]
+    y_pred = model.predict(X)
+    r2, mae = r2_score(y, y_pred), mean_absolute_error(y, y_pred)
+    print(f"Results on all races (R2): {r2:.4f}, (MAE): {mae:.4f} seconds")
+
+    # --- 5. Save and register with lineage ---
+    joblib.dump(model, model_filename)
+    print(f"Success! Model saved to {model_filename}")
+    lineage = lineage + [{
+        'action': 'update', 'created_utc': utc_now(), 'races': list(new_races), 'rows': len(X_new),
+        'trees_added': n_new_trees, 'trees_dropped': dropped, 'n_trees': len(model.estimators_),
+        'old_weight': old_weight, 'max_trees': max_trees, 'fit_seconds': round(fit_seconds, 3),
+        'pre_update_mae': float(pre_update_mae), 'parent_created_utc': previous.get('created_utc'),
+    }]
+    metrics = {'r2': r2, 'mae': mae, 'pre_update_mae': pre_update_mae}
+    register_model(track_name, model, X, metrics=metrics, inputs=[race_path(track_name, race) for race in data],
+                   model_path=model_filename, lineage=lineage)
+
+    # --- 6. Precompute Degradation Surface (optional) ---
+    if build_surface:
+        print("Building degradation lookup surface...")
+        build_and_save_surface(model, X, track_name)
+    else:
+        print("Lookup surface is now stale: the app rebuilds it (in chunks) on first use, or rerun with --surface.")
+    return model_filename
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a track's model, or update it with new races.")
+    parser.add_argument('--track', default=TRACK_NAME)
+    parser.add_argument('--update', nargs='+', metavar='RACE', help="Add trees trained on these races (e.g. R3) to the saved model")
+    parser.add_argument('--new-trees', type=int, default=UPDATE_TREES)
+    parser.add_argument('--old-weight', type=float, default=1.0, help="Fraction of the existing trees to keep (0-1]")
+    parser.add_argument('--max-trees', type=int, help="Drop the oldest trees beyond this many")
+    parser.add_argument('--surface', action='store_true', help="Also rebuild the lookup surface after an update")
+    parser.add_argument('--search', action='store_true', help="Search tree count, depth and leaf size for the smallest accurate model")
+    parser.add_argument('--latency-budget-us', type=float, help="Max single-row predict latency (implies --search)")
+    parser.add_argument('--size-budget-mb', type=float, help="Max pickled model size (implies --search)")
+    parser.add_argument('--tolerance', type=float, default=ACCURACY_TOLERANCE, help="Allowed relative held-out MAE loss vs the full model")
+    args = parser.parse_args()
+
+    if args.update:
+        update_track(args.track, args.update, args.new_trees, args.old_weight, args.max_trees, build_surface=args.surface)
+    else:
+        train_track(args.track, search=args.search, latency_budget_us=args.latency_budget_us,
+                    size_budget_mb=args.size_budget_mb, tolerance=args.tolerance)
+
+if __name__ == '__main__':
+    main()